@@ -0,0 +1,97 @@
+import mmap
+import os
+import socket
+import struct
+from array import array
+from typing import Iterator
+
+HEADER = struct.Struct('!I')  # length prefix of every record
+CHUNK = 1 << 20  # bytes the file grows by when the map is full
+
+# Append-only log of the delivered messages, memory-mapped.
+# Records are length-prefixed and appended in delivery order, so record i is the i-th message delivered in the
+# group and every peer's log holds the same records. The file grows in CHUNK steps and is zero past the last
+# record; opening it scans the records once to rebuild the offset index (one 8-byte offset per record), after
+# which any range is a single contiguous slice of the file. That is what makes catch-up cheap: a rejoining peer
+# asks for the records from its own count on and gets them as one sendfile of that slice.
+class DeliveryLog:
+    def __init__(self, path: str, truncate: bool = False):
+        self.file = open(path, "w+b" if truncate or not os.path.exists(path) else "r+b")
+        if os.fstat(self.file.fileno()).st_size == 0:
+            os.ftruncate(self.file.fileno(), CHUNK)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        self.index = array('Q')  # offset of every record
+        self.end = 0  # offset past the last record
+        self._scan()
+        # whatever follows is the zero padding or a record cut short by a crash; zeroed, so that the leftover of the
+        # cut record cannot be read as a record once shorter ones were appended in its place
+        self.map[self.end:] = bytes(len(self.map) - self.end)
+
+    @property
+    def count(self) -> int:
+        return len(self.index)
+
+    # Indexes the complete records from self.end on; stops at the zero padding or a record cut short by a crash.
+    def _scan(self):
+        size = len(self.map)
+        while self.end + HEADER.size <= size:
+            (length,) = HEADER.unpack_from(self.map, self.end)
+            if length == 0 or self.end + HEADER.size + length > size:
+                break
+            self.index.append(self.end)
+            self.end += HEADER.size + length
+
+    def _reserve(self, size: int):
+        if self.end + size > len(self.map):
+            grown = (self.end + size + CHUNK - 1) // CHUNK * CHUNK
+            os.ftruncate(self.file.fileno(), grown)
+            self.map.resize(grown)
+
+    def append(self, record: bytes):
+        self._reserve(HEADER.size + len(record))
+        # the length goes in last, a record cut short by a crash still reads as the end of the log
+        self.map[self.end + HEADER.size:self.end + HEADER.size + len(record)] = record
+        HEADER.pack_into(self.map, self.end, len(record))
+        self.index.append(self.end)
+        self.end += HEADER.size + len(record)
+
+    # Offset of record i, the end of the log for i == count.
+    def offset(self, i: int) -> int:
+        return self.index[i] if i < self.count else self.end
+
+    # The records from start to end (exclusive), as views into the map.
+    def records(self, start: int, end: int) -> Iterator[memoryview]:
+        view = memoryview(self.map)
+        try:
+            for i in range(start, min(end, self.count)):
+                (length,) = HEADER.unpack_from(self.map, self.index[i])
+                yield view[self.index[i] + HEADER.size:self.index[i] + HEADER.size + length]
+        finally:
+            view.release()
+
+    # Sends the records from start to end over sock in one sendfile.
+    def send_range(self, sock: socket.socket, start: int, end: int) -> int:
+        first, last = self.offset(start), self.offset(end)
+        if last > first:
+            sock.sendfile(self.file, first, last - first)
+        return last - first
+
+    # Receives size bytes of records (as sent by send_range) straight into the map and indexes them.
+    def receive_range(self, sock: socket.socket, size: int):
+        self._reserve(size)
+        received = 0
+        with memoryview(self.map) as view:
+            while received < size:
+                n = sock.recv_into(view[self.end + received:self.end + size])
+                if n == 0:
+                    raise ConnectionError("connection closed during catch-up")
+                received += n
+        self._scan()
+
+    def flush(self):
+        self.map.flush()
+
+    def close(self):
+        self.map.flush()
+        self.map.close()
+        self.file.close()
@@ -0,0 +1,50 @@
+import threading
+from typing import Iterable
+
+# Credit-based flow control for the multicast.
+# Every receiver holds back at most limit undelivered words, split evenly into a window of limit / P words for each
+# of the P senders. A sender counts the words it multicast and every receiver reports how many of them it has
+# delivered; the sender waits while some receiver would get more than a window of its words outstanding. Words in
+# flight and words held back by a slow or silent receiver therefore stay bounded, and a sender that runs out of
+# credit stops taking words from its outbox, which in turn blocks the producer.
+class CreditWindow:
+    def __init__(self, peers: Iterable[str], limit: int):
+        self.delivered = {peer: 0 for peer in peers}  # words of this peer each receiver reported delivered
+        self.window = max(1, limit // max(1, len(self.delivered)))
+        self.sent = 0
+        self.condition = threading.Condition()
+
+    def outstanding(self) -> int:
+        with self.condition:
+            return self.sent - min(self.delivered.values(), default=self.sent)
+
+    # Waits up to timeout seconds until count more words fit every receiver's window (a message larger than the
+    # window goes out once nothing is outstanding). Returns whether they fit.
+    def wait(self, count: int, timeout: float) -> bool:
+        def fits():
+            outstanding = self.sent - min(self.delivered.values(), default=self.sent)
+            return outstanding + count <= self.window or outstanding == 0
+        with self.condition:
+            return self.condition.wait_for(fits, timeout)
+
+    def consume(self, count: int):
+        with self.condition:
+            self.sent += count
+
+    # A receiver reported it delivered delivered words of this peer.
+    def update(self, peer: str, delivered: int):
+        with self.condition:
+            if peer in self.delivered and delivered > self.delivered[peer]:
+                self.delivered[peer] = delivered
+                self.condition.notify_all()
+
+    # A peer that rejoined starts with a full window.
+    def add_peer(self, peer: str):
+        with self.condition:
+            self.delivered.setdefault(peer, self.sent)
+
+    # A peer that left no longer holds back the sender.
+    def remove_peer(self, peer: str):
+        with self.condition:
+            self.delivered.pop(peer, None)
+            self.condition.notify_all()
@@ -0,0 +1,343 @@
+import heapq
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+Delivery = Tuple[int, str, object]  # (clock, sender, payload)
+
+# Lamport-clock delivery engine for totally ordered multicast.
+# Keeps the highest clock received from every peer (data messages and acks alike) and a heap of pending data
+# messages ordered by (clock, sender). The head is delivered as soon as every other peer has sent something with
+# a higher clock: channels are FIFO, so nothing ordered before the head can still arrive. Acks never enter the
+# heap. A batch of n words takes n consecutive clocks and is ordered as one unit by its first clock, so it is
+# delivered atomically once every other peer has passed that clock. A receive costs O(log n) for the heap plus O(P) to check the head against the P peers.
+# A peer that rejoins is taken back from the first clock it announced on (see add_peer). The rejoining peer itself
+# is paused while it catches up, then resumes after the last message of its delivery log (see resume).
+class LamportEngine:
+    def __init__(self, peers: Iterable[str]):
+        self.latest = {peer: 0 for peer in peers}  # highest clock received from each peer
+        self.heap: List[Tuple[int, str, object]] = []
+        self.clock = 0
+        self.paused = False  # nothing is delivered while a rejoining peer catches up
+        self.floor: Optional[Tuple[int, str]] = None  # (clock, sender) of the last message caught up on
+        self.lock = threading.Lock()
+
+    # Stamps a message sent by this peer that spans count clocks, returns the first one.
+    def tick(self, count: int = 1) -> int:
+        with self.lock:
+            self.clock += count
+            return self.clock - count + 1
+
+    # Records a message from sender stamped with clock and spanning span clocks; payload is None for an ack.
+    # Returns the messages that became deliverable, in delivery order.
+    def receive(self, sender: str, clock: int, payload: object = None, span: int = 1) -> List[Delivery]:
+        last = clock + span - 1
+        with self.lock:
+            self.clock = max(self.clock, last) + 1
+            if sender in self.latest and last > self.latest[sender]:
+                self.latest[sender] = last
+            if payload is not None and (self.floor is None or (clock, sender) > self.floor):
+                heapq.heappush(self.heap, (clock, sender, payload))
+            return self._deliverable()
+
+    # A peer that left no longer holds back delivery.
+    def remove_peer(self, peer: str) -> List[Delivery]:
+        with self.lock:
+            self.latest.pop(peer, None)
+            return self._deliverable()
+
+    # A peer that rejoined stamps its messages from first on, so it holds back delivery from that clock on. It only
+    # sends once every live peer took it back, so no message ordered before one of its own is delivered without it.
+    def add_peer(self, peer: str, first: int):
+        with self.lock:
+            self.latest[peer] = max(self.latest.get(peer, 0), first - 1)
+
+    # Whether every message stamped up to clock was delivered here: every peer passed it and none is held back.
+    def delivered_through(self, clock: int) -> bool:
+        with self.lock:
+            return all(latest > clock for latest in self.latest.values()) and not (self.heap and self.heap[0][0] <= clock)
+
+    def pause(self):
+        with self.lock:
+            self.paused = True
+
+    # Continues after a catch-up whose last message was floor, (clock, sender), or None for an empty log: the
+    # messages up to it were delivered from the log, so their live copies are dropped, and this peer's clock
+    # continues above it.
+    def resume(self, floor: Optional[Tuple[int, str]]) -> List[Delivery]:
+        with self.lock:
+            self.paused = False
+            if floor is not None:
+                self.floor = floor
+                self.clock = max(self.clock, floor[0])
+                self.heap = [item for item in self.heap if item[:2] > floor]
+                heapq.heapify(self.heap)
+            return self._deliverable()
+
+    def _deliverable(self) -> List[Delivery]:
+        delivered = []
+        while self.heap and not self.paused:
+            clock, sender, _ = self.heap[0]
+            if any(latest <= clock for peer, latest in self.latest.items() if peer != sender):
+                break
+            delivered.append(heapq.heappop(self.heap))
+        return delivered
+
+    def pending(self) -> int:
+        with self.lock:
+            return len(self.heap)
+
+    # Words received and not delivered yet.
+    def held_words(self) -> int:
+        with self.lock:
+            return sum(len(payload) for _, _, payload in self.heap)
+
+
+Key = Tuple[str, int]  # (sender, id of the first word of the message)
+HISTORY = 10000  # delivered messages a peer keeps to repair the gaps of other peers
+REPAIR_MAX = 256  # messages in one repair
+
+
+# Two peers numbered the same message differently, or different messages with the same number.
+class OrderConflict(ValueError):
+    pass
+
+
+# Sequencer delivery engine for totally ordered multicast, used like LamportEngine.
+# Every peer multicasts its words stamped with its own word ids. The peer holding the sequencer token assigns
+# consecutive global sequence numbers to the words it received and multicasts the assignments; every peer delivers
+# in sequence order once it has both the assignment and the words. A message costs its own multicast plus a share
+# of one multicast of assignments, and delivery waits for the sequencer alone instead of every peer.
+# With block 0 the first peer in address order is a fixed sequencer; otherwise the holder multicasts the token to
+# the next peer after assigning block sequence numbers. Tokens from different peers travel on different
+# connections, so a token only counts if it is newer (starts at a higher sequence number) than the last one seen,
+# and a new holder only assigns once it knows every sequence number below its first one: otherwise it could
+# number again a message whose assignment is still on the way. A failed holder is replaced by the next peer in the
+# rotation, which first asks every live peer for the assignments it knows (a sync, answered by a repair with the
+# peer's next sequence number) and only assigns after the highest of them. A gap (an assignment or words that never
+# arrived) is repaired from another peer, which is why delivered messages are kept in a bounded history.
+class SequencerEngine:
+    def __init__(self, peers: Iterable[str], me: str, block: int = 0, history: int = HISTORY):
+        self.me = me
+        self.members = sorted(peers)  # every peer, in rotation order
+        self.rotation = list(self.members)  # the peers still alive
+        self.block = block
+        self.holder = self.rotation[0]  # peer holding the sequencer token
+        self.next_seq = 1  # next sequence number to assign
+        self.assigned_in_block = 0
+        self.token_seq = 0  # first sequence number of the newest token seen
+        self.delivered = 0  # highest sequence number delivered
+        self.assigned: Dict[int, Key] = {}  # sequence numbers not delivered yet
+        self.sequence_of: Dict[Key, int] = {}  # sequence number of every recent message
+        self.data: Dict[Key, object] = {}  # words received and not delivered yet
+        self.unordered: Dict[Key, None] = {}  # words received without a sequence number, in arrival order
+        self.log: Dict[int, Tuple[str, int, object]] = {}  # delivered messages by sequence number
+        self.history = history
+        self.order_source = None  # peer the latest assignment came from, asked first for repairs
+        self.syncing: Set[str] = set()  # peers whose assignments this peer waits for before assigning as new holder
+        self.clock = 0  # ids of this peer's words, stamped like Lamport clocks
+        self.lock = threading.Lock()
+
+    # Reserves ids for a message of count words sent by this peer, returns the first one.
+    def tick(self, count: int = 1) -> int:
+        with self.lock:
+            self.clock += count
+            return self.clock - count + 1
+
+    # Records the words of a message from sender whose first word has id clock; acks carry no payload and are
+    # not used. Returns the messages that became deliverable, in delivery order.
+    def receive(self, sender: str, clock: int, payload: object = None, span: int = 1) -> List[Delivery]:
+        key = (sender, clock)
+        with self.lock:
+            if payload is None or self.sequence_of.get(key, self.delivered + 1) <= self.delivered:
+                return []
+            self.data[key] = payload
+            if key not in self.sequence_of:
+                self.unordered[key] = None
+            return self._deliverable()
+
+    # Assigns sequence numbers to the unordered messages when this peer holds the token. Returns None or
+    # (first sequence number, keys, token) where token is (next holder, next sequence number) when the block is
+    # used up and the token must be passed on.
+    def assign(self) -> Optional[Tuple[int, List[Key], Optional[Tuple[str, int]]]]:
+        with self.lock:
+            if self.holder != self.me or not self.unordered or self.syncing:
+                return None
+            if len(self.assigned) < self.next_seq - 1 - self.delivered:
+                return None  # earlier assignments are still missing
+            keys = list(self.unordered)
+            if self.block:
+                keys = keys[:self.block - self.assigned_in_block]
+            first = self.next_seq
+            self._record(first, keys)
+            self.assigned_in_block += len(keys)
+            token = None
+            if self.block and self.assigned_in_block >= self.block and len(self.rotation) > 1:
+                self.holder = self._successor(self.me)
+                token = (self.holder, self.next_seq)
+                self.token_seq = self.next_seq
+            return first, keys, token
+
+    def add_order(self, sender: str, first: int, keys: List[Key]) -> List[Delivery]:
+        with self.lock:
+            self.order_source = sender
+            self._record(first, keys)
+            return self._deliverable()
+
+    def take_token(self, holder: str, next_seq: int):
+        with self.lock:
+            if next_seq <= self.token_seq:
+                return  # overtaken by a newer token
+            self.token_seq = next_seq
+            self.next_seq = max(self.next_seq, next_seq)
+            self.assigned_in_block = 0
+            if holder in self.rotation:
+                self.holder = holder
+            else:
+                self._take_over(self._successor(holder))
+
+    # The holder failed and peer takes its place; if that is this peer, it syncs with the others first.
+    def _take_over(self, peer: str):
+        self.holder = peer
+        self.next_seq = max([self.next_seq, self.delivered + 1, *(seq + 1 for seq in self.assigned)])
+        self.assigned_in_block = 0
+        if peer == self.me:
+            self.syncing = set(self.rotation) - {self.me}
+
+    # Peers to ask for their assignments before this peer assigns as the new holder, and the first sequence
+    # number to ask for.
+    def sync_requests(self) -> Tuple[int, List[str]]:
+        with self.lock:
+            return self.delivered + 1, sorted(self.syncing)
+
+    # Next peer after peer in rotation order that is still alive.
+    def _successor(self, peer: str) -> str:
+        index = self.members.index(peer)
+        for step in range(1, len(self.members) + 1):
+            candidate = self.members[(index + step) % len(self.members)]
+            if candidate in self.rotation:
+                return candidate
+        return self.me
+
+    # Records the assignment of consecutive sequence numbers to keys from first on. One already known is ignored,
+    # one that contradicts what is known raises OrderConflict and nothing is recorded.
+    def _record(self, first: int, keys: List[Key]):
+        for seq, key in enumerate(keys, first):
+            known = self.assigned.get(seq) or (self.log[seq][:2] if seq in self.log else None)
+            if known is not None and known != key:
+                raise OrderConflict(f"sequence number {seq} is {known}, not {key}")
+            if self.sequence_of.get(key, seq) != seq:
+                raise OrderConflict(f"{key} has sequence number {self.sequence_of[key]}, not {seq}")
+        for seq, key in enumerate(keys, first):
+            if seq > self.delivered and seq not in self.assigned:
+                self.assigned[seq] = key
+                self.sequence_of[key] = seq
+                self.unordered.pop(key, None)
+        self.next_seq = max(self.next_seq, first + len(keys))
+
+    def _deliverable(self) -> List[Delivery]:
+        delivered = []
+        while self.delivered + 1 in self.assigned and self.assigned[self.delivered + 1] in self.data:
+            self.delivered += 1
+            sender, clock = key = self.assigned.pop(self.delivered)
+            payload = self.data.pop(key)
+            self.log[self.delivered] = (sender, clock, payload)
+            old = self.log.pop(self.delivered - self.history, None)
+            if old is not None:
+                self.sequence_of.pop(old[:2], None)
+            delivered.append((clock, sender, payload))
+        return delivered
+
+    # First undelivered sequence number when delivery is stuck on a gap, or None.
+    def missing(self) -> Optional[int]:
+        with self.lock:
+            if self.assigned or self.next_seq > self.delivered + 1 or (self.unordered and self.holder != self.me):
+                return self.delivered + 1
+            return None
+
+    # Peer to ask for the messages of a gap.
+    def repair_source(self) -> Optional[str]:
+        with self.lock:
+            for peer in (self.order_source, self.holder, *self.rotation):
+                if peer is not None and peer != self.me and peer in self.rotation:
+                    return peer
+            return None
+
+    # The next sequence number this peer knows of and the messages it knows from sequence number first on, as
+    # (seq, sender, clock, payload); the payload of an assignment whose words did not arrive here is empty.
+    def repair(self, first: int) -> Tuple[int, List[Tuple[int, str, int, object]]]:
+        with self.lock:
+            entries = []
+            for seq in range(first, first + REPAIR_MAX):
+                if seq in self.log:
+                    entries.append((seq, *self.log[seq]))
+                elif seq in self.assigned:
+                    entries.append((seq, *self.assigned[seq], self.data.get(self.assigned[seq], [])))
+            return self.next_seq, entries
+
+    # Adds what a repair from sender brought; sync tells it answered this peer's sync as new holder. A repair that
+    # brings nothing new means the words still unordered here from failed senders were never ordered: the holder
+    # did not get them before their sender failed, and as nobody will send them again they are dropped instead of
+    # being asked for forever.
+    def add_repair(self, sender: str, next_seq: int, entries: List[Tuple[int, str, int, object]],
+                   sync: bool = False) -> List[Delivery]:
+        with self.lock:
+            if sync:
+                self.syncing.discard(sender)
+            elif not entries and next_seq <= self.delivered + 1:
+                for key in [key for key in self.unordered if key[0] not in self.rotation]:
+                    del self.unordered[key]
+                    del self.data[key]
+            for seq, sender_, clock, payload in entries:
+                self._record(seq, [(sender_, clock)])
+                if seq > self.delivered and payload:
+                    self.data[(sender_, clock)] = payload
+            self.next_seq = max(self.next_seq, next_seq)
+            return self._deliverable()
+
+    # A peer that left is taken out of the rotation; if it held the token (or a peer that did not notice yet
+    # passed the token to it), the next live peer takes over and continues after the highest sequence number
+    # any live peer knows (see sync_requests).
+    def remove_peer(self, peer: str) -> List[Delivery]:
+        with self.lock:
+            self.syncing.discard(peer)
+            if peer in self.rotation and len(self.rotation) > 1:
+                self.rotation.remove(peer)
+                if self.holder == peer:
+                    self._take_over(self._successor(peer))
+            return self._deliverable()
+
+    # A peer that left and came back takes its place in the rotation again; its first clock does not matter here.
+    def add_peer(self, peer: str, first: int = 0):
+        with self.lock:
+            if peer in self.members and peer not in self.rotation:
+                self.rotation = [member for member in self.members if member in self.rotation or member == peer]
+
+    # Sequencer state a rejoining peer needs: (holder, first sequence number of the newest token, next sequence
+    # number).
+    def position(self) -> Tuple[Optional[str], int, int]:
+        with self.lock:
+            return self.holder, self.token_seq, self.next_seq
+
+    # Continues after a catch-up: the first delivered messages are already in the delivery log, the latest of them
+    # are given as (seq, sender, clock, payload) so duplicates are recognized and repairs can be answered.
+    def restore(self, delivered: int, history: List[Tuple[int, str, int, object]], holder: Optional[str],
+                token_seq: int, next_seq: int):
+        with self.lock:
+            self.delivered = delivered
+            for seq, sender, clock, payload in history[-self.history:]:
+                self.log[seq] = (sender, clock, payload)
+                self.sequence_of[(sender, clock)] = seq
+                if sender == self.me:
+                    self.clock = max(self.clock, clock + len(payload) - 1)
+            self.holder = holder
+            self.token_seq = token_seq
+            self.next_seq = max(next_seq, delivered + 1)
+
+    def pending(self) -> int:
+        with self.lock:
+            return len(self.assigned) + len(self.unordered)
+
+    # Words received and not delivered yet; duplicates of delivered words are not kept, so they do not count.
+    def held_words(self) -> int:
+        with self.lock:
+            return sum(len(payload) for payload in self.data.values())
@@ -3,28 +3,249 @@ import logging
 import threading
 import random 
 import math 
-import heapq
-import pickle
 import time 
 import signal
+import argparse
+import queue
+import resource
+from collections import deque
+from typing import Optional
+from common import DEFAULT_PORT, Metrics, peer_address, peer_id
+import wire
+from delivery_log import DeliveryLog
+from flow import CreditWindow
+from ordering import HISTORY, LamportEngine, OrderConflict, SequencerEngine
 
 portuguese_cities = ["Lisboa", "Porto", "Coimbra", "Braga", "Aveiro", "Faro", "Serra da Estrela", "Guimarães", "Viseu", "Leiria", "Vale de Cambra", "Sintra", "Viana do Castelo", "Tondela", "Guarda", "Caldas da Rainha", "Covilhã", "Bragança", "Óbidos", "Vinhais", "Mirandela", "Freixo de Espada à Cinta", "Peniche"]   
     
+WAKE = 'wake'  # outbox marker that makes the sender loop recompute when the pending ack is due
+BACKOFF_START = 0.1  # seconds before the first reconnect attempt, doubled after every failure
+BACKOFF_MAX = 3.0
+CREDIT_INTERVAL = 0.1  # seconds between reports of the words delivered from each sender
+STATS_INTERVAL = 1.0  # seconds between holdback metrics events
+NACK_INTERVAL = 0.2  # seconds delivery must be stuck on the same gap twice in a row before it is repaired
+TAKEOVER_WAIT = 2.0  # seconds a new connection of a link waits for the old one to be read to the end
+CATCH_UP_TIMEOUT = 30.0  # seconds a catch-up may take, including the wait for the live peer to deliver enough
+# A rejoining peer stamps its words from its start time in seconds shifted left by INCARNATION_BITS on, above every
+# id an earlier run of the peer can have used unless it sent 2**24 words per second
+INCARNATION_BITS = 24
+
+# Persistent connection to one peer with its own outbound queue and sender thread.
+# Messages leave in queue order over a single connection, so every peer receives them in the order they were
+# stamped (the FIFO channel the Lamport delivery rule relies on). A failed connect or send is retried on a new
+# connection with exponential backoff, which only delays this peer's queue; after max_attempts failures in a row
+# the peer is given up and on_failure is called. Every connection starts with a hello that numbers the frames
+# sent on it, so the receiver keeps the order across reconnects and drops a frame that is sent again (InboundLink).
+class PeerLink:
+    def __init__(self, sender: str, peer: str, logger: logging.Logger, max_attempts: int = 10, on_connected=None,
+                 on_failure=None):
+        self.sender = sender
+        self.peer = peer
+        self.link = random.getrandbits(64)  # tells the receiver a new link (e.g. after a restart) from a reconnect
+        self.sent = 0  # frames sent, the number of the next one
+        self.logger = logger
+        self.max_attempts = max_attempts
+        self.on_connected = on_connected
+        self.on_failure = on_failure
+        self.queue = queue.Queue()
+        self.sock = None
+        self.sending = False  # a message was taken from the queue and is not sent yet
+        self.closed = threading.Event()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    # Queues an encoded frame (see wire.frame).
+    def send(self, frame: bytes):
+        if not self.closed.is_set():
+            self.queue.put(frame)
+
+    # Waits until the queue is empty (or timeout seconds passed), used before shutting down.
+    def flush(self, timeout: float):
+        deadline = time.monotonic() + timeout
+        while (not self.queue.empty() or self.sending) and not self.closed.is_set() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def close(self):
+        self.closed.set()
+        self.queue.put(None)
+
+    def _disconnect(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def _run(self):
+        while not self.closed.is_set():
+            message = self.queue.get()
+            if message is None:
+                break
+            self.sending = True
+            attempts = 0
+            backoff = BACKOFF_START
+            while not self.closed.is_set():
+                try:
+                    if self.sock is None:
+                        self.sock = socket.create_connection(peer_address(self.peer), timeout=5)
+                        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                        self.sock.sendall(wire.frame(wire.TomHello(self.sender, self.link, self.sent)))
+                    self.sock.sendall(message)
+                    self.sent += 1
+                    if self.on_connected:
+                        self.on_connected(self.peer)
+                    break
+                except OSError as e:
+                    self._disconnect()
+                    attempts += 1
+                    print(f"Attempts {attempts} failed for {self.peer}: {e}")
+                    if attempts > self.max_attempts:
+                        self.logger.warning(f"Giving up on {self.peer} after {attempts} attempts")
+                        self.closed.set()
+                        if self.on_failure:
+                            self.on_failure(self.peer)
+                        break
+                    self.closed.wait(backoff)
+                    backoff = min(backoff * 2, BACKOFF_MAX)
+            self.sending = False
+        self._disconnect()
+
+# Receiving end of the links of one peer. Frames are numbered from the hello of their connection on, and only the
+# connection attached last is read: a new one waits until the previous one was read up to its first frame (or
+# TAKEOVER_WAIT passed), and frames numbered below the next expected one were handled already and are dropped.
+class InboundLink:
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.link = None  # the sender's link whose frames are read
+        self.next = 0  # number of the next frame to handle
+        self.reader = None  # the connection frames are handled from, None between connections
+
+    def attach(self, conn: socket.socket, link: int, first: int):
+        with self.cond:
+            if link == self.link:
+                self.cond.wait_for(lambda: self.reader is None or self.next >= first, timeout=TAKEOVER_WAIT)
+                self.next = max(self.next, first)  # frames left unread on the old connection are lost
+            else:
+                self.cond.wait_for(lambda: self.reader is None, timeout=TAKEOVER_WAIT)
+                self.link, self.next = link, first
+            self.reader = conn
+
+    # Handles frame number of conn unless it was handled already; False once another connection took over.
+    def deliver(self, conn: socket.socket, number: int, node: "PeerNode", msg) -> bool:
+        with self.cond:
+            if self.reader is not conn:
+                return False
+            if number >= self.next:
+                handle_message(node, msg)
+                self.next = number + 1
+                self.cond.notify_all()
+            return True
+
+    def detach(self, conn: socket.socket):
+        with self.cond:
+            if self.reader is conn:
+                self.reader = None
+                self.cond.notify_all()
+
 class PeerNode:
-    def __init__(self, hostname: str, peers: set[int], port:int = 50000):
+    def __init__(self, hostname: str, peers: set[str], port:int = DEFAULT_PORT, metrics: Optional[Metrics] = None,
+                 ack_delay: float = 0.2, batch_window: float = 0.02, batch_max: int = 64, rate: float = 1,
+                 ordering: str = 'lamport', sequencer_block: int = 64, holdback_limit: int = 4096,
+                 outbox_limit: int = 1024, rejoin: bool = False):
         self.hostname = hostname
         self.port = port
+        self.id = f"{hostname}:{port}"
         self.peers = peers
-        self.priority_queue: heapq = [] # heap that acc words and acks
-        self.clock: int = 0
+        self.members = frozenset(peers)  # every peer of the group, failed ones included
+        self.metrics = metrics or Metrics()
+        # lamport: words are delivered once every peer sent something later (acks included); sequencer: a fixed
+        # peer numbers the words; rotating: the sequencer token moves on every sequencer_block numbers
+        self.ordering = ordering
+        if ordering == 'lamport':
+            self.engine = LamportEngine(peers)  # lamport clock and the words waiting for delivery
+        else:
+            self.engine = SequencerEngine(peers, self.id, sequencer_block if ordering == 'rotating' else 0)
+        # A rejoining peer announces the first clock it stamps with; the others take it back from there on and
+        # welcome it with their own clock (see peer_rejoined). With Lamport ordering it sends nothing and delivers
+        # nothing until every live peer did and it caught up (see rejoin_lamport).
+        self.first_clock = 0
+        if rejoin:
+            self.engine.clock = int(time.time()) << INCARNATION_BITS
+            self.first_clock = self.engine.clock + 1
+        self.rejoining = rejoin and ordering == 'lamport'
+        if self.rejoining:
+            self.engine.pause()
+        self.welcomes: dict = {}  # per peer that took this one back, its clock at that moment
+        self.incarnations: dict = {}  # per rejoined peer, the first clock it announced
+        self.rate = rate  # words submitted per second by the poisson client
+        # (word, submit time) to multicast, stamped when they are sent; a full outbox blocks the producer
+        self.outbox = queue.Queue(maxsize=outbox_limit)
+        # Every receiver holds back at most holdback_limit undelivered words: senders only multicast while they
+        # have credit, i.e. while each receiver has delivered enough of their words (see flow.py).
+        self.credit = CreditWindow(peers, holdback_limit)
+        self.delivered_from = {peer: 0 for peer in peers}  # words delivered from each sender
+        # Words submitted within batch_window seconds of each other (at most batch_max) go out as one multicast
+        # taking consecutive clocks. The window adapts: it halves whenever a batch ends up with a single word
+        # and doubles when it collected more, so light load is sent right away.
+        self.batch_max = min(batch_max, self.credit.window)
+        self.max_window = batch_window
+        self.window = batch_window
+        # Acks are cumulative: any message stamped after a word was received acknowledges it (and everything
+        # received before it). A word sent in the meantime carries the ack; otherwise an explicit ack goes out
+        # once ack_delay seconds passed without one.
+        self.ack_delay = ack_delay
+        self.ack_due = None  # monotonic time the pending ack must be sent by, None when nothing is unacknowledged
+        self.ack_lock = threading.Lock()
+        # held from stamping a message to queueing it on every link, so a peer taken back gets every message
+        # stamped after its welcome; taken before the delivery lock
+        self.send_lock = threading.Lock()
+        # connections are read by parallel threads, ordering and printing happen together so deliveries keep
+        # the engine's order
+        self.delivery_lock = threading.Lock()
         self.logger = self._setup_logger()
+        # every delivered message in delivery order; a peer started afresh starts a new log, a rejoining one
+        # keeps its log and catches up on what it missed (see catch_up)
+        self.log = DeliveryLog(f"{hostname}_{port}_delivery.log", truncate=not rejoin)
         self.connected_peers: set = set()
         self.shutdown_flag = threading.Event()  # Flag for clean shutdown
+        self.links = {peer: PeerLink(self.id, peer, self.logger, on_connected=self.connected_peers.add,
+                                     on_failure=self.peer_failed) for peer in peers}
+        self.inbound: dict = {}  # per sender, its InboundLink
+
+    # Queues a message for every peer, encoded once; each link sends in parallel with the others.
+    def broadcast(self, message):
+        frame = wire.frame(message)
+        for link in list(self.links.values()):
+            link.send(frame)
+
+    # A peer that cannot be reached is left out of the ordering from now on.
+    def peer_failed(self, peer: str):
+        self.links.pop(peer, None)
+        self.connected_peers.discard(peer)
+        self.peers.discard(peer)
+        self.credit.remove_peer(peer)
+        with self.delivery_lock:
+            print_message(self.engine.remove_peer(peer))
+            if self.ordering != 'lamport':
+                request_sync(self)
+                sequence(self)
+
+    # A peer that restarted with --rejoin is sent to and ordered with again from the first clock it announced on,
+    # and welcomed with this peer's clock: every message stamped here up to it went out without the peer.
+    def peer_rejoined(self, peer: str, first: int):
+        with self.send_lock, self.delivery_lock:
+            self.incarnations[peer] = first
+            self.peers.add(peer)
+            self.credit.add_peer(peer)
+            self.engine.add_peer(peer, first)
+            link = self.links.get(peer)
+            if link is None:
+                link = self.links[peer] = PeerLink(self.id, peer, self.logger, on_connected=self.connected_peers.add,
+                                                   on_failure=self.peer_failed)
+            link.send(wire.frame(wire.TomWelcome(self.id, self.engine.clock)))
+        self.logger.info(f"{peer} rejoined")
 
     def _setup_logger(self):
         logger = logging.getLogger(f"{self.hostname}_log")
         logger.setLevel(logging.INFO)
-        handler = logging.FileHandler(f"{self.hostname}_peer.log", mode="a")
+        handler = logging.FileHandler(f"{self.hostname}_{self.port}_peer.log", mode="a")
         formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
         handler.setFormatter(formatter)
         logger.addHandler(handler)
@@ -40,6 +261,7 @@ signal.signal(signal.SIGINT, signal_handler)
 def poisson_delay(lambda_:int):
     return -math.log(1.0 - random.random()) / lambda_
 
+# Accepts the peers' persistent connections, each one is read by its own thread.
 def server_run(node: PeerNode):
     server = socket.socket(socket.AF_INET, socket.SOCK_STREAM) 
     server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)  # Enable port reuse
@@ -52,131 +274,392 @@ def server_run(node: PeerNode):
         while not node.shutdown_flag.is_set():
             try:
                 client_socket, addr = server.accept()
-                threading.Thread(target=handle_connection, args=(client_socket, node, addr[0])).start()
-            except socket.error as e:
-                node.logger.error(f"Error accepting connection: {e}")
+                threading.Thread(target=handle_connection, args=(client_socket, node, addr[0]), daemon=True).start()
             except socket.timeout:
                 continue  # Check for shutdown_event after timeout
+            except socket.error as e:
+                node.logger.error(f"Error accepting connection: {e}")
     finally:
         node.connected_peers.clear()
+        node.log.flush()
         print('Server is closed')
         server.close()
         node.logger.info("Server socket closed.")
         
 
+# Reads the messages of one peer's connection in the order they were sent until the peer closes it or opens a
+# newer connection. Frames are received into one reusable buffer and decoded from there.
 def handle_connection(client: socket.socket, node: PeerNode, client_address):
+    inbound = None  # the sender's InboundLink, once the hello arrived
+    number = 0  # of the next frame
     try:
-        msg = client.recv(1024)
-
-        received_data = pickle.loads(msg)
-
-        ip_peer, word, receiv_clock = received_data
-
-        if word == 'shutdown':
-            node.connected_peers.clear()
-            node.shutdown_flag.set()
-            client.close()
-            return 
-            
-        if word == 'ready':
-            node.connected_peers.add(ip_peer)
-            return  
-            
-        node.clock = max(node.clock, receiv_clock) + 1
-        if word != 'ack':
-            ack = pickle.dumps((node.hostname, 'ack', node.clock))
-            sending_message(ack)
-
-        heapq.heappush(node.priority_queue, (receiv_clock, (ip_peer, word)))
-        print_message()
+        client.settimeout(1)
+        reader = wire.FrameReader(client)
+        while not node.shutdown_flag.is_set():
+            try:
+                msg = reader.read()
+            except socket.timeout:
+                continue
+            except ConnectionError:
+                break
+            if msg is None:
+                break
+            if isinstance(msg, wire.TomCatchup):
+                serve_catch_up(node, client, msg.start, msg.until)
+                break
+            if isinstance(msg, wire.TomHello):
+                inbound = node.inbound.setdefault(msg.sender, InboundLink())
+                inbound.attach(client, msg.link, msg.first)
+                number = msg.first
+                continue
+            if inbound is None:
+                handle_message(node, msg)
+            elif not inbound.deliver(client, number, node, msg):
+                node.logger.info(f"Connection from {client_address} replaced by a newer one")
+                break
+            number += 1
     except Exception as e:
         node.logger.error(f"Error handling connection from {client_address}: {e}")
 
     finally:
+        if inbound is not None:
+            inbound.detach(client)
         client.close()
 
+def handle_message(node: PeerNode, msg):
+    if isinstance(msg, wire.TomShutdown):
+        node.connected_peers.clear()
+        node.shutdown_flag.set()
+        return
+
+    if isinstance(msg, wire.TomReady):
+        if (msg.clock and msg.sender != node.id and msg.sender in node.members
+                and node.incarnations.get(msg.sender) != msg.clock):
+            node.peer_rejoined(msg.sender, msg.clock)
+        node.connected_peers.add(msg.sender)
+        return
+
+    if isinstance(msg, wire.TomWelcome):
+        node.welcomes[msg.sender] = msg.clock
+        return
+
+    # a word of this peer's own needs no ack from it: its delivery only waits for the other peers; a rejoining
+    # peer acks once it caught up
+    if isinstance(msg, wire.TomData) and node.ordering == 'lamport' and msg.sender != node.id and not node.rejoining:
+        with node.ack_lock:
+            first = node.ack_due is None
+            if first:
+                node.ack_due = time.monotonic() + node.ack_delay
+        if first:
+            try:
+                node.outbox.put_nowait(WAKE)
+            except queue.Full:
+                pass  # the sender loop is busy with the queued words and sends the ack with them
+    with node.delivery_lock:
+        try:
+            handle_ordering(node, msg)
+        except OrderConflict as e:
+            node.logger.error(f"Ignored {type(msg).__name__} from {msg.sender}: {e}")
+        if node.ordering != 'lamport':
+            sequence(node)
+
+# Passes a message to the ordering engine, called with the delivery lock held.
+def handle_ordering(node: PeerNode, msg):
+    if isinstance(msg, wire.TomAck):
+        print_message(node.engine.receive(msg.sender, msg.clock))
+    elif isinstance(msg, wire.TomOrder):
+        print_message(node.engine.add_order(msg.sender, msg.first, msg.keys))
+    elif isinstance(msg, wire.TomToken):
+        node.engine.take_token(msg.holder, msg.next_seq)
+        request_sync(node)
+    elif isinstance(msg, wire.TomNack):
+        link = node.links.get(msg.sender)
+        if link is not None:
+            next_seq, entries = node.engine.repair(msg.first)
+            link.send(wire.frame(wire.TomRepair(node.id, next_seq, msg.sync, entries)))
+    elif isinstance(msg, wire.TomCredit):
+        node.credit.update(msg.sender, msg.delivered)
+    elif isinstance(msg, wire.TomRepair):
+        print_message(node.engine.add_repair(msg.sender, msg.next_seq, msg.entries, bool(msg.sync)))
+    elif isinstance(msg, wire.TomData):
+        print_message(node.engine.receive(msg.sender, msg.clock, msg.words, span=len(msg.words)))
+
+# While this peer holds the sequencer token, multicasts the sequence numbers it assigned to the words received
+# so far, followed by the token when its block is used up. Called with the delivery lock held, so assignments
+# leave in the order they were made.
+def sequence(node: PeerNode):
+    assignment = node.engine.assign()
+    if assignment is None:
+        return
+    first, keys, token = assignment
+    node.metrics.emit("order", seq=first, size=len(keys))
+    node.broadcast(wire.TomOrder(node.id, first, keys))
+    if token is not None:
+        node.broadcast(wire.TomToken(node.id, *token))
+
+# Asks every live peer a newly taken over sequencer has not heard from yet for its highest assignment, so the
+# holder continues after every sequence number a failed holder handed out. Called with the delivery lock held.
+def request_sync(node: PeerNode):
+    first, peers = node.engine.sync_requests()
+    for peer in peers:
+        link = node.links.get(peer)
+        if link is not None:
+            link.send(wire.frame(wire.TomNack(node.id, first, 1)))
+
+# Asks another peer for the missing messages when delivery stayed stuck at the same sequence number for
+# NACK_INTERVAL seconds, e.g. after a connection dropped messages.
+def repair_loop(node: PeerNode):
+    stuck = None
+    while not node.shutdown_flag.wait(NACK_INTERVAL):
+        with node.delivery_lock:
+            request_sync(node)
+        missing = node.engine.missing()
+        if missing is not None and missing == stuck:
+            source = node.engine.repair_source()
+            link = node.links.get(source)
+            if link is not None:
+                node.logger.info(f"Asking {source} for the messages from {missing} on")
+                link.send(wire.frame(wire.TomNack(node.id, missing, 0)))
+        stuck = missing
+
+# Sends a rejoining peer the delivery log records from start on, in one bulk transfer, preceded by the number of
+# records and the sequencer state to continue from. With Lamport ordering the log is sent once every message
+# stamped up to until was delivered here.
+def serve_catch_up(node: PeerNode, client: socket.socket, start: int, until: int):
+    while until and not node.engine.delivered_through(until):
+        if node.shutdown_flag.wait(0.05):
+            return
+    with node.delivery_lock:
+        end = node.log.count
+        holder, token_seq, next_seq = node.engine.position() if node.ordering != 'lamport' else (None, 0, 0)
+        size = node.log.offset(end) - node.log.offset(start)
+    wire.send(client, wire.TomCatchupReply(end, holder, token_seq, next_seq, size))
+    node.log.send_range(client, start, end)
+    node.logger.info(f"Sent {end - start} delivered messages ({size} bytes) for a catch-up")
+
+# Brings the delivery log of a rejoining peer up to date from the first live peer that answers, then restores
+# what the peer derives from the log: the words delivered from every sender (its credit reports), its own
+# word ids and the sequencer history. The messages caught up on are printed; with a sequencer, live messages
+# that were ordered while the transfer was going are repaired through NACKs.
+def catch_up(node: PeerNode, until: int = 0) -> bool:
+    start = node.log.count
+    for peer in sorted(node.peers - {node.id}):
+        try:
+            with socket.create_connection(peer_address(peer), timeout=5) as sock:
+                sock.settimeout(CATCH_UP_TIMEOUT)
+                wire.send(sock, wire.TomCatchup(node.id, start, until))
+                reply = wire.recv(sock)
+                node.log.receive_range(sock, reply.size)
+        except OSError as e:
+            node.logger.warning(f"Catch-up from {peer} failed: {e}")
+            continue
+        print(f"Caught up on {node.log.count - start} messages ({reply.size} bytes) from {peer}")
+        history = deque(maxlen=HISTORY)
+        for seq, record in enumerate(node.log.records(0, node.log.count), 1):
+            clock, sender, words = wire.decode(record)
+            history.append((seq, sender, clock, words))
+            if seq > start:
+                print_message([(clock, sender, words)], recovered=True)
+            else:
+                node.delivered_from[sender] = node.delivered_from.get(sender, 0) + len(words)
+        node.credit.consume(node.delivered_from.get(node.id, 0))
+        if node.ordering != 'lamport':
+            node.engine.restore(node.log.count, list(history), reply.holder, reply.token_seq, reply.next_seq)
+        return True
+    return False
+
+# Takes a rejoining peer back into Lamport ordering once every live peer welcomed it. Every message ordered
+# without it is stamped at most the highest welcome clock, so the log is caught up on those, and delivery resumes
+# after the last message of the log: live copies up to it are dropped and the clock continues above it.
+def rejoin_lamport(node: PeerNode):
+    if not catch_up(node, max(node.welcomes.values(), default=0)):
+        print("No peer answered the catch-up, continuing from the local delivery log")
+    floor = None
+    if node.log.count:
+        for record in node.log.records(node.log.count - 1, node.log.count):
+            clock, sender, _ = wire.decode(record)
+            floor = (clock, sender)
+    with node.delivery_lock:
+        print_message(node.engine.resume(floor))
+    node.rejoining = False
+    with node.ack_lock:
+        node.ack_due = time.monotonic()  # tells the others it passed everything received while catching up
+    node.outbox.put(WAKE)
+
 def propagate_shutdown(node: PeerNode):
     """Send a shutdown message to all peers and shut down the node."""
-    shutdown_message = pickle.dumps((node.hostname, 'shutdown', node.clock))
-    for peer in node.peers:
-        try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-                sock.connect((peer, node.port))
-                sock.sendall(shutdown_message)
-                node.logger.info(f"Sent shutdown signal to {peer}")
-        except Exception as e:
-            node.logger.warning(f"Failed to send shutdown signal to {peer}: {e}")
-    
+    node.broadcast(wire.TomShutdown(node.id, node.engine.clock))
+    for link in list(node.links.values()):
+        link.flush(timeout=2)
+        node.logger.info(f"Sent shutdown signal to {link.peer}")
+
     # Set the shutdown flag and log the event
     node.logger.info("Shutting down this peer")
     node.shutdown_flag.set()
 
-def sending_message(message, max_attempts = 10):
-    for peer in node.peers: 
-        attempts = 0
-        while True:
-            try:
-                client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                client_socket.connect((peer, node.port))
-                client_socket.sendall(message)
+# Prints the words the ordering engine delivered, a batch word by word with the clocks it spans, and appends
+# the messages to the delivery log unless they were recovered from it.
+def print_message(delivered, recovered: bool = False):
+    for first_clock, ip, words in delivered:
+        if not recovered:
+            node.log.append(wire.encode(wire.TomRecord(first_clock, ip, words)))
+        for curr_clock, msg in enumerate(words, first_clock):
+            print(curr_clock, ip, msg)
+            node.metrics.emit("deliver", id=[ip, curr_clock])
+        node.delivered_from[ip] = node.delivered_from.get(ip, 0) + len(words)
 
-                if peer not in node.connected_peers:
-                    node.connected_peers.add(peer)
-                break
-            except socket.error as e:
-                attempts+=1
-                print(f"Attempts {attempts} failed for {peer}: {e}")
-                time.sleep(3)
-                if attempts > max_attempts:
-                    node.connected_peers.remove(peer)
-                    node.peers.remove(peer)
-                    break
+# Tells every sender how many of its words were delivered here, which gives it credit for more.
+def credit_loop(node: PeerNode):
+    reported = {}
+    while not node.shutdown_flag.wait(CREDIT_INTERVAL):
+        for sender, delivered in list(node.delivered_from.items()):
+            link = node.links.get(sender)
+            if link is not None and reported.get(sender) != delivered:
+                link.send(wire.frame(wire.TomCredit(node.id, delivered)))
+                reported[sender] = delivered
+
+# Flushes the delivery log and emits the holdback depth (words received and not delivered), the words waiting to
+# be sent and the peak memory.
+def stats_loop(node: PeerNode):
+    while not node.shutdown_flag.wait(STATS_INTERVAL):
+        node.log.flush()
+        node.metrics.emit("holdback", depth=node.engine.held_words(),
+                          messages=node.engine.pending(), outbox=node.outbox.qsize(),
+                          outstanding=node.credit.outstanding(),
+                          links=sum(link.queue.qsize() for link in list(node.links.values())),
+                          logged=node.log.count, max_rss_kb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+# Takes the words that follow first from the outbox until the batch window closes or the batch is full,
+# then adapts the window to how much the batch collected.
+def collect_batch(node: PeerNode, first) -> list:
+    batch = [first]
+    deadline = time.monotonic() + node.window
+    while len(batch) < node.batch_max:
+        try:
+            item = node.outbox.get(timeout=max(0.0, deadline - time.monotonic()))
+        except queue.Empty:
+            break
+        if item != WAKE:
+            batch.append(item)
+    if len(batch) > 1:
+        node.window = min(node.max_window, max(node.window * 2, node.max_window / 16))
+    elif node.window < node.max_window / 16:
+        node.window = 0.0  # only what is already queued is batched
+    else:
+        node.window /= 2
+    return batch
+
+# Multicasts an explicit ack if the pending one is due.
+def send_ack(node: PeerNode):
+    with node.ack_lock:
+        if node.ack_due is None or time.monotonic() < node.ack_due:
+            return
+        node.ack_due = None  # cleared before stamping, anything received later gets a new ack
+    with node.send_lock:
+        clock = node.engine.tick()
+        node.broadcast(wire.TomAck(node.id, clock))
+    node.metrics.emit("ack", clock=clock)
 
-def print_message():
-    ips = set(map(lambda ip: ip[1][0], node.priority_queue))
-    if node.peers.issubset(ips):
-        while len(node.priority_queue) > 0:
-            curr_clock, (ip, msg) = heapq.heappop(node.priority_queue)
-            if msg != 'ack':
-                print(curr_clock, ip, msg)
+# Waits for credit to multicast count words. Acks that fall due meanwhile still go out: with Lamport ordering
+# the receivers cannot deliver (and so return credit) without them.
+def wait_for_credit(node: PeerNode, count: int):
+    while not node.credit.wait(count, timeout=0.05) and not node.shutdown_flag.is_set():
+        send_ack(node)
+
+# Sends the outbox in order: every batch of words and every ack is stamped right before it is multicast, so
+# each peer sends its messages in clock order. A batch stamped after the pending ack was due acknowledges
+# everything received, so an explicit ack is only sent when no word went out for ack_delay seconds.
+def sender_loop(node: PeerNode):
+    while not node.shutdown_flag.is_set():
+        with node.ack_lock:
+            due = node.ack_due
+        timeout = 1.0 if due is None else max(0.0, due - time.monotonic())
+        try:
+            word = node.outbox.get(timeout=timeout)
+        except queue.Empty:
+            word = None
+        if word == WAKE:
+            continue
+        if word is None:
+            send_ack(node)
+            continue
+        batch = collect_batch(node, word)
+        wait_for_credit(node, len(batch))
+        with node.ack_lock:
+            node.ack_due = None  # the batch carries the ack
+        with node.send_lock:
+            clock = node.engine.tick(len(batch))
+            node.broadcast(wire.TomData(node.id, clock, [word for word, _ in batch]))
+        node.credit.consume(len(batch))
+        node.metrics.emit("batch", clock=clock, size=len(batch))
+        for curr_clock, (_, submitted) in enumerate(batch, clock):
+            node.metrics.emit("send", id=[node.id, curr_clock], t=submitted)
 
 def client(node: PeerNode):
-    node.clock += 1
     word = random.choice(list(portuguese_cities))  # Convert set to list for random.choice
-    message = node.hostname, word, node.clock
-    send_data = pickle.dumps(message)
-    sending_message(send_data)
+    node.outbox.put((word, time.time()))
 
 def periodic_send(node: PeerNode):
     def send_poisson_messages():
+        if node.first_clock:
+            node.broadcast(wire.TomReady(node.id, node.first_clock))
         while not node.shutdown_flag.is_set():
-            delay = poisson_delay(1)
+            if node.rejoining:
+                if node.peers - {node.id} <= node.welcomes.keys():
+                    rejoin_lamport(node)
+                else:
+                    time.sleep(0.4)
+                    node.broadcast(wire.TomReady(node.id, node.first_clock))
+                continue
+            delay = poisson_delay(node.rate)
             if node.peers.issubset(node.connected_peers):
                 client(node)
                 time.sleep(delay)
             else:
                 time.sleep(0.4)
-                sending = node.hostname, 'ready', 0
-                sending_message(pickle.dumps(sending))
+                node.broadcast(wire.TomReady(node.id, node.first_clock))
             
     threading.Thread(target=send_poisson_messages, daemon=True).start()
+    threading.Thread(target=sender_loop, args=(node,), daemon=True).start()
+    threading.Thread(target=credit_loop, args=(node,), daemon=True).start()
+    threading.Thread(target=stats_loop, args=(node,), daemon=True).start()
+    if node.ordering != 'lamport':
+        threading.Thread(target=repair_loop, args=(node,), daemon=True).start()
 
 if __name__ == "__main__":
-    import sys
+    parser = argparse.ArgumentParser(description="Totally ordered multicast peer.")
+    parser.add_argument("hostname")
+    parser.add_argument("host_peers", nargs="+", help="host[:port] of every other peer")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--metrics", default=None, help="append benchmark events to this JSON lines file")
+    parser.add_argument("--rate", type=float, default=1, help="words submitted per second")
+    parser.add_argument("--batch-window", type=float, default=0.02,
+                        help="longest wait in seconds for more words to batch, adapted to the load (0 disables it)")
+    parser.add_argument("--batch-max", type=int, default=64, help="most words in one multicast")
+    parser.add_argument("--ordering", choices=["lamport", "sequencer", "rotating"], default="lamport",
+                        help="lamport clocks and acks, a fixed sequencer, or a sequencer token that rotates")
+    parser.add_argument("--sequencer-block", type=int, default=64,
+                        help="sequence numbers a rotating sequencer assigns before passing the token")
+    parser.add_argument("--holdback-limit", type=int, default=4096,
+                        help="most undelivered words a peer holds back, shared out as credit among the senders")
+    parser.add_argument("--outbox-limit", type=int, default=1024,
+                        help="words waiting to be sent before the producer is blocked")
+    parser.add_argument("--rejoin", action="store_true",
+                        help="keep the delivery log and catch up on the messages missed while down")
+    parser.add_argument("--ack-delay", type=float, default=0.2,
+                        help="seconds without an outgoing word before received words are acknowledged explicitly")
+    args = parser.parse_args()
 
-    if len(sys.argv) <= 3:
-        print("Usage: python peer.py <hostname> <host_peers>")
-        sys.exit(1)  
-
-    hostname_ = sys.argv[1]  # Get hostname from arguments
-    peers_ = sys.argv[1:]
-    peers_ = set(map(str, peers_))
-    node = PeerNode(hostname= hostname_, peers=peers_)
+    hostname_ = args.hostname  # Get hostname from arguments
+    peers_ = set(map(peer_id, args.host_peers)) | {f"{hostname_}:{args.port}"}
+    node = PeerNode(hostname= hostname_, peers=peers_, port= args.port, metrics= Metrics(args.metrics),
+                    ack_delay= args.ack_delay, batch_window= args.batch_window, batch_max= args.batch_max,
+                    rate= args.rate, ordering= args.ordering, sequencer_block= args.sequencer_block,
+                    holdback_limit= args.holdback_limit, outbox_limit= args.outbox_limit, rejoin= args.rejoin)
 
     print(f"Node initialized at {hostname_}:{node.port}")
+    if args.rejoin and args.ordering != "lamport" and not catch_up(node):
+        print("No peer answered the catch-up, starting from the local delivery log")
 
     periodic_send(node)
     server_run(node)
-
-    
-
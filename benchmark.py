@@ -0,0 +1,311 @@
+import argparse
+import json
+import os
+import pickle
+import shlex
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from typing import Dict, List, Optional
+
+import wire
+
+'''
+Local benchmark harness for the three algorithms.
+
+Launches N peers of one algorithm on loopback, one port each, lets them run under load for a while, then stops
+them and reads the JSON lines metrics every peer wrote with --metrics:
+    token   token rotation time and request queue-wait latency percentiles, requests served per second
+    gossip  time until every peer's map holds all N peers (convergence time) and the final map sizes
+    tom     delivery latency (send to delivery, same host clock) percentiles and whether all peers agree on the order
+    wire    microseconds and bytes to frame and decode the most frequent messages, against pickle (no peers)
+
+Results can be saved with --save and compared with an earlier run with --compare.
+
+    python3 benchmark.py token --peers 5 --duration 20 --rate 200 --save token.json
+    python3 benchmark.py token --peers 5 --duration 20 --rate 200 --compare token.json
+'''
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PEER_ENV = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")]))}
+SCRIPTS = {
+    "token": os.path.join(ROOT, "token ring", "peer_token.py"),
+    "calculator": os.path.join(ROOT, "token ring", "multiCalculator.py"),
+    "inject": os.path.join(ROOT, "token ring", "inject.py"),
+    "gossip": os.path.join(ROOT, "p2p", "peer.py"),
+    "tom": os.path.join(ROOT, "TOM", "peer.py"),
+}
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+    pick = lambda p: ordered[min(len(ordered) - 1, len(ordered) * p // 100)]
+    return {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered), 6),
+        "p50": round(pick(50), 6),
+        "p95": round(pick(95), 6),
+        "p99": round(pick(99), 6),
+        "max": round(ordered[-1], 6),
+    }
+
+
+def read_events(path: str) -> List[dict]:
+    events = []
+    if not os.path.exists(path):
+        return events
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                events.append(json.loads(line))
+    return events
+
+
+# Starts and stops the processes of one run; every process writes its output to the run's work directory.
+class Cluster:
+    def __init__(self, workdir: str):
+        self.workdir = workdir
+        self.processes: List[subprocess.Popen] = []
+
+    def start(self, name: str, args: List[str]) -> subprocess.Popen:
+        out = open(os.path.join(self.workdir, f"{name}.out"), "w")
+        process = subprocess.Popen([sys.executable, "-u"] + args, cwd=self.workdir, env=PEER_ENV, stdout=out,
+                                   stderr=subprocess.STDOUT)
+        self.processes.append(process)
+        return process
+
+    def run(self, args: List[str]):
+        subprocess.run([sys.executable] + args, cwd=self.workdir, env=PEER_ENV, stdout=subprocess.DEVNULL, check=False)
+
+    # Sends SIGINT to every process (the peers' own shutdown path) and kills whatever is still running after the grace period.
+    def stop(self, grace: float = 5.0):
+        for process in self.processes:
+            if process.poll() is None:
+                process.send_signal(signal.SIGINT)
+        deadline = time.monotonic() + grace
+        for process in self.processes:
+            try:
+                process.wait(max(0.1, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+
+def metrics_path(workdir: str, i: int) -> str:
+    return os.path.join(workdir, f"peer{i}.jsonl")
+
+
+def run_token(args, cluster: Cluster) -> dict:
+    host = args.host
+    peers = [f"{host}:{args.base_port + i}" for i in range(args.peers)]
+    calculators = [f"{host}:{args.base_port + args.peers + k}" for k in range(args.shards)]
+    for k, calculator in enumerate(calculators):
+        cluster.start(f"calculator{k}", [SCRIPTS["calculator"], host, "--port", calculator.split(':')[1]])
+    time.sleep(0.5)
+    for i, peer in enumerate(peers):
+        cluster.start(f"peer{i}", [SCRIPTS["token"], host, peers[(i + 1) % len(peers)], ','.join(calculators),
+                                   "--port", str(args.base_port + i), "--ring", ','.join(peers),
+                                   "--rate", str(args.rate), "--metrics", metrics_path(cluster.workdir, i)] + args.peer_args)
+    time.sleep(1.0)
+    cluster.run([SCRIPTS["inject"], peers[0], "--tokens", str(args.shards)])
+    time.sleep(args.duration)
+    cluster.stop()
+
+    rotations, waits = [], []
+    for i in range(args.peers):
+        for event in read_events(metrics_path(cluster.workdir, i)):
+            if event["event"] == "rotation":
+                rotations.append(event["seconds"])
+            elif event["event"] == "wait":
+                waits.extend(event["values"])
+    return {
+        "rotation_time": percentiles(rotations),
+        "request_wait": percentiles(waits),
+        "served_per_second": round(len(waits) / args.duration, 2),
+    }
+
+
+def run_gossip(args, cluster: Cluster) -> dict:
+    host = args.host
+    peers = [f"{host}:{args.base_port + i}" for i in range(args.peers)]
+    started = time.time()
+    for i in range(args.peers):
+        # each peer only knows its two neighbours on a ring, the rest has to be learned by gossip
+        neighbours = sorted({peers[(i - 1) % len(peers)], peers[(i + 1) % len(peers)]} - {peers[i]})
+        cluster.start(f"peer{i}", [SCRIPTS["gossip"], host] + neighbours +
+                      ["--port", str(args.base_port + i), "--metrics", metrics_path(cluster.workdir, i)] + args.peer_args)
+    time.sleep(args.duration)
+    cluster.stop()
+
+    converged_at: List[Optional[float]] = []
+    final_sizes = []
+    for i in range(args.peers):
+        events = [e for e in read_events(metrics_path(cluster.workdir, i)) if e["event"] == "map"]
+        converged_at.append(next((e["t"] for e in events if e["size"] >= args.peers), None))
+        final_sizes.append(events[-1]["size"] if events else 0)
+    converged = all(t is not None for t in converged_at)
+    return {
+        "convergence_time": round(max(converged_at) - started, 3) if converged else None,
+        "converged_peers": sum(t is not None for t in converged_at),
+        "final_map_size": percentiles(final_sizes),
+    }
+
+
+def run_tom(args, cluster: Cluster) -> dict:
+    host = args.host
+    peers = [f"{host}:{args.base_port + i}" for i in range(args.peers)]
+    for i in range(args.peers):
+        others = [peer for j, peer in enumerate(peers) if j != i]
+        cluster.start(f"peer{i}", [SCRIPTS["tom"], host] + others +
+                      ["--port", str(args.base_port + i), "--metrics", metrics_path(cluster.workdir, i)] + args.peer_args)
+    time.sleep(args.duration)
+    cluster.stop()
+
+    sent: Dict[tuple, float] = {}
+    orders = []
+    latencies = []
+    acks = 0
+    assignments = 0
+    batches = []
+    depths = []
+    rss = []
+    for i in range(args.peers):
+        for event in read_events(metrics_path(cluster.workdir, i)):
+            if event["event"] == "send":
+                sent[tuple(event["id"])] = event["t"]
+            elif event["event"] == "ack":
+                acks += 1
+            elif event["event"] == "order":
+                assignments += 1
+            elif event["event"] == "batch":
+                batches.append(event["size"])
+            elif event["event"] == "holdback":
+                depths.append(event["depth"])
+                rss.append(event["max_rss_kb"])
+    for i in range(args.peers):
+        order = []
+        for event in read_events(metrics_path(cluster.workdir, i)):
+            if event["event"] == "deliver":
+                key = tuple(event["id"])
+                order.append(key)
+                if key in sent:
+                    latencies.append(event["t"] - sent[key])
+        orders.append(order)
+
+    # every peer must deliver the same sequence; peers stopped at different times may only differ in length
+    consistent = all(order == orders[0][:len(order)] or orders[0] == order[:len(orders[0])] for order in orders)
+    return {
+        "delivery_latency": percentiles(latencies),
+        "messages_sent": len(sent),
+        "acks_sent": acks,
+        "orders_sent": assignments,
+        "words_per_batch": percentiles(batches),
+        "delivered_per_second": round(sum(len(order) for order in orders) / len(orders) / args.duration, 1),
+        "delivered_per_peer": percentiles([len(order) for order in orders]),
+        "holdback_depth": percentiles(depths),
+        "max_rss_kb": max(rss, default=None),
+        "order_consistent": consistent,
+    }
+
+
+# Times encoding and decoding one message of the most frequent kinds with the wire codec, against pickle of the tuple
+# the peers sent before, both with the length prefix of a frame. No peers are started.
+def run_wire(args, cluster: Cluster) -> dict:
+    peer = f"{args.host}:{args.base_port}"
+    words = [f"word{i}" for i in range(16)]
+    cases = {
+        "tom_ack": (wire.TomAck(peer, 12345), (peer, 'ack', 12345)),
+        "tom_data_1": (wire.TomData(peer, 12345, words[:1]), (peer, words[:1], 12345)),
+        "tom_data_16": (wire.TomData(peer, 12345, words), (peer, words, 12345)),
+        "tom_order_16": (wire.TomOrder(peer, 1000, [(peer, 12345 + i) for i in range(16)]),
+                         (peer, 'order', (1000, [(peer, 12345 + i) for i in range(16)]))),
+        "gossip_push_100": (wire.GossipPush(peer, 7, 0, 1, 1.5, 3, {f"10.0.0.{i}:50000": 1e9 + i for i in range(100)}),
+                            (peer, 'push', 7, {f"10.0.0.{i}:50000": 1e9 + i for i in range(100)})),
+    }
+
+    def pickle_frame(value):
+        data = pickle.dumps(value)
+        return wire.HEADER.pack(len(data)) + data
+
+    def per_message(function, number=20000) -> float:
+        return min(timeit.repeat(function, number=number, repeat=5)) / number * 1e6
+
+    results = {}
+    for name, (msg, value) in cases.items():
+        framed, pickled = wire.frame(msg), pickle_frame(value)
+        view, pickled_view = memoryview(framed)[wire.HEADER.size:], memoryview(pickled)[wire.HEADER.size:]
+        results[name] = {
+            "wire_bytes": len(framed),
+            "pickle_bytes": len(pickled),
+            "wire_us": round(per_message(lambda: wire.frame(msg)) + per_message(lambda: wire.decode(view)), 3),
+            "pickle_us": round(per_message(lambda: pickle_frame(value)) + per_message(lambda: pickle.loads(pickled_view)), 3),
+        }
+    return results
+
+
+RUNNERS = {"token": run_token, "gossip": run_gossip, "tom": run_tom, "wire": run_wire}
+
+
+def flatten(metrics: dict, prefix: str = "") -> Dict[str, object]:
+    flat = {}
+    for key, value in metrics.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        else:
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+# Prints every metric next to its value in an earlier run.
+def compare(current: dict, baseline: dict):
+    now, before = flatten(current["metrics"]), flatten(baseline["metrics"])
+    print(f"{'metric':32} {'baseline':>14} {'current':>14} {'change':>9}")
+    for key in sorted(set(now) | set(before)):
+        old, new = before.get(key), now.get(key)
+        change = ""
+        if isinstance(old, (int, float)) and isinstance(new, (int, float)) and not isinstance(old, bool) and old:
+            change = f"{(new - old) / abs(old) * 100:+.1f}%"
+        print(f"{key:32} {str(old):>14} {str(new):>14} {change:>9}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs N local peers of one algorithm and reports its performance.")
+    parser.add_argument("algorithm", choices=sorted(RUNNERS))
+    parser.add_argument("--peers", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds the peers run before being stopped")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--base-port", type=int, default=51000, help="peer i listens on base port + i")
+    parser.add_argument("--rate", type=float, default=100.0, help="token ring: requests per second per peer")
+    parser.add_argument("--shards", type=int, default=1, help="token ring: calculators, one token each")
+    parser.add_argument("--peer-args", default="", help="extra arguments passed to every peer")
+    parser.add_argument("--workdir", default=None, help="keep logs and metrics in this directory")
+    parser.add_argument("--save", default=None, help="write the results to this JSON file")
+    parser.add_argument("--compare", default=None, help="compare with the results saved by an earlier run")
+    args = parser.parse_args()
+    args.peer_args = shlex.split(args.peer_args)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix=f"bench-{args.algorithm}-")
+    os.makedirs(workdir, exist_ok=True)
+    cluster = Cluster(workdir)
+    try:
+        metrics = RUNNERS[args.algorithm](args, cluster)
+    finally:
+        cluster.stop()
+
+    params = {key: value for key, value in vars(args).items() if key not in ("save", "compare", "workdir")}
+    result = {"algorithm": args.algorithm, "params": params, "timestamp": time.time(), "metrics": metrics}
+    print(json.dumps(result, indent=2))
+    print(f"logs and metrics in {workdir}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(result, json.load(f))
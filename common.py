@@ -0,0 +1,35 @@
+import json
+import threading
+import time
+from typing import Optional, Tuple
+
+'''
+Helpers shared by the peers of the three algorithms: peer ids and the benchmark metrics file.
+'''
+
+DEFAULT_PORT = 50000
+
+
+# Peers are identified by "host:port"; a host given without a port uses the default port.
+def peer_id(address: str) -> str:
+    host, _, port = address.partition(':')
+    return f"{host}:{port or DEFAULT_PORT}"
+
+
+def peer_address(peer: str) -> Tuple[str, int]:
+    host, _, port = peer.partition(':')
+    return host, int(port)
+
+
+# Appends benchmark events as JSON lines (read by benchmark.py), does nothing when no file is given.
+class Metrics:
+    def __init__(self, path: Optional[str] = None):
+        self.file = open(path, "a", buffering=1) if path else None
+        self.lock = threading.Lock()
+
+    def emit(self, event: str, **fields):
+        if self.file is None:
+            return
+        record = json.dumps({"event": event, "t": time.time(), **fields})
+        with self.lock:
+            self.file.write(record + "\n")
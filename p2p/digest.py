@@ -0,0 +1,59 @@
+import hashlib
+from typing import Dict, List, Optional, Set, Tuple
+
+BUCKETS = 256
+QUANTUM = 15.0  # seconds of heartbeat timestamps that hash the same
+
+# Bucketed hash digest of a peer map, kept up to date as entries change.
+# Every key falls in a fixed bucket and a bucket's hash is the XOR of the hashes of its entries, so adding,
+# refreshing or removing an entry costs two hashes no matter how large the map is. An entry is hashed as its key
+# and its timestamp rounded down to a multiple of quantum seconds: heartbeats within the same quantum leave the
+# digest alone, so the roots of two peers match as long as they agree on the members and on which quantum their
+# last heartbeats fell in. Two peers with the same root hold the same members, with timestamps less than a quantum
+# apart; otherwise only the buckets whose hashes differ need to be exchanged.
+class BucketDigest:
+    def __init__(self, buckets: int = BUCKETS, quantum: float = QUANTUM):
+        self.quantum = quantum
+        self.hashes: List[int] = [0] * buckets
+        self.members: List[Set[str]] = [set() for _ in range(buckets)]
+        self.bucket_of: Dict[str, int] = {}
+
+    def bucket(self, key: str) -> int:
+        index = self.bucket_of.get(key)
+        if index is None:
+            digest = hashlib.blake2b(key.encode(), digest_size=4).digest()
+            index = int.from_bytes(digest, 'big') % len(self.hashes)
+        return index
+
+    def entry_hash(self, key: str, stamp: float) -> int:
+        return int.from_bytes(hashlib.blake2b(f"{key}|{int(stamp // self.quantum)}".encode(), digest_size=8).digest(), 'big')
+
+    def add(self, key: str, stamp: float):
+        index = self.bucket(key)
+        self.bucket_of[key] = index
+        self.members[index].add(key)
+        self.hashes[index] ^= self.entry_hash(key, stamp)
+
+    def remove(self, key: str, stamp: float):
+        index = self.bucket_of.pop(key)
+        self.members[index].discard(key)
+        self.hashes[index] ^= self.entry_hash(key, stamp)
+
+    def root(self) -> bytes:
+        return hashlib.blake2b(b''.join(h.to_bytes(8, 'big') for h in self.hashes), digest_size=16).digest()
+
+    # The non-empty buckets among span buckets from offset on (all of them by default) and their hashes; empty
+    # buckets are left out, so a small map sends few hashes.
+    def sparse(self, offset: int = 0, span: Optional[int] = None) -> Tuple[List[int], List[int]]:
+        end = len(self.hashes) if span is None else min(len(self.hashes), offset + span)
+        buckets = [i for i in range(offset, end) if self.hashes[i]]
+        return buckets, [self.hashes[i] for i in buckets]
+
+    # Buckets among span buckets from offset on whose hashes differ from another peer's, given as by sparse().
+    def differing(self, buckets: List[int], hashes: List[int], offset: int = 0, span: Optional[int] = None) -> List[int]:
+        theirs = dict(zip(buckets, hashes))
+        end = len(self.hashes) if span is None else min(len(self.hashes), offset + span)
+        return [i for i in range(offset, end) if self.hashes[i] != theirs.get(i, 0)]
+
+    def keys(self, buckets: List[int]) -> List[str]:
+        return [key for i in buckets for key in self.members[i]]
@@ -0,0 +1,177 @@
+import heapq
+import threading
+from array import array
+from bisect import bisect_right
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional, Tuple
+from digest import BucketDigest
+
+ABSENT = 0.0  # timestamp of an id that is not (or no longer) in the map
+
+# The peer map of the gossip algorithm: peer name -> timestamp of its last heartbeat.
+# Names are interned to integer ids once, and timestamps and change versions live in contiguous arrays indexed by
+# id. Entries expire through a min-heap of (timestamp, id) instead of a scan of the whole map; refreshed entries
+# leave stale heap items behind that are skipped when they surface. Every change is appended to a change log
+# ordered by version, so the entries changed since a version are found without walking the map either.
+# All writers hold the lock; readers get a read-only snapshot that is only rebuilt after the map changed.
+class MembershipTable:
+    def __init__(self, delta: float, with_digest: bool = True):
+        self.delta = delta  # maximum age of an entry
+        self.ids: Dict[str, int] = {}
+        self.names: List[str] = []
+        self.stamps = array('d')
+        self.versions = array('q')  # map version at which each id last changed
+        self.version = 0
+        self.size = 0
+        self.heap: List[Tuple[float, int]] = []
+        self.changes = array('q')  # ids in the order they changed ...
+        self.change_versions = array('q')  # ... and the version of each change
+        # bucket hashes for digest reconciliation; heartbeats are hashed at a sixth of the expiry time, so a
+        # timestamp only spread by digest rounds is never more than that behind
+        self.digest = BucketDigest(quantum=delta / 6) if with_digest else None
+        self.snapshot_cache = None
+        self.dead = set()  # ids declared dead by the failure detector, ignored by merges until revived
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self.size
+
+    def intern(self, name: str) -> int:
+        index = self.ids.get(name)
+        if index is None:
+            index = len(self.names)
+            self.ids[name] = index
+            self.names.append(name)
+            self.stamps.append(ABSENT)
+            self.versions.append(0)
+        return index
+
+    # Sets an entry, the caller holds the lock.
+    def _set(self, index: int, stamp: float):
+        name = self.names[index]
+        old = self.stamps[index]
+        if old == ABSENT:
+            self.size += 1
+        elif self.digest is not None:
+            self.digest.remove(name, old)
+        self.version += 1
+        self.stamps[index] = stamp
+        self.versions[index] = self.version
+        if self.digest is not None:
+            self.digest.add(name, stamp)
+        heapq.heappush(self.heap, (stamp, index))
+        self.changes.append(index)
+        self.change_versions.append(self.version)
+        self.snapshot_cache = None
+        self._compact()
+
+    # Records a heartbeat of one peer.
+    def touch(self, name: str, stamp: float):
+        with self.lock:
+            index = self.intern(name)
+            if stamp > self.stamps[index]:
+                self._set(index, stamp)
+
+    # Merges a received map in one pass under the lock, keeping the newest timestamp of every entry. Entries that
+    # are already expired here are ignored. Returns the number of entries that changed.
+    def merge(self, entries: Mapping[str, float], now: float) -> int:
+        cutoff = now - self.delta
+        changed = 0
+        with self.lock:
+            ids, stamps, dead, intern, set_ = self.ids, self.stamps, self.dead, self.intern, self._set
+            for name, stamp in entries.items():
+                if stamp < cutoff:
+                    continue
+                index = ids.get(name)
+                if index is None:
+                    index = intern(name)
+                elif stamp <= stamps[index] or index in dead:
+                    continue
+                set_(index, stamp)
+                changed += 1
+        return changed
+
+    # Drops the entries older than delta, popping them off the heap. Returns their names.
+    def expire(self, now: float) -> List[str]:
+        cutoff = now - self.delta
+        expired = []
+        with self.lock:
+            heap = self.heap
+            while heap and heap[0][0] < cutoff:
+                stamp, index = heapq.heappop(heap)
+                if self.stamps[index] != stamp:
+                    continue  # the entry was refreshed after this item was pushed
+                self._drop(index)
+                expired.append(self.names[index])
+            self._compact()
+        return expired
+
+    # Removes a peer the failure detector declared dead; gossip cannot bring it back until it is revived.
+    def mark_dead(self, name: str):
+        with self.lock:
+            index = self.intern(name)
+            self.dead.add(index)
+            self._drop(index)
+
+    def revive(self, name: str, stamp: float):
+        with self.lock:
+            index = self.intern(name)
+            self.dead.discard(index)
+            if stamp > self.stamps[index]:
+                self._set(index, stamp)
+
+    # Removes an entry, the caller holds the lock.
+    def _drop(self, index: int):
+        stamp = self.stamps[index]
+        if stamp == ABSENT:
+            return
+        if self.digest is not None:
+            self.digest.remove(self.names[index], stamp)
+        self.stamps[index] = ABSENT
+        self.size -= 1
+        self.snapshot_cache = None
+
+    # Keeps the heap and the change log proportional to the map size. Called on every change, not only when
+    # entries expire: with the SWIM failure detector nothing ever expires.
+    def _compact(self):
+        if len(self.heap) > 4 * self.size + 1024:
+            self.heap = [(stamp, index) for index, stamp in enumerate(self.stamps) if stamp != ABSENT]
+            heapq.heapify(self.heap)
+        if len(self.changes) > 4 * self.size + 1024:
+            live = sorted((self.versions[index], index) for index, stamp in enumerate(self.stamps) if stamp != ABSENT)
+            self.change_versions = array('q', (version for version, _ in live))
+            self.changes = array('q', (index for _, index in live))
+
+    # Entries changed after the given version, and the version they cover.
+    def changed_since(self, since: int) -> Tuple[Dict[str, float], int]:
+        with self.lock:
+            start = bisect_right(self.change_versions, since)
+            delta = {}
+            for index in self.changes[start:]:
+                stamp = self.stamps[index]
+                if stamp != ABSENT and self.versions[index] > since:
+                    delta[self.names[index]] = stamp
+            return delta, self.version
+
+    def bucket_entries(self, buckets: List[int]) -> Dict[str, float]:
+        with self.lock:
+            return {name: self.stamps[self.ids[name]] for name in self.digest.keys(buckets)}
+
+    def root(self) -> bytes:
+        with self.lock:
+            return self.digest.root()
+
+    def bucket_hashes(self, offset: int = 0, span: Optional[int] = None) -> Tuple[List[int], List[int]]:
+        with self.lock:
+            return self.digest.sparse(offset, span)
+
+    def differing(self, buckets: List[int], hashes: List[int], offset: int = 0, span: Optional[int] = None) -> List[int]:
+        with self.lock:
+            return self.digest.differing(buckets, hashes, offset, span)
+
+    # Read-only view of the map for readers, shared until the next change.
+    def snapshot(self) -> Mapping[str, float]:
+        with self.lock:
+            if self.snapshot_cache is None:
+                self.snapshot_cache = MappingProxyType({self.names[index]: stamp for index, stamp in enumerate(self.stamps) if stamp != ABSENT})
+            return self.snapshot_cache
@@ -2,10 +2,16 @@ import socket
 import logging
 import threading
 import time 
-import pickle
 import math
 import random 
 import signal 
+import argparse
+from typing import Optional
+from common import DEFAULT_PORT, Metrics, peer_address, peer_id
+import wire
+from digest import BUCKETS
+from membership import MembershipTable
+from swim import FailureDetector
 
 '''
 <+ Create a network of 6 peers (p1 to p6), running on different machines (m1 to m6), with
@@ -32,44 +38,290 @@ threshold).
 '''
 # MAXIMUM TIME WITHOUT UPDATE
 DELTA = 90  
+MAX_DATAGRAM = 1400  # bytes, a UDP message fits an Ethernet MTU with the IP and UDP headers
+MAX_ROUND_DATAGRAMS = 64  # exchanges larger than this (catch-up after a restart) go over TCP
+HASHES_PER_DATAGRAM = 128  # digest buckets covered by one datagram, at most 10 bytes each
 
 # Periodically calculates a delay for Anti-Entropy updates using a Poisson distribution.
 def poisson_delay(lambda_:int):
     return -math.log(1.0 - random.random()) / (lambda_/60)
 
 # Merges a received set of peers into the current peer's map, updating timestamps where necessary.
-def merge_set(recv_set):
-    merged = peer_node.my_set
-    for key in recv_set:
-        if key in merged:
-            merged[key] = max(peer_node.my_set[key], recv_set[key])
-        else:
-            merged[key] = recv_set[key]
-
-    peer_node.my_set = merged
+# Entries that are already expired here are ignored. Returns the number of entries that changed.
+def merge_set(recv_set) -> int:
+    return peer_node.table.merge(recv_set, time.time())
 
 # Removes outdated entries from the peer's map and updates its own timestamp.
+# With the SWIM failure detector, entries are removed when the detector declares them dead instead.
 def dictionary_operations():
     current_time = time.time() 
-    peer_node.my_set = {key: value for key, value in peer_node.my_set.items() if current_time - value <= DELTA}
-    peer_node.my_set[peer_node.host] = current_time
-    
+    if peer_node.detector is None:
+        peer_node.table.expire(current_time)
+    peer_node.table.touch(peer_node.id, current_time)
+    peer_node.metrics.emit("map", size=len(peer_node.table))
+
+# Sends one message on a new connection and returns the reply, None when the peer does not answer in time.
+def request(peer: str, message: tuple, timeout: float):
+    try:
+        with socket.create_connection(peer_address(peer), timeout=timeout) as sock:
+            wire.send(sock, message)
+            return wire.recv(sock)
+    except Exception:
+        return None
+
+# Called by the failure detector when a member changes state.
+def member_changed(name: str, status: str):
+    log.logger.info(f"Failure detector: {name} is {status}")
+    print(f"{name} is {status}, {len(peer_node.table)} entries")
+    peer_node.metrics.emit(status, member=name)
+    peer_node.metrics.emit("map", size=len(peer_node.table))
+
+# Records the outcome of an exchange with a neighbour: it acknowledged our entries up to version, and we now
+# hold its entries up to their_version. A neighbour that restarted (new epoch) lost its map, so the next
+# exchange with it sends everything again.
+def acknowledge(neigh: str, version: int, epoch: float, their_version: int):
+    with peer_node.lock:
+        if peer_node.epochs.get(neigh, epoch) != epoch:
+            peer_node.acked[neigh] = 0
+        else:
+            peer_node.acked[neigh] = max(peer_node.acked.get(neigh, 0), version)
+        peer_node.epochs[neigh] = epoch
+        peer_node.received[neigh] = their_version
+
+# Delta push-pull with one neighbour over an open connection: sends the entries it has not acknowledged yet
+# and gets back, in the same round trip, its entries changed since the last exchange. Returns the number of
+# entries that changed here.
+def exchange_delta(sock: socket.socket, neigh: str) -> int:
+    with peer_node.lock:
+        since = peer_node.received.get(neigh, 0)
+        known_epoch = peer_node.epochs.get(neigh)
+        acked = peer_node.acked.get(neigh, 0)
+    delta, version = peer_node.table.changed_since(acked)
+    wire.send(sock, wire.GossipPull(peer_node.id, 0, 0, 1, since, known_epoch or 0.0, delta))
+    push = wire.recv(sock)
+    changed = merge_set(push.entries)
+    acknowledge(neigh, version, push.epoch, push.version)
+    print(f"{len(delta)} of {len(peer_node.table)} entries sended to {neigh}, {changed} of {len(push.entries)} received entries changed my set")
+    return changed
+
+# Digest reconciliation with one neighbour over an open connection: compare the roots, then the bucket hashes,
+# then exchange the entries of the differing buckets in both directions. Returns the number of entries that changed here.
+def reconcile_digest(sock: socket.socket) -> int:
+    wire.send(sock, wire.DigestRoot(peer_node.id, peer_node.table.root()))
+    reply = wire.recv(sock)
+    if isinstance(reply, wire.DigestSame):
+        return 0
+    buckets = peer_node.table.differing(reply.buckets, reply.hashes, reply.offset, reply.span)
+    wire.send(sock, wire.DigestSync(peer_node.id, buckets, peer_node.table.bucket_entries(buckets)))
+    entries = wire.recv(sock).entries
+    changed = merge_set(entries)
+    print(f"{len(buckets)} buckets differed, {changed} of {len(entries)} received entries changed my set")
+    return changed
+
+# An exchange over UDP whose datagrams have not all arrived yet.
+class PendingExchange:
+    def __init__(self, peer: str, version: int = 0):
+        self.peer = peer
+        self.version = version  # our map version the exchange covers
+        self.parts = set()
+        self.changed = 0
+        self.reply = None  # responder side: our entries and version, taken when the first part arrived
+        self.started = time.monotonic()
+
+# Splits the entries into datagrams of at most MAX_DATAGRAM bytes. message(chunk, part, parts) builds the
+# message of one part, so every datagram is self-contained and can be merged on its own.
+def pack_datagrams(entries, message) -> list:
+    items = list(entries.items())
+    # first guess from the size of everything in one message, halved until every datagram fits
+    whole = len(wire.encode(message(dict(items), 0, 1)))
+    size = max(1, len(items) * MAX_DATAGRAM * 9 // (10 * whole))
+    while True:
+        chunks = [dict(items[i:i + size]) for i in range(0, len(items), size)] or [{}]
+        datagrams = [wire.encode(message(chunk, part, len(chunks))) for part, chunk in enumerate(chunks)]
+        if size == 1 or all(len(datagram) <= MAX_DATAGRAM for datagram in datagrams):
+            return datagrams
+        size = max(1, size // 2)
+
+# Datagrams that cannot be sent are dropped like lost ones.
+def send_datagrams(datagrams: list, address: tuple):
+    try:
+        for datagram in datagrams:
+            peer_node.udp_socket.sendto(datagram, address)
+    except OSError as e:
+        print(f"Datagram to {address} not sent: {e}")
+
+# Drops exchanges whose missing datagrams were lost; anti-entropy repairs it in a later round.
+def drop_stale_exchanges(pending: dict, max_age: float = 30.0):
+    now = time.monotonic()
+    for key in [key for key, exchange in pending.items() if now - exchange.started > max_age]:
+        del pending[key]
+
+# Delta push-pull over UDP: sends the entries the neighbour has not acknowledged in self-contained datagrams;
+# the neighbour answers once all of them arrived and the watermarks only move when its whole answer arrived.
+# Returns False when the delta is too large for datagrams and must go over TCP.
+def udp_exchange_delta(neigh: str) -> bool:
+    with peer_node.lock:
+        since = peer_node.received.get(neigh, 0)
+        known_epoch = peer_node.epochs.get(neigh)
+        acked = peer_node.acked.get(neigh, 0)
+        peer_node.round += 1
+        round_ = peer_node.round
+    delta, version = peer_node.table.changed_since(acked)
+    datagrams = pack_datagrams(delta, lambda chunk, part, parts: wire.GossipPull(peer_node.id, round_, part, parts, since, known_epoch or 0.0, chunk))
+    if len(datagrams) > MAX_ROUND_DATAGRAMS:
+        return False
+    with peer_node.lock:
+        drop_stale_exchanges(peer_node.rounds)
+        peer_node.rounds[(neigh, round_)] = PendingExchange(neigh, version)
+    send_datagrams(datagrams, peer_address(neigh))
+    print(f"{len(delta)} of {len(peer_node.table)} entries sended to {neigh} in {len(datagrams)} datagrams")
+    return True
+
+# Digest reconciliation over UDP starts with the root; the neighbour answers with its bucket hashes if they differ.
+def udp_reconcile_digest(neigh: str):
+    send_datagrams([wire.encode(wire.DigestRoot(peer_node.id, peer_node.table.root()))], peer_address(neigh))
+
+# Handles one datagram. Every datagram carries the id of the peer that sent it.
+def handle_datagram(data: memoryview, address: tuple, logger: logging.Logger):
+    msg = wire.decode(data)
+
+    if isinstance(msg, wire.GossipPull):
+        sender, round_, part, parts, since, known_epoch, entries = msg
+        with peer_node.lock:
+            drop_stale_exchanges(peer_node.pulls)
+            pending = peer_node.pulls.setdefault((sender, round_), PendingExchange(sender))
+            first = pending.reply is None
+        if first:
+            # our changes since the sender's last exchange, taken before merging so its own entries are not echoed
+            pending.reply = peer_node.table.changed_since(since if known_epoch == peer_node.epoch else 0)
+        merge_set(entries)
+        with peer_node.lock:
+            pending.parts.add(part)
+            complete = len(pending.parts) == parts and peer_node.pulls.pop((sender, round_), None) is not None
+        if complete:
+            mine, version = pending.reply
+            replies = pack_datagrams(mine, lambda chunk, part, parts: wire.GossipPush(peer_node.id, round_, part, parts, peer_node.epoch, version, chunk))
+            if len(replies) > MAX_ROUND_DATAGRAMS:
+                replies = [wire.encode(wire.GossipBulk(peer_node.id, round_))]
+            send_datagrams(replies, address)
+            peer_node.metrics.emit("map", size=len(peer_node.table))
+        return
+
+    if isinstance(msg, wire.GossipPush):
+        sender, round_, part, parts, epoch, their_version, entries = msg
+        changed = merge_set(entries)
+        with peer_node.lock:
+            pending = peer_node.rounds.get((sender, round_))
+            if pending is None:
+                return  # too late, the exchange was dropped
+            pending.parts.add(part)
+            pending.changed += changed
+            complete = len(pending.parts) == parts
+            if complete:
+                del peer_node.rounds[(sender, round_)]
+        if complete:
+            acknowledge(sender, pending.version, epoch, their_version)
+            log.logger.info(f"Round with {sender}: {pending.changed} entries changed, {len(peer_node.table)} entries")
+            peer_node.metrics.emit("round", changed=pending.changed, size=len(peer_node.table))
+            peer_node.metrics.emit("map", size=len(peer_node.table))
+        return
+
+    if isinstance(msg, wire.GossipBulk):
+        # the neighbour's answer does not fit in datagrams, catch up over TCP
+        sender, round_ = msg
+        with peer_node.lock:
+            peer_node.rounds.pop((sender, round_), None)
+        threading.Thread(target=exchange, args=(sender,), daemon=True).start()
+        return
+
+    if isinstance(msg, wire.DigestRoot):
+        if msg.root != peer_node.table.root():
+            replies = [wire.encode(wire.DigestBuckets(peer_node.id, offset, HASHES_PER_DATAGRAM,
+                                                      *peer_node.table.bucket_hashes(offset, HASHES_PER_DATAGRAM)))
+                       for offset in range(0, BUCKETS, HASHES_PER_DATAGRAM)]
+            send_datagrams(replies, address)
+        return
+
+    if isinstance(msg, wire.DigestBuckets):
+        sender = msg.sender
+        buckets = peer_node.table.differing(msg.buckets, msg.hashes, msg.offset, msg.span)
+        if not buckets:
+            return
+        entries = peer_node.table.bucket_entries(buckets)
+        # the bucket list travels in the first part only, so the neighbour answers once
+        datagrams = pack_datagrams(entries, lambda chunk, part, parts: wire.DigestSync(peer_node.id, buckets if part == 0 else [], chunk))
+        if len(datagrams) > MAX_ROUND_DATAGRAMS:
+            threading.Thread(target=exchange, args=(sender,), daemon=True).start()
+            return
+        send_datagrams(datagrams, address)
+        return
+
+    if isinstance(msg, wire.DigestSync):
+        sender, buckets, entries = msg
+        mine = peer_node.table.bucket_entries(buckets)  # taken before merging, the sender already has its own entries
+        merge_set(entries)
+        if mine:
+            send_datagrams(pack_datagrams(mine, lambda chunk, part, parts: wire.DigestEntries(peer_node.id, chunk)), address)
+        peer_node.metrics.emit("map", size=len(peer_node.table))
+        return
+
+    if isinstance(msg, wire.DigestEntries):
+        sender, entries = msg
+        changed = merge_set(entries)
+        log.logger.info(f"Digest round with {sender}: {changed} entries changed, {len(peer_node.table)} entries")
+        peer_node.metrics.emit("map", size=len(peer_node.table))
+        return
+
+    logger.info(f"Server: datagram from {address} [message = {type(msg).__name__}]")
+
+# Receives the gossip datagrams on the peer's port into one reusable buffer, one thread for all of them.
+def udp_run(logger: logging.Logger):
+    sock = peer_node.udp_socket
+    sock.settimeout(1)  # Allows checking shutdown_flag periodically
+    buffer = memoryview(bytearray(65535))
+    while not peer_node.shutdown_flag.is_set():
+        try:
+            size, address = sock.recvfrom_into(buffer)
+            handle_datagram(buffer[:size], address, logger)
+        except socket.timeout:
+            continue
+        except Exception as e:
+            logger.error(f"Error handling datagram: {e}")
+    sock.close()
+
 class PeerNode:
-    def __init__(self, hostname: str, port: int, neighboors):
+    def __init__(self, hostname: str, port: int, neighboors, metrics: Optional[Metrics] = None, reconcile: str = 'delta',
+                 fanout: int = 1, rate: float = 2, transport: str = 'tcp'):
         self.host = hostname
         self.port = port 
-        self.my_set = dict()
-        self.neighboors = set(map(str, neighboors))
+        self.id = f"{hostname}:{port}"
+        self.table = MembershipTable(DELTA)  # the peer map, with versions and digest of its entries
+        self.acked = dict()  # per neighbour, the map version it has acknowledged
+        self.received = dict()  # per neighbour, the version of its map we hold entries up to
+        self.epochs = dict()  # per neighbour, the start time it reported, changes when it restarts
+        self.epoch = time.time()
+        self.reconcile = reconcile
+        self.fanout = fanout  # neighbours contacted per round
+        self.rate = rate  # rounds per minute
+        self.detector = None  # SWIM failure detector, when enabled
+        self.transport = transport
+        self.udp_socket = None
+        self.round = 0
+        self.rounds = dict()  # our UDP exchanges waiting for the neighbour's answer, by (neighbour, round)
+        self.pulls = dict()  # UDP exchanges from neighbours whose datagrams did not all arrive yet
+        self.lock = threading.Lock()
+        self.neighboors = set(map(peer_id, neighboors))
+        self.metrics = metrics or Metrics()
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM) 
         self.shutdown_flag = threading.Event()
         
 class logs:
-    def __init__(self, hostname: str):
+    def __init__(self, hostname: str, port: int):
         self.host: str = hostname
         self.logger: logging.Logger = logging.getLogger("logfile")
         self.logger.setLevel(logging.INFO)
         try:
-            handler = logging.FileHandler(f"./{hostname}_peer.log", mode="a")
+            handler = logging.FileHandler(f"./{hostname}_{port}_peer.log", mode="a")
             formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
             handler.setFormatter(formatter)
             self.logger.addHandler(handler)
@@ -86,10 +338,9 @@ def server_run(logger: logging.Logger):
 
     initial_time: time.time
     initial_time = time.time()
-    peer_node.my_set[peer_node.host] = initial_time
-
-    for neigh in peer_node.neighboors:
-        peer_node.my_set[neigh] = initial_time # Dict indicating the current peer and the neighboors
+    peer_node.table.touch(peer_node.id, initial_time)
+    peer_node.table.merge({neigh: initial_time for neigh in peer_node.neighboors}, initial_time) # the current peer and the neighboors
+    peer_node.metrics.emit("map", size=len(peer_node.table))
 
     try:
         while not peer_node.shutdown_flag.is_set():
@@ -102,10 +353,10 @@ def server_run(logger: logging.Logger):
                 logger.info(f"Server: new connection from {client_address[0]}")  # Log the connection
                 # Handle the connection in a separate thread
                 threading.Thread(target=handle_connection, args=(client_socket, client_address, logger)).start()
-            except Exception as e:
-                logger.error(f"Error accepting connection: {e}")  # Log any connection errors
             except socket.timeout:
                 continue  # Check for shutdown_event after timeout
+            except Exception as e:
+                logger.error(f"Error accepting connection: {e}")  # Log any connection errors
     finally:
         print('Server is closed')
         server.close()
@@ -114,27 +365,47 @@ def server_run(logger: logging.Logger):
 # Handles communication with a single peer, processes received data, and updates the map.
 def handle_connection(client: socket.socket, client_address: str, logger: logging.Logger):
     try:
-        # Create input streams for the client connection
-        msg: str = client.recv(1024)
-        op, received_set = pickle.loads(msg)  # load the dict that came from another peer.
-
-        if op == 'pull':
-            merge_set(received_set)
-            dictionary_operations()
-            msg = pickle.dumps(('push', peer_node.my_set))
-            client.sendall(msg)
-            print(f'my current set after pull {peer_node.my_set}')
-            return
-        
-        if op == 'push':
-            merge_set(received_set)
-            print(f'after push my set {peer_node.my_set}')
-            return
-
-        logger.info(f"Server: message from host {client_address} [command = {received_set}]")
-        #print(f"{received_set} received from {client_address}")
-
-
+        reader = wire.FrameReader(client)
+        while True:
+            try:
+                msg = reader.read()  # decoded from the reader's buffer
+            except ConnectionError:
+                return
+            if msg is None:
+                return
+
+            if isinstance(msg, wire.GossipPull):
+                # our changes since the sender's last exchange, taken before merging so its own entries are not echoed
+                mine, version = peer_node.table.changed_since(msg.since if msg.known_epoch == peer_node.epoch else 0)
+                changed = merge_set(msg.entries)
+                wire.send(client, wire.GossipPush(peer_node.id, 0, 0, 1, peer_node.epoch, version, mine))
+                print(f'{changed} of {len(msg.entries)} received entries changed my set ({len(peer_node.table)} entries), {len(mine)} sent back')
+                peer_node.metrics.emit("map", size=len(peer_node.table))
+                continue
+
+            if isinstance(msg, wire.SwimPing) and peer_node.detector is not None:
+                wire.send(client, peer_node.detector.on_ping(msg))
+                continue
+
+            if isinstance(msg, wire.SwimPingReq) and peer_node.detector is not None:
+                wire.send(client, peer_node.detector.on_ping_req(msg))
+                continue
+
+            if isinstance(msg, wire.DigestRoot):
+                same = msg.root == peer_node.table.root()
+                reply = wire.DigestSame() if same else wire.DigestBuckets(peer_node.id, 0, BUCKETS, *peer_node.table.bucket_hashes())
+                wire.send(client, reply)
+                continue
+
+            if isinstance(msg, wire.DigestSync):
+                mine = peer_node.table.bucket_entries(msg.buckets)  # taken before merging, the sender already has its own entries
+                merge_set(msg.entries)
+                wire.send(client, wire.DigestEntries(peer_node.id, mine))
+                peer_node.metrics.emit("map", size=len(peer_node.table))
+                continue
+
+            logger.info(f"Server: message from host {client_address} [message = {type(msg).__name__}]")
+            #print(f"{received_set} received from {client_address}")
 
     except Exception as e:
         logging.error(f"Error handling connection: {e}")  # Log any errors during connection handling
@@ -149,31 +420,48 @@ def start_anti_entropy():
     """
     def anti_entropy_cycle():
         while True:
-            delay = poisson_delay(2)
+            delay = poisson_delay(peer_node.rate)
             time.sleep(delay)
             gossiping_message()
 
     threading.Thread(target=anti_entropy_cycle, daemon=True).start()
 
-# Sends the peer's current map to all neighbors as part of the Anti-Entropy algorithm.
-def gossiping_message(max_attempts = 3):
+# One Anti-Entropy round: a push-pull exchange with each of fanout random neighbours. By default the peers
+# exchange the entries changed since their last exchange; with --reconcile digest they compare map digests
+# and only exchange the differing buckets.
+def gossiping_message():
     dictionary_operations()  # Cleans up outdated entries and updates the timestamp
-    send_data = pickle.dumps(('pull', peer_node.my_set))
-    neigh = random.choice(list(peer_node.neighboors))
+    candidates = sorted(neigh for neigh in peer_node.neighboors if peer_node.detector is None or not peer_node.detector.is_dead(neigh))
+    neighbours = random.sample(candidates, min(peer_node.fanout, len(candidates)))
+    if peer_node.transport == 'udp':
+        # the answers arrive at udp_run, which logs the changes of every exchange
+        for neigh in neighbours:
+            if peer_node.reconcile == 'digest':
+                udp_reconcile_digest(neigh)
+            elif not udp_exchange_delta(neigh):
+                exchange(neigh)
+        return
+    changed = sum(exchange(neigh) for neigh in neighbours)
+    size = len(peer_node.table)
+    log.logger.info(f"Round: {len(neighbours)} neighbours, {changed} entries changed, {size} entries")
+    peer_node.metrics.emit("round", changed=changed, size=size)
+    peer_node.metrics.emit("map", size=size)
+
+# Push-pull exchange with one neighbour, retried a few times. Returns the number of entries that changed here.
+def exchange(neigh: str, max_attempts = 3) -> int:
     attempts = 0
     while True:
         try:
-            print(f"{peer_node.my_set} sended to {neigh}")
-            next: socket.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM) 
-            next.connect((neigh, peer_node.port))
-            next.sendall(send_data)
-            break
+            with socket.create_connection(peer_address(neigh), timeout=10) as next:
+                if peer_node.reconcile == 'digest':
+                    return reconcile_digest(next)
+                return exchange_delta(next, neigh)
         except Exception as e:
             attempts+=1
             print(f"Attempts {attempts} failed for {neigh}: {e}, trying again in 3 seconds ...")
-            time.sleep(3)
             if attempts > max_attempts:
-                break
+                return 0
+            time.sleep(3)
 
 #Captures the SIGINT signal (Ctrl+C) and starts the shutdown process for the server and connected peers.
 def signal_handler(sig, frame):
@@ -183,24 +471,45 @@ def signal_handler(sig, frame):
 signal.signal(signal.SIGINT, signal_handler)
 
 if __name__ == "__main__":
-    import sys
-
-    if len(sys.argv) <= 2:
-        print("Usage: python peer.py <hostname> <port> <ports_peer>")
-        sys.exit(1)  
-
-    hostname = sys.argv[1]  # Get hostname from arguments
-    port = 50000  # Get port from arguments
-    neighboors = sys.argv[2:]
-    log = logs(hostname)
-
-    peer_node = PeerNode(hostname= hostname, port= port, neighboors= neighboors)
+    parser = argparse.ArgumentParser(description="Anti-entropy gossip peer.")
+    parser.add_argument("hostname")
+    parser.add_argument("neighboors", nargs="+", help="host[:port] of each neighbour")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--metrics", default=None, help="append benchmark events to this JSON lines file")
+    parser.add_argument("--reconcile", choices=["delta", "digest"], default="delta",
+                        help="send the entries changed since the last exchange, or compare map digests and send the differing buckets")
+    parser.add_argument("--fanout", type=int, default=1, help="neighbours contacted per round")
+    parser.add_argument("--rate", type=float, default=2, help="rounds per minute (Poisson)")
+    parser.add_argument("--failure-detector", choices=["timeout", "swim"], default="timeout",
+                        help="drop entries older than DELTA seconds, or detect failures with SWIM")
+    parser.add_argument("--swim-period", type=float, default=1.0, help="SWIM protocol period in seconds")
+    parser.add_argument("--swim-k", type=int, default=3, help="members asked for indirect pings")
+    parser.add_argument("--transport", choices=["tcp", "udp"], default="tcp",
+                        help="gossip over UDP datagrams, TCP is then only used for large catch-up exchanges")
+    args = parser.parse_args()
+
+    hostname = args.hostname  # Get hostname from arguments
+    port = args.port  # Get port from arguments
+    neighboors = args.neighboors
+    log = logs(hostname, port)
+
+    peer_node = PeerNode(hostname= hostname, port= port, neighboors= neighboors, metrics= Metrics(args.metrics),
+                         reconcile= args.reconcile, fanout= args.fanout, rate= args.rate,
+                         transport= args.transport)
+
+    if args.failure_detector == "swim":
+        peer_node.detector = FailureDetector(peer_node.id, peer_node.table, request, period= args.swim_period,
+                                             indirect= args.swim_k, on_change= member_changed)
 
     print(f"New server @ host={hostname} - port={port}")  # Inform user of peer initialization
+    if peer_node.detector is not None:
+        peer_node.detector.start()
+    if peer_node.transport == 'udp':
+        peer_node.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        peer_node.udp_socket.bind((hostname, port))
+        threading.Thread(target=udp_run, args=(log.logger,), daemon=True).start()
     start_anti_entropy()
     server_run(log.logger)
-
-
-
-
-
+    if peer_node.detector is not None:
+        peer_node.detector.stop()  # no more probes once this peer stops answering them
+        log.logger.info(f"Failure detector members at shutdown: {peer_node.detector.status()}")
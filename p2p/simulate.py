@@ -0,0 +1,212 @@
+import argparse
+import heapq
+import math
+import random
+import sys
+import time
+from typing import List, Optional, Tuple
+from membership import MembershipTable
+
+'''
+Deterministic discrete-event simulator of the anti-entropy gossip in peer.py.
+
+Runs N virtual peers in one process on a simulated clock. Every peer keeps a MembershipTable and gossips like
+peer.py: rounds follow a Poisson process at --rate rounds per minute, each round refreshes the peer's own
+heartbeat, drops entries older than --delta and does a push-pull exchange with --fanout random neighbours.
+Messages take a random latency and are lost with probability --loss; crashed peers stop gossiping and answering.
+
+A full map per peer grows with N^2 over the cluster, so only the heartbeats of --tracked randomly chosen peers are
+simulated (all peers still gossip and forward them). That is enough to measure how fast an entry reaches the
+cluster and how long a crashed peer lingers, which is what --rate, --fanout and --delta trade off:
+    coverage  fraction of (live peer, live tracked peer) pairs where the peer holds the tracked peer's entry
+    stale     fraction of (live peer, crashed tracked peer) pairs where the crashed peer is still in the map
+The curve is printed as CSV (time, coverage, stale) every --sample simulated seconds.
+
+    python3 simulate.py --nodes 10000 --degree 4 --rate 2 --fanout 1 --duration 900 --crash 0.1 --crash-at 300
+'''
+
+ROUND, PULL, PUSH, CRASH, SAMPLE = range(5)
+EPOCH = 1e6  # heartbeat timestamps are simulated time + EPOCH, a timestamp of 0 means absent in the table
+
+
+class Simulation:
+    def __init__(self, nodes: int, degree: int, topology: str, rate: float, fanout: int, delta: float,
+                 loss: float, latency: Tuple[float, float], tracked: int, seed: int):
+        self.random = random.Random(seed)
+        self.nodes = nodes
+        self.rate = rate
+        self.fanout = fanout
+        self.latency = latency
+        self.loss = loss
+        self.names = [f"n{i}" for i in range(nodes)]
+        self.tracked = self.random.sample(range(nodes), min(tracked, nodes))
+        self.is_tracked = set(self.tracked)
+        self.tables = [MembershipTable(delta, with_digest=False) for _ in range(nodes)]
+        self.alive = bytearray([1]) * nodes
+        self.neighbours = self._topology(topology, degree)
+        self.events: List[tuple] = []
+        self.seq = 0  # tie breaker, keeps the event order deterministic
+        self.now = 0.0
+        self.messages = 0
+        self.entries_sent = 0
+
+    def _topology(self, kind: str, degree: int) -> List[List[int]]:
+        neighbours = [set() for _ in range(self.nodes)]
+        if kind == "ring":
+            for i in range(self.nodes):
+                for step in range(1, degree // 2 + 1):
+                    neighbours[i].add((i + step) % self.nodes)
+                    neighbours[(i + step) % self.nodes].add(i)
+        else:
+            # random graph, every peer registers with degree random peers and they know it back
+            for i in range(self.nodes):
+                for j in self.random.sample(range(self.nodes), min(degree, self.nodes - 1) + 1):
+                    if j != i and len(neighbours[i]) < degree:
+                        neighbours[i].add(j)
+                        neighbours[j].add(i)
+        for i in range(self.nodes):
+            neighbours[i].discard(i)
+        return [sorted(n) for n in neighbours]
+
+    def schedule(self, at: float, kind: int, *args):
+        self.seq += 1
+        heapq.heappush(self.events, (at, self.seq, kind, args))
+
+    def clock(self) -> float:
+        return EPOCH + self.now
+
+    def poisson_delay(self) -> float:
+        return -math.log(1.0 - self.random.random()) / (self.rate / 60)
+
+    def send(self, kind: int, src: int, dst: int, entries):
+        self.messages += 1
+        self.entries_sent += len(entries)
+        if self.random.random() < self.loss:
+            return
+        self.schedule(self.now + self.random.uniform(*self.latency), kind, src, dst, entries)
+
+    # Entries a peer sends in an exchange. Only tracked heartbeats exist, so this is the whole (tracked) map;
+    # the read-only snapshot is shared until the map changes.
+    def entries(self, node: int):
+        return self.tables[node].snapshot()
+
+    def start(self):
+        for node in range(self.nodes):
+            table = self.tables[node]
+            # like server_run: the peer itself and its neighbours start in the map
+            if node in self.is_tracked:
+                table.touch(self.names[node], self.clock())
+            table.merge({self.names[n]: self.clock() for n in self.neighbours[node] if n in self.is_tracked}, self.clock())
+            self.schedule(self.poisson_delay(), ROUND, node)
+
+    def gossip_round(self, node: int):
+        if not self.alive[node]:
+            return
+        table = self.tables[node]
+        table.expire(self.clock())  # dictionary_operations
+        if node in self.is_tracked:
+            table.touch(self.names[node], self.clock())
+        neighbours = self.neighbours[node]
+        for neigh in self.random.sample(neighbours, min(self.fanout, len(neighbours))):
+            self.send(PULL, node, neigh, self.entries(node))
+        self.schedule(self.now + self.poisson_delay(), ROUND, node)
+
+    def on_pull(self, src: int, dst: int, entries):
+        if not self.alive[dst]:
+            return
+        mine = self.entries(dst)
+        self.tables[dst].merge(entries, self.clock())  # merge_set
+        self.send(PUSH, dst, src, mine)
+
+    def on_push(self, src: int, dst: int, entries):
+        if self.alive[dst]:
+            self.tables[dst].merge(entries, self.clock())
+
+    def crash(self, fraction: float):
+        candidates = [node for node in range(self.nodes) if self.alive[node]]
+        for node in self.random.sample(candidates, int(len(candidates) * fraction)):
+            self.alive[node] = 0
+
+    # Coverage of live tracked entries and staleness of crashed ones over the live peers.
+    def measure(self) -> Tuple[float, float]:
+        live_tracked = [self.names[t] for t in self.tracked if self.alive[t]]
+        dead_tracked = [self.names[t] for t in self.tracked if not self.alive[t]]
+        held = stale = live_peers = 0
+        for node in range(self.nodes):
+            if not self.alive[node]:
+                continue
+            live_peers += 1
+            table = self.tables[node]
+            table.expire(self.clock())
+            present = table.snapshot()
+            held += sum(1 for name in live_tracked if name in present)
+            stale += sum(1 for name in dead_tracked if name in present)
+        coverage = held / (live_peers * len(live_tracked)) if live_tracked and live_peers else 1.0
+        staleness = stale / (live_peers * len(dead_tracked)) if dead_tracked and live_peers else 0.0
+        return coverage, staleness
+
+    def run(self, duration: float, sample: float, crash_fraction: float = 0.0, crash_at: Optional[float] = None, out=None):
+        self.start()
+        for i in range(int(duration / sample) + 1):
+            self.schedule(i * sample, SAMPLE)
+        if crash_fraction > 0 and crash_at is not None:
+            self.schedule(crash_at, CRASH, crash_fraction)
+
+        curve = []
+        while self.events:
+            at, _, kind, args = heapq.heappop(self.events)
+            if at > duration:
+                break
+            self.now = at
+            if kind == ROUND:
+                self.gossip_round(*args)
+            elif kind == PULL:
+                self.on_pull(*args)
+            elif kind == PUSH:
+                self.on_push(*args)
+            elif kind == CRASH:
+                self.crash(*args)
+            elif kind == SAMPLE:
+                coverage, staleness = self.measure()
+                curve.append((self.now, coverage, staleness))
+                if out is not None:
+                    print(f"{self.now:.1f},{coverage:.4f},{staleness:.4f}", file=out, flush=True)
+        return curve
+
+
+# First time the curve reaches a coverage level, and after the crash, first time the stale fraction drops below one.
+def summarize(curve, crash_at: Optional[float], level: float = 0.99, stale_level: float = 0.01) -> dict:
+    converged = next((t for t, coverage, _ in curve if coverage >= level), None)
+    cleared = None
+    if crash_at is not None:
+        cleared = next((t - crash_at for t, _, stale in curve if t > crash_at and stale <= stale_level), None)
+    return {f"time_to_{int(level * 100)}pct_coverage": converged, "time_to_clear_crashed": cleared}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Discrete-event simulation of the anti-entropy gossip.")
+    parser.add_argument("--nodes", type=int, default=10000)
+    parser.add_argument("--degree", type=int, default=4, help="neighbours per peer")
+    parser.add_argument("--topology", choices=["random", "ring"], default="random")
+    parser.add_argument("--rate", type=float, default=2, help="rounds per minute per peer")
+    parser.add_argument("--fanout", type=int, default=1)
+    parser.add_argument("--delta", type=float, default=90, help="seconds before an entry expires")
+    parser.add_argument("--loss", type=float, default=0.0, help="message loss probability")
+    parser.add_argument("--latency", type=float, nargs=2, default=[0.001, 0.05], metavar=("MIN", "MAX"))
+    parser.add_argument("--tracked", type=int, default=32, help="peers whose heartbeats are simulated")
+    parser.add_argument("--duration", type=float, default=900, help="simulated seconds")
+    parser.add_argument("--sample", type=float, default=10, help="simulated seconds between curve points")
+    parser.add_argument("--crash", type=float, default=0.0, help="fraction of the peers that crash")
+    parser.add_argument("--crash-at", type=float, default=None, help="simulated time of the crash")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    simulation = Simulation(args.nodes, args.degree, args.topology, args.rate, args.fanout, args.delta,
+                            args.loss, tuple(args.latency), args.tracked, args.seed)
+    started = time.time()
+    print("time,coverage,stale")
+    curve = simulation.run(args.duration, args.sample, args.crash, args.crash_at, out=sys.stdout)
+    summary = summarize(curve, args.crash_at)
+    summary.update(messages=simulation.messages, entries_sent=simulation.entries_sent,
+                   wall_seconds=round(time.time() - started, 2))
+    print(' '.join(f"{key}={value}" for key, value in summary.items()))
@@ -0,0 +1,232 @@
+import math
+import random
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+import wire
+from membership import MembershipTable
+
+'''
+SWIM failure detector (Das, Gupta and Motivala).
+
+Every protocol period a peer pings one member, picked in a shuffled round-robin order. Without an ack within the
+ping timeout it asks k other members to ping the target on its behalf (ping-req); if none of them gets an ack
+either before the period ends, the target becomes suspect. A suspect that does not refute the suspicion within
+the suspicion timeout (a few periods, growing with log N) is declared dead and removed from the peer map.
+A member refutes a suspicion about itself by raising its incarnation number and announcing itself alive.
+Membership updates (member, status, incarnation) are piggybacked on pings and acks, each one about log N times.
+
+Messages (see wire.py), sent with the request function given by the peer:
+    SwimPing(sender, updates)                     -> SwimAck(sender, updates)
+    SwimPingReq(sender, target, updates)          -> SwimAck(target, updates) or SwimNack(helper, updates)
+'''
+
+ALIVE, SUSPECT, DEAD = "alive", "suspect", "dead"
+Update = Tuple[str, str, int]  # (member, status, incarnation)
+Request = Callable[[str, tuple, float], Optional[tuple]]  # (member, message, timeout) -> reply
+
+
+class Member:
+    def __init__(self, status: str = ALIVE, incarnation: int = 0):
+        self.status = status
+        self.incarnation = incarnation
+        self.suspected_at: Optional[float] = None
+
+
+class FailureDetector:
+    def __init__(self, self_id: str, table: MembershipTable, request: Request, period: float = 1.0, indirect: int = 3,
+                 suspicion_mult: float = 3.0, retransmit_mult: float = 3.0, max_piggyback: int = 8,
+                 on_change: Optional[Callable[[str, str], None]] = None):
+        self.id = self_id
+        self.table = table
+        self.request = request
+        self.period = period
+        self.ping_timeout = period * 0.4
+        self.indirect = indirect  # members asked to probe a target that did not answer
+        self.suspicion_mult = suspicion_mult
+        self.retransmit_mult = retransmit_mult
+        self.max_piggyback = max_piggyback
+        self.on_change = on_change
+        self.incarnation = 0
+        self.members: Dict[str, Member] = {}
+        self.updates: Dict[str, Tuple[Update, int]] = {}  # newest update per member and how often it was sent
+        self.probe_order: List[str] = []
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._queue((self.id, ALIVE, self.incarnation))
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            started = time.monotonic()
+            self._sync_members()
+            target = self._next_target()
+            if target is not None and not self._probe(target):
+                with self.lock:
+                    member = self.members[target]
+                    incarnation = member.incarnation
+                self.apply((target, SUSPECT, incarnation))
+            self._expire_suspects()
+            self.stop_event.wait(max(0.0, self.period - (time.monotonic() - started)))
+
+    # Members learned through the gossip map join the detector as alive.
+    def _sync_members(self):
+        names = self.table.snapshot()
+        with self.lock:
+            for name in names:
+                if name != self.id and name not in self.members:
+                    self.members[name] = Member()
+
+    def _live(self) -> List[str]:
+        return [name for name, member in self.members.items() if member.status != DEAD]
+
+    # Randomized round-robin: every live member is probed once per pass over a freshly shuffled list.
+    def _next_target(self) -> Optional[str]:
+        with self.lock:
+            while self.probe_order:
+                name = self.probe_order.pop()
+                if self.members[name].status != DEAD:
+                    return name
+            self.probe_order = self._live()
+            random.shuffle(self.probe_order)
+            return self.probe_order.pop() if self.probe_order else None
+
+    # Direct ping, then indirect pings through k other members. True when the target answered either way.
+    def _probe(self, target: str) -> bool:
+        if self.ping(target, self.ping_timeout):
+            return True
+        with self.lock:
+            helpers = [name for name in self._live() if name != target]
+        helpers = random.sample(helpers, min(self.indirect, len(helpers)))
+        if not helpers:
+            return False
+        acked = threading.Event()
+        timeout = self.period - self.ping_timeout
+
+        def ask(helper: str):
+            reply = self.request(helper, wire.SwimPingReq(self.id, target, self.piggyback()), timeout)
+            if reply is not None:
+                self.receive(reply.updates)
+                if isinstance(reply, wire.SwimAck):
+                    acked.set()
+
+        for helper in helpers:
+            threading.Thread(target=ask, args=(helper,), daemon=True).start()
+        return acked.wait(timeout)
+
+    def ping(self, target: str, timeout: float) -> bool:
+        reply = self.request(target, wire.SwimPing(self.id, self.piggyback()), timeout)
+        if reply is None:
+            return False
+        self.receive(reply.updates)
+        return isinstance(reply, wire.SwimAck)
+
+    def suspicion_timeout(self) -> float:
+        return self.suspicion_mult * max(1.0, math.log(len(self.members) + 1)) * self.period
+
+    def _expire_suspects(self):
+        now = time.monotonic()
+        with self.lock:
+            expired = [(name, member.incarnation) for name, member in self.members.items()
+                       if member.status == SUSPECT and now - member.suspected_at > self.suspicion_timeout()]
+        for name, incarnation in expired:
+            self.apply((name, DEAD, incarnation))
+
+    def _queue(self, update: Update):
+        self.updates[update[0]] = (update, 0)
+
+    # Updates to piggyback on an outgoing message, the least sent first. An update is dropped once it was sent
+    # retransmit_mult * log(N + 1) times.
+    def piggyback(self) -> List[Update]:
+        with self.lock:
+            limit = math.ceil(self.retransmit_mult * math.log(len(self.members) + 2))
+            chosen = sorted(self.updates.values(), key=lambda item: item[1])[:self.max_piggyback]
+            for update, sent in chosen:
+                if sent + 1 >= limit:
+                    del self.updates[update[0]]
+                else:
+                    self.updates[update[0]] = (update, sent + 1)
+            return [update for update, _ in chosen]
+
+    def receive(self, updates: List[Update]):
+        for update in updates:
+            self.apply(update)
+
+    # Applies one membership update following the SWIM precedence rules:
+    # alive overrides a lower incarnation, suspect overrides alive of the same or a lower incarnation,
+    # dead overrides everything but a later alive. Accepted updates are gossiped further.
+    def apply(self, update: Update):
+        name, status, incarnation = update
+        changed = None
+        with self.lock:
+            if name == self.id:
+                if status != ALIVE and incarnation >= self.incarnation:
+                    self.incarnation = incarnation + 1  # refute the suspicion
+                    self._queue((self.id, ALIVE, self.incarnation))
+                return
+            member = self.members.get(name)
+            previous = None if member is None else member.status
+            if member is None:
+                member = self.members[name] = Member(status, incarnation)
+                accepted = True
+            elif status == ALIVE:
+                accepted = incarnation > member.incarnation
+            elif status == SUSPECT:
+                accepted = member.status != DEAD and (incarnation > member.incarnation or
+                                                      (member.status == ALIVE and incarnation == member.incarnation))
+            else:
+                accepted = member.status != DEAD and incarnation >= member.incarnation
+            if not accepted:
+                return
+            member.status, member.incarnation = status, incarnation
+            member.suspected_at = time.monotonic() if status == SUSPECT else None
+            self._queue(update)
+            if status != previous:
+                changed = status
+
+        if changed == DEAD:
+            self.table.mark_dead(name)
+        elif changed == ALIVE:
+            self.table.revive(name, time.time())
+        if changed is not None and self.on_change is not None:
+            self.on_change(name, changed)
+
+    # Server side of a ping. A sender this peer believes dead is told so, so that it refutes and rejoins.
+    def on_ping(self, ping: wire.SwimPing) -> wire.SwimAck:
+        sender = ping.sender
+        self.receive(ping.updates)
+        with self.lock:
+            member = self.members.get(sender)
+            if member is None:
+                self.members[sender] = Member()
+        if member is None:
+            self.table.revive(sender, time.time())
+        reply = self.piggyback()
+        if member is not None and member.status == DEAD:
+            reply.append((sender, DEAD, member.incarnation))
+        return wire.SwimAck(self.id, reply)
+
+    # Server side of a ping-req: probes the target for the sender and reports whether it answered.
+    def on_ping_req(self, ping_req: wire.SwimPingReq):
+        self.receive(ping_req.updates)
+        if self.ping(ping_req.target, self.ping_timeout):
+            return wire.SwimAck(ping_req.target, self.piggyback())
+        return wire.SwimNack(self.id, self.piggyback())
+
+    def is_dead(self, name: str) -> bool:
+        with self.lock:
+            member = self.members.get(name)
+            return member is not None and member.status == DEAD
+
+    def status(self) -> Dict[str, int]:
+        with self.lock:
+            counts = {ALIVE: 0, SUSPECT: 0, DEAD: 0}
+            for member in self.members.values():
+                counts[member.status] += 1
+            return counts
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# the modules are imported the way the peers import them: wire and common from the repository root, the others
+# from the directory of their algorithm
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "TOM"), os.path.join(ROOT, "token ring"), os.path.join(ROOT, "p2p")]
@@ -0,0 +1,47 @@
+from digest import BucketDigest
+
+
+def filled(entries: dict) -> BucketDigest:
+    digest = BucketDigest(quantum=10)
+    for key, stamp in entries.items():
+        digest.add(key, stamp)
+    return digest
+
+
+ENTRIES = {f"10.0.0.{i}:5000": 100.0 for i in range(40)}
+
+
+def test_same_members_in_the_same_quantum_match():
+    ours = filled(ENTRIES)
+    theirs = filled({key: stamp + 5 for key, stamp in ENTRIES.items()})
+    assert ours.root() == theirs.root()
+    assert ours.differing(*theirs.sparse()) == []
+
+
+def test_only_the_changed_buckets_differ():
+    ours, theirs = filled(ENTRIES), filled(ENTRIES)
+    theirs.remove("10.0.0.3:5000", 100.0)
+    theirs.add("10.0.0.3:5000", 130.0)
+    theirs.add("10.0.0.99:5000", 100.0)
+    assert ours.root() != theirs.root()
+    changed = sorted({ours.bucket("10.0.0.3:5000"), ours.bucket("10.0.0.99:5000")})
+    assert ours.differing(*theirs.sparse()) == changed
+    assert set(ours.keys(changed)) >= {"10.0.0.3:5000"}
+
+
+def test_removing_an_entry_restores_the_hash():
+    digest = filled(ENTRIES)
+    root = digest.root()
+    digest.add("x:1", 100.0)
+    digest.remove("x:1", 100.0)
+    assert digest.root() == root
+
+
+def test_sparse_leaves_out_empty_buckets_and_covers_a_span():
+    digest = filled({"a:1": 1.0})
+    index = digest.bucket("a:1")
+    assert digest.sparse() == ([index], [digest.hashes[index]])
+    assert digest.sparse(index + 1, 10) == ([], [])
+    empty = BucketDigest(quantum=10)
+    assert empty.differing(*digest.sparse(index, 1), offset=index, span=1) == [index]
+    assert empty.differing(*digest.sparse(index + 1, 10), offset=index + 1, span=10) == []
@@ -0,0 +1,62 @@
+import threading
+
+from flow import CreditWindow
+
+
+def test_window_is_shared_out_per_sender():
+    assert CreditWindow(["a", "b", "c", "d"], 100).window == 25
+    assert CreditWindow(["a", "b"], 1).window == 1
+
+
+def test_sender_waits_for_the_slowest_receiver():
+    credit = CreditWindow(["a", "b"], 8)
+    assert credit.wait(4, timeout=0)
+    credit.consume(4)
+    assert not credit.wait(1, timeout=0)
+    credit.update("a", 4)
+    assert not credit.wait(1, timeout=0)
+    assert credit.outstanding() == 4
+    credit.update("b", 2)
+    assert credit.wait(2, timeout=0)
+    assert not credit.wait(3, timeout=0)
+    assert credit.outstanding() == 2
+
+
+def test_old_reports_do_not_take_credit_back():
+    credit = CreditWindow(["a"], 4)
+    credit.consume(4)
+    credit.update("a", 3)
+    credit.update("a", 1)
+    assert credit.outstanding() == 1
+
+
+def test_message_larger_than_the_window_goes_out_alone():
+    credit = CreditWindow(["a"], 4)
+    assert credit.wait(10, timeout=0)
+    credit.consume(10)
+    assert not credit.wait(1, timeout=0)
+    credit.update("a", 10)
+    assert credit.wait(10, timeout=0)
+
+
+def test_failed_receiver_releases_and_rejoined_one_starts_full():
+    credit = CreditWindow(["a", "b"], 4)
+    credit.consume(2)
+    credit.update("a", 2)
+    assert not credit.wait(1, timeout=0)
+    credit.remove_peer("b")
+    assert credit.wait(2, timeout=0)
+    credit.add_peer("b")
+    assert credit.outstanding() == 0
+    assert credit.wait(2, timeout=0)
+
+
+def test_report_wakes_a_waiting_sender():
+    credit = CreditWindow(["a"], 2)
+    credit.consume(2)
+    result = []
+    waiter = threading.Thread(target=lambda: result.append(credit.wait(1, timeout=5)))
+    waiter.start()
+    credit.update("a", 1)
+    waiter.join()
+    assert result == [True]
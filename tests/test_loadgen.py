@@ -0,0 +1,18 @@
+from loadgen import trace_rate
+
+
+def write_trace(tmp_path, offsets) -> str:
+    path = tmp_path / "trace.tsv"
+    path.write_text(''.join(f"{offset:.6f}\tadd 1 2\n" for offset in offsets))
+    return str(path)
+
+
+def test_trace_rate_counts_the_intervals_between_arrivals(tmp_path):
+    assert trace_rate(write_trace(tmp_path, [0.0, 0.5, 1.0])) == 2.0
+    assert trace_rate(write_trace(tmp_path, [10.0, 10.5, 11.0])) == 2.0
+    assert trace_rate(write_trace(tmp_path, [0.0, 0.5, 1.0]), speed=2) == 4.0
+
+
+def test_trace_without_an_interval_has_no_rate(tmp_path):
+    assert trace_rate(write_trace(tmp_path, [])) == 0.0
+    assert trace_rate(write_trace(tmp_path, [3.0])) == 0.0
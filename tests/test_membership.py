@@ -0,0 +1,55 @@
+from membership import MembershipTable
+
+
+def test_heap_and_change_log_stay_bounded_without_expiry():
+    table = MembershipTable(delta=90)
+    names = [f"10.0.0.{i}:50000" for i in range(51)]
+    for round_ in range(1, 20001):
+        table.touch(names[round_ % len(names)], float(round_))
+    assert len(table) == 51
+    assert len(table.heap) <= 4 * len(table) + 1024
+    assert len(table.changes) <= 4 * len(table) + 1024
+    assert table.changed_since(0)[0] == {name: table.snapshot()[name] for name in names}
+
+
+def test_merge_keeps_the_newest_stamp():
+    table = MembershipTable(delta=90)
+    table.touch("a:1", 100.0)
+    table.touch("b:1", 100.0)
+    changed = table.merge({"a:1": 50.0, "b:1": 150.0, "c:1": 120.0, "d:1": 5.0}, now=160.0)
+    assert changed == 2
+    assert dict(table.snapshot()) == {"a:1": 100.0, "b:1": 150.0, "c:1": 120.0}
+
+
+def test_merge_does_not_bring_back_a_dead_peer():
+    table = MembershipTable(delta=90)
+    table.touch("a:1", 100.0)
+    table.mark_dead("a:1")
+    assert table.merge({"a:1": 110.0}, now=110.0) == 0
+    assert "a:1" not in table.snapshot()
+    table.revive("a:1", 120.0)
+    assert table.snapshot()["a:1"] == 120.0
+
+
+def test_entries_expire_oldest_first_and_refreshed_ones_stay():
+    table = MembershipTable(delta=10)
+    for name, stamp in (("c:1", 3.0), ("a:1", 1.0), ("b:1", 2.0), ("d:1", 8.0)):
+        table.touch(name, stamp)
+    table.touch("a:1", 9.0)
+    assert table.expire(now=13.5) == ["b:1", "c:1"]
+    assert table.expire(now=13.5) == []
+    assert sorted(table.snapshot()) == ["a:1", "d:1"]
+
+
+def test_changed_since_returns_only_later_changes():
+    table = MembershipTable(delta=90)
+    table.touch("a:1", 1.0)
+    table.touch("b:1", 1.0)
+    _, version = table.changed_since(0)
+    table.touch("a:1", 2.0)
+    table.touch("c:1", 2.0)
+    table.touch("a:1", 3.0)
+    delta, latest = table.changed_since(version)
+    assert delta == {"a:1": 3.0, "c:1": 2.0}
+    assert latest == version + 3
+    assert table.changed_since(latest) == ({}, latest)
@@ -0,0 +1,167 @@
+import pytest
+
+from ordering import LamportEngine, OrderConflict, SequencerEngine
+
+PEERS = ["a", "b", "c"]
+
+
+def test_fixed_sequencer_orders_and_delivers():
+    engine = SequencerEngine(PEERS, "a")
+    engine.receive("b", 1, ["x"])
+    engine.receive("c", 1, ["y"])
+    first, keys, token = engine.assign()
+    assert (first, keys, token) == (1, [("b", 1), ("c", 1)], None)
+    assert engine.add_order("a", first, keys) == [(1, "b", ["x"]), (1, "c", ["y"])]
+    assert engine.assign() is None
+
+
+def test_duplicates_are_ignored():
+    engine = SequencerEngine(PEERS, "b")
+    engine.receive("c", 1, ["x"])
+    assert engine.add_order("a", 1, [("c", 1)]) == [(1, "c", ["x"])]
+    assert engine.add_order("a", 1, [("c", 1)]) == []
+    assert engine.receive("c", 1, ["x"]) == []
+    assert engine.held_words() == 0
+    assert engine.add_repair("a", 2, [(1, "c", 1, ["x"])]) == []
+    assert engine.missing() is None
+
+
+def test_conflicting_assignment_raises():
+    engine = SequencerEngine(PEERS, "b")
+    engine.add_order("a", 1, [("c", 1), ("c", 2)])
+    with pytest.raises(OrderConflict):
+        engine.add_order("c", 2, [("a", 1)])
+    with pytest.raises(OrderConflict):
+        engine.add_order("c", 3, [("c", 1)])
+    assert engine.assigned == {1: ("c", 1), 2: ("c", 2)}
+    engine.receive("c", 1, ["x"])
+    with pytest.raises(OrderConflict):
+        engine.add_repair("c", 2, [(1, "a", 5, ["y"])])
+
+
+def test_new_holder_syncs_before_assigning():
+    engine = SequencerEngine(PEERS, "b")
+    engine.add_order("a", 1, [("a", 1)])
+    engine.receive("c", 1, ["late"])
+    engine.remove_peer("a")
+    assert engine.holder == "b"
+    assert engine.sync_requests() == (1, ["c"])
+    assert engine.assign() is None
+    # c saw assignments 2 and 3 from the failed holder that never reached b
+    delivered = engine.add_repair("c", 4, [(1, "a", 1, ["first"]), (2, "c", 1, ["late"]), (3, "a", 2, [])], sync=True)
+    assert delivered == [(1, "a", ["first"]), (1, "c", ["late"])]
+    assert engine.sync_requests() == (3, [])
+    engine.receive("c", 2, ["new"])
+    assert engine.assign() == (4, [("c", 2)], None)
+    assert engine.add_order("b", 4, [("c", 2)]) == []
+    assert engine.missing() == 3
+    assert engine.add_repair("c", 5, [(3, "a", 2, ["lost"])]) == [(2, "a", ["lost"]), (2, "c", ["new"])]
+
+
+def test_sync_ends_when_the_peer_fails():
+    engine = SequencerEngine(PEERS, "b")
+    engine.receive("c", 1, ["x"])
+    engine.remove_peer("a")
+    engine.remove_peer("c")
+    assert engine.sync_requests() == (1, [])
+    assert engine.assign() == (1, [("c", 1)], None)
+
+
+def test_rotating_token_passes_after_block():
+    engine = SequencerEngine(PEERS, "a", block=2)
+    for clock in (1, 2, 3):
+        engine.receive("b", clock, ["w"])
+    first, keys, token = engine.assign()
+    assert (first, len(keys), token) == (1, 2, ("b", 3))
+    assert engine.assign() is None
+    engine.take_token("b", 3)  # an old token on another connection is ignored
+    assert engine.holder == "b"
+    engine.take_token("a", 9)
+    assert (engine.holder, engine.next_seq) == ("a", 9)
+
+
+def test_words_of_a_failed_sender_nobody_ordered_are_dropped():
+    engine = SequencerEngine(PEERS, "b")
+    engine.receive("c", 1, ["orphan"])
+    engine.receive("a", 1, ["live"])
+    assert engine.missing() == 1
+    engine.add_repair("a", 1, [])  # c is still alive, a may order its words later
+    assert engine.missing() == 1
+    engine.remove_peer("c")
+    engine.add_repair("a", 1, [])
+    assert list(engine.unordered) == [("a", 1)]
+    assert ("c", 1) not in engine.data
+    # the holder ordered them after all: they are asked for again like any other gap
+    engine.add_order("a", 1, [("c", 1)])
+    assert engine.missing() == 1
+    assert engine.add_repair("a", 2, [(1, "c", 1, ["orphan"])]) == [(1, "c", ["orphan"])]
+
+
+def test_lamport_rejoined_peer_holds_back_from_its_first_clock():
+    engine = LamportEngine(PEERS)
+    engine.remove_peer("c")
+    engine.add_peer("c", 100)
+    engine.receive("a", 5, ["x"])
+    assert engine.receive("b", 6) == [(5, "a", ["x"])]
+    engine.receive("a", 100, ["y"])
+    assert engine.receive("b", 101) == []
+    assert not engine.delivered_through(99)
+    assert engine.receive("c", 101) == [(100, "a", ["y"])]
+    assert engine.delivered_through(99)
+
+
+def test_lamport_resume_drops_what_the_log_delivered():
+    engine = LamportEngine(PEERS)
+    engine.pause()
+    engine.receive("a", 3, ["logged"])
+    engine.receive("b", 4, ["new"])
+    engine.receive("a", 5)
+    assert engine.receive("c", 9) == []
+    assert engine.resume((3, "a")) == [(4, "b", ["new"])]
+    assert engine.clock == 10
+    assert engine.held_words() == 0
+
+
+def test_lamport_head_waits_for_every_peer_to_pass_it():
+    engine = LamportEngine(PEERS)
+    assert engine.receive("a", 1, ["x"]) == []
+    assert engine.receive("b", 2) == []
+    assert engine.receive("c", 1) == []
+    assert engine.receive("c", 2) == [(1, "a", ["x"])]
+
+
+def test_lamport_ties_are_broken_by_sender():
+    engine = LamportEngine(PEERS)
+    engine.receive("b", 1, ["from b"])
+    engine.receive("a", 1, ["from a"])
+    engine.receive("c", 2)
+    assert engine.receive("b", 2) == [(1, "a", ["from a"])]
+    assert engine.receive("a", 2) == [(1, "b", ["from b"])]
+
+
+def test_lamport_ack_advances_delivery():
+    engine = LamportEngine(PEERS)
+    engine.receive("a", 1, ["x"])
+    engine.receive("b", 2, ["y"])
+    assert engine.held_words() == 2
+    assert engine.receive("c", 3) == [(1, "a", ["x"])]
+    assert engine.receive("a", 3) == [(2, "b", ["y"])]
+    assert engine.held_words() == 0
+
+
+def test_lamport_batch_takes_its_clock_span():
+    engine = LamportEngine(PEERS)
+    assert engine.tick(3) == 1
+    assert engine.tick() == 4
+    engine.receive("a", 5, ["x", "y", "z"], span=3)
+    assert engine.latest["a"] == 7
+    engine.receive("b", 6)
+    assert engine.receive("c", 6) == [(5, "a", ["x", "y", "z"])]
+    assert engine.tick() > 7
+
+
+def test_lamport_removed_peer_unblocks_delivery():
+    engine = LamportEngine(PEERS)
+    engine.receive("a", 1, ["x"])
+    engine.receive("b", 2)
+    assert engine.remove_peer("c") == [(1, "a", ["x"])]
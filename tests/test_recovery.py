@@ -0,0 +1,54 @@
+import time
+
+from recovery import ELECTION_RETRY, TokenMonitor
+
+
+# A monitor that saw token seq and then lost it for longer than the timeout.
+def lost_token(peer_id: str, seq: int = 0) -> TokenMonitor:
+    monitor = TokenMonitor(peer_id)
+    monitor.token_received(seq)
+    monitor.token_forwarded()
+    monitor.last_seen = time.monotonic() - 10 * monitor.timeout()
+    return monitor
+
+
+def test_one_election_at_a_time():
+    monitor = lost_token("b:1")
+    assert monitor.start_election() is not None
+    assert monitor.start_election() is None
+
+
+def test_two_own_elections_win_once():
+    monitor = lost_token("b:1")
+    first = monitor.start_election()
+    monitor.election_started -= 2 * ELECTION_RETRY * monitor.timeout()  # the first one looked lost, start again
+    second = monitor.start_election()
+    assert (first.seq, second.seq) == (0, 0)
+    results = [monitor.on_election(msg.candidate, msg.seq) for msg in (first, second)]
+    assert results == [("won", 1), ("drop", None)]
+    assert monitor.token_received(1)
+
+
+def test_highest_candidate_wins():
+    low, high = lost_token("a:1"), lost_token("b:1")
+    action, msg = low.on_election(*high.start_election()[2:])
+    assert action == "forward" and msg.candidate == "b:1"
+    assert high.on_election(msg.candidate, msg.seq) == ("won", 1)
+
+
+def test_second_token_with_the_same_number_is_dropped():
+    monitor = TokenMonitor("a:1")
+    assert monitor.token_received(3)
+    assert not monitor.token_received(3)
+    assert not monitor.token_received(2)
+    monitor.token_forwarded()
+    assert monitor.token_received(3)
+    assert monitor.last_rotation is not None
+
+
+def test_live_token_stops_an_election():
+    monitor = TokenMonitor("a:1")
+    monitor.token_received(0)
+    monitor.token_forwarded()
+    assert monitor.start_election() is None
+    assert monitor.on_election("b:1", 0) == ("drop", None)
@@ -0,0 +1,55 @@
+from membership import MembershipTable
+from swim import ALIVE, DEAD, SUSPECT, FailureDetector
+
+
+def detector(changes=None) -> FailureDetector:
+    table = MembershipTable(delta=90)
+    table.touch("b:1", 100.0)
+    on_change = None if changes is None else lambda name, status: changes.append((name, status))
+    return FailureDetector("a:1", table, request=lambda member, message, timeout: None, on_change=on_change)
+
+
+def test_unrefuted_suspect_is_declared_dead():
+    changes = []
+    swim = detector(changes)
+    swim.apply(("b:1", ALIVE, 0))
+    swim.apply(("b:1", SUSPECT, 0))
+    swim._expire_suspects()
+    assert not swim.is_dead("b:1")
+    swim.members["b:1"].suspected_at -= swim.suspicion_timeout() + 1
+    swim._expire_suspects()
+    assert swim.is_dead("b:1")
+    assert "b:1" not in swim.table.snapshot()
+    assert changes == [("b:1", ALIVE), ("b:1", SUSPECT), ("b:1", DEAD)]
+
+
+def test_only_a_higher_incarnation_refutes_a_suspicion():
+    swim = detector()
+    swim.apply(("b:1", ALIVE, 1))
+    swim.apply(("b:1", SUSPECT, 1))
+    swim.apply(("b:1", ALIVE, 1))
+    assert swim.members["b:1"].status == SUSPECT
+    swim.apply(("b:1", SUSPECT, 0))
+    swim.apply(("b:1", ALIVE, 2))
+    assert (swim.members["b:1"].status, swim.members["b:1"].incarnation) == (ALIVE, 2)
+    assert swim.members["b:1"].suspected_at is None
+
+
+def test_dead_overrides_all_but_a_later_alive():
+    swim = detector()
+    swim.apply(("b:1", ALIVE, 3))
+    swim.apply(("b:1", DEAD, 3))
+    swim.apply(("b:1", SUSPECT, 4))
+    assert swim.is_dead("b:1")
+    swim.apply(("b:1", ALIVE, 4))
+    assert swim.members["b:1"].status == ALIVE
+    assert swim.table.snapshot()["b:1"] > 100.0
+
+
+def test_peer_refutes_a_suspicion_about_itself():
+    swim = detector()
+    swim.apply(("a:1", SUSPECT, 0))
+    assert swim.incarnation == 1
+    assert ("a:1", ALIVE, 1) in swim.piggyback()
+    swim.apply(("a:1", SUSPECT, 0))  # an old suspicion is already refuted
+    assert swim.incarnation == 1
@@ -0,0 +1,91 @@
+import pytest
+
+import wire
+
+MESSAGES = [
+    wire.RingToken("main", 2, 7),
+    wire.RingShut(),
+    wire.CalcRequest([1, 2, 0], [3, -4, 5], [2**31 - 1, -2**31, 0]),
+    wire.CalcReply([1, 0], [2**63 - 1, -2**63]),
+    wire.CalcStatsReply("served 3"),
+    wire.GossipPull("a:1", 1, 0, 2, 9, 1.5, {"a:1": 1.0, "b:2": 2.5}),
+    wire.GossipPush("a:1", 1, 0, 1, 0.0, 3, {}),
+    wire.DigestBuckets("a:1", 128, 128, [130, 255], [1, 2**64 - 1]),
+    wire.DigestSync("a:1", [3, 4], {"ação:1": 3.0}),
+    wire.SwimPing("a:1", [("b:2", "alive", 3), ("c:3", "suspect", 0)]),
+    wire.SwimAck("a:1", []),
+    wire.TomData("a:1", 12, ["Lisboa", "", "Évora"]),
+    wire.TomData("a:1", 12, []),
+    wire.TomData("a:1", 12, [""]),
+    wire.TomAck("", 0),
+    wire.TomOrder("a:1", 5, [("a:1", 12), ("b:2", 13)]),
+    wire.TomRepair("a:1", 7, 1, [(5, "a:1", 12, ["x", "y"]), (6, "b:2", 13, [])]),
+    wire.TomCatchupReply(10, None, 1, 2, 300),
+    wire.TomCatchupReply(10, "", 1, 2, 300),
+    wire.TomCatchupReply(10, "b:2", 1, 2, 300),
+    wire.TomRecord(12, "a:1", ["x"]),
+]
+
+
+@pytest.mark.parametrize("msg", MESSAGES, ids=lambda msg: type(msg).__name__)
+def test_round_trip(msg):
+    data = wire.encode(msg)
+    decoded = wire.decode(data)
+    assert type(decoded) is type(msg)
+    assert decoded == msg
+    assert wire.decode(memoryview(bytearray(data))) == msg
+
+
+@pytest.mark.parametrize("msg", MESSAGES, ids=lambda msg: type(msg).__name__)
+def test_frame_is_length_prefixed_message(msg):
+    framed = wire.frame(msg)
+    assert wire.HEADER.unpack_from(framed) == (len(framed) - wire.HEADER.size,)
+    assert framed[wire.HEADER.size:] == wire.encode(msg)
+
+
+def test_bytes_are_a_view_into_the_buffer():
+    buffer = bytearray(wire.encode(wire.DigestRoot("a:1", b"\x00root")))
+    root = wire.decode(memoryview(buffer)).root
+    assert isinstance(root, memoryview) and bytes(root) == b"\x00root"
+
+
+@pytest.mark.parametrize("msg", [
+    wire.TomAck("a\0b", 1),
+    wire.TomData("a:1", 1, ["x\0y"]),
+    wire.TomData("a\0", 1, ["x"]),
+    wire.TomOrder("a:1", 1, [("b\0", 2)]),
+    wire.GossipPush("a:1", 1, 0, 1, 0.0, 3, {"a\0b": 1.0}),
+    wire.TomCatchupReply(1, "x\0", 1, 2, 3),
+])
+def test_nul_in_a_string_is_refused(msg):
+    with pytest.raises(ValueError):
+        wire.encode(msg)
+
+
+def test_string_count_is_checked():
+    data = bytearray(wire.encode(wire.TomData("a:1", 1, ["x", "y"])))
+    with pytest.raises(ValueError):
+        wire.decode(data + b"\0z")
+    with pytest.raises(ValueError):
+        wire.decode(data[:-4])  # one string less
+    column = bytearray(wire.encode(wire.TomOrder("a:1", 1, [("b", 2), ("c", 3)])))
+    column[column.index(b"b\0c")] = 0
+    with pytest.raises(ValueError):
+        wire.decode(column)
+
+
+def test_trailing_bytes_and_unknown_codes_are_refused():
+    with pytest.raises(ValueError):
+        wire.decode(wire.encode(wire.RingShut()) + b"x")
+    with pytest.raises(ValueError):
+        wire.decode(bytes([200]))
+    with pytest.raises(ValueError):
+        wire.message(wire.TomAck.CODE, "Duplicate")
+
+
+def test_columns_of_any_count_round_trip():
+    for count in range(wire.MAX_COLUMN_STRUCTS + 10):
+        msg = wire.CalcReply([1] * count, list(range(-count, count, 2)))
+        assert wire.decode(wire.encode(msg)) == msg
+    with pytest.raises(ValueError):
+        wire.decode(wire.encode(wire.CalcReply([1], [2])) + b"x")
@@ -0,0 +1,154 @@
+import socket
+import threading
+import time
+from typing import List, Optional, Tuple
+import wire
+
+INVALID = "Invalid message format"
+OP_CODES = {op: code for code, op in enumerate(wire.CALC_OPS, 1)}
+I32 = 2 ** 31  # operands travel as 32-bit integers
+
+# Parses an "op x y" request into the (operation code, x, y) of a wire.CalcRequest; malformed requests get code 0.
+def parse_request(request: str) -> Tuple[int, int, int]:
+    try:
+        op, x, y = request.split()
+        x, y = int(x), int(y)
+    except ValueError:
+        return 0, 0, 0
+    if not (-I32 <= x < I32 and -I32 <= y < I32):
+        return 0, 0, 0
+    return OP_CODES.get(op, wire.CALC_UNSUPPORTED), x, y
+
+def encode_requests(requests: List[str]) -> wire.CalcRequest:
+    ops, xs, ys = zip(*map(parse_request, requests))
+    return wire.CalcRequest(ops, xs, ys)
+
+# The results of a wire.CalcReply as the calculator's text answers.
+def decode_results(reply: wire.CalcReply) -> List[str]:
+    return [str(value) if valid else INVALID for valid, value in zip(reply.valid, reply.values)]
+
+
+# Long-lived connection from a peer to the calculator server.
+# Requests are pipelined: a window of frames is written at once and the replies are read back in order, decoded
+# from the channel's receive buffer.
+class CalculatorChannel:
+    def __init__(self, address: Tuple[str, int], timeout: float = 5.0, window: int = 256, batch_size: int = 4096):
+        self.address = address
+        self.timeout = timeout
+        self.window = window
+        self.batch_size = batch_size
+        self.sock: Optional[socket.socket] = None
+        self.reader: Optional[wire.FrameReader] = None
+        self.lock = threading.Lock()
+
+    def _connect(self) -> socket.socket:
+        if self.sock is None:
+            self.sock = socket.create_connection(self.address, timeout=self.timeout)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.reader = wire.FrameReader(self.sock)
+        return self.sock
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            finally:
+                self.sock = None
+                self.reader = None
+
+    def _exchange(self, messages: list) -> list:
+        sock = self._connect()
+        replies = []
+        for start in range(0, len(messages), self.window):
+            chunk = messages[start:start + self.window]
+            wire.send_all(sock, chunk)
+            for _ in chunk:
+                reply = self.reader.read()
+                if reply is None:
+                    raise ConnectionError("calculator closed the connection")
+                replies.append(reply)
+        return replies
+
+    # Sends the messages over the open connection and returns the replies in the same order.
+    # A stale connection is reopened once; calculator operations are pure so replaying them is safe.
+    def _request(self, messages: list) -> list:
+        with self.lock:
+            try:
+                return self._exchange(messages)
+            except OSError:
+                self.close()
+            try:
+                return self._exchange(messages)
+            except OSError:
+                self.close()
+                raise
+
+    # Packs the requests into batch frames evaluated by the server in a single pass each.
+    def batch(self, requests: List[str]) -> List[str]:
+        if not requests:
+            return []
+        messages = [encode_requests(requests[start:start + self.batch_size])
+                    for start in range(0, len(requests), self.batch_size)]
+        results = []
+        for reply in self._request(messages):
+            results.extend(decode_results(reply))
+        return results
+
+    # The hit/miss counters of the calculator's result cache.
+    def stats(self) -> str:
+        return self._request([wire.CalcStats()])[0].text
+
+
+# Persistent connection from a peer to its successor in the ring.
+# Messages travel as frames on the open stream; a broken connection is reopened transparently on the next send.
+class RingLink:
+    def __init__(self, address: Tuple[str, int], timeout: float = 5.0, max_attempts: int = 3, retry_delay: float = 0.5):
+        self.address = address
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.sock: Optional[socket.socket] = None
+        self.lock = threading.Lock()
+
+    def _connect(self) -> socket.socket:
+        if self.sock is None:
+            self.sock = socket.create_connection(self.address, timeout=self.timeout)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return self.sock
+
+    def close(self):
+        with self.lock:
+            self._close()
+
+    # Points the link at a new successor, used when the current one is spliced out of the ring.
+    def retarget(self, address: Tuple[str, int]):
+        with self.lock:
+            self._close()
+            self.address = address
+
+    def _close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            finally:
+                self.sock = None
+
+    # Sends a message to the successor, reconnecting up to max_attempts times. Raises the last error if all attempts fail.
+    def send(self, msg: tuple, max_attempts: Optional[int] = None):
+        max_attempts = self.max_attempts if max_attempts is None else max_attempts
+        payload = wire.frame(msg)
+        attempts = 0
+        with self.lock:
+            while True:
+                try:
+                    self._connect().sendall(payload)
+                    return
+                except OSError as e:
+                    self._close()
+                    attempts += 1
+                    if attempts > max_attempts:
+                        raise
+                    # the first failure is usually a stale connection, reconnect right away before backing off
+                    if attempts > 1:
+                        print(f"Attempts {attempts} failed for {self.address}: {e}, trying again in {self.retry_delay} seconds ...")
+                        time.sleep(self.retry_delay)
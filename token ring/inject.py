@@ -1,29 +1,42 @@
 import socket
-import sys
+import argparse
+import wire
+from topology import MAIN, load_topology, parse_address
 
 HOST = socket.gethostbyname(socket.gethostname())
 print(HOST)
 
 class NodeP:
-    def __init__(self, next_):
+    def __init__(self, next_, tokens: int = 1, ring: str = MAIN):
         self.next_host = next_
         self.port = 50000
+        self.tokens = tokens  # one token per calculator shard
+        self.ring = ring
 def server(node:NodeP):
     try:
-        client = socket.socket(socket.AF_INET, socket.SOCK_STREAM) 
-        client.bind((HOST, node.port))
-        client.connect((node.next_host, node.port))
-        client.send(str('token').encode('UTF-8'))
+        client = socket.create_connection((node.next_host, node.port))
+        wire.send_all(client, [wire.RingToken(node.ring, shard, 0) for shard in range(node.tokens)])
         client.close()
     except Exception as e:
         print(f'Error sending token {e}')
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python inject.py next_host")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Injects the tokens into the ring.")
+    parser.add_argument("next_host", nargs="?", help="host[:port] of the first peer")
+    parser.add_argument("--tokens", type=int, default=1, help="number of tokens, must match the number of calculator shards")
+    parser.add_argument("--topology", default=None, help="inject the tokens of every ring of a topology file")
+    args = parser.parse_args()
 
-    next_host = sys.argv[1]
-    node = NodeP(next_= next_host)
-    server(node)
-    
\ No newline at end of file
+    if args.topology:
+        # each ring gets one token per calculator, injected at its first member
+        for ring in load_topology(args.topology, 50000):
+            node = NodeP(next_= ring.members[0][0], tokens= len(ring.calculators), ring= ring.name)
+            node.port = ring.members[0][1]
+            server(node)
+    elif args.next_host:
+        host, port = parse_address(args.next_host, 50000)
+        node = NodeP(next_= host, tokens= args.tokens)
+        node.port = port
+        server(node)
+    else:
+        parser.error("next_host or --topology is required")
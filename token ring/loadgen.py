@@ -0,0 +1,193 @@
+import argparse
+import math
+import queue
+import random
+import threading
+import time
+from typing import Callable, Iterator, List, Optional, Tuple
+from poissonEvents import get_random_arguments, get_random_operation
+
+'''
+Open-loop load generation for benchmarking the ring.
+
+Arrivals are scheduled on absolute deadlines measured from the start of the run, so sleep granularity never
+accumulates into drift: whenever the generator wakes up it emits every arrival whose deadline has passed, in one
+batch, stamped with its scheduled time (queue-wait latency therefore includes any lateness of the generator).
+Schedules yield (offset in seconds, request or None); a None request is filled with a random calculator operation.
+Rates are in requests per second.
+'''
+
+Arrival = Tuple[float, Optional[str]]
+SPIN = 0.0005  # below this remaining time the generator does not sleep
+
+
+def random_request() -> str:
+    arguments = get_random_arguments()
+    return f"{get_random_operation()} {arguments['number1']} {arguments['number2']}"
+
+# Exponential inter-arrival times, the classic Poisson process.
+def poisson_schedule(rate: float) -> Iterator[Arrival]:
+    offset = 0.0
+    while True:
+        offset += -math.log(1.0 - random.random()) / rate
+        yield offset, None
+
+# Evenly spaced arrivals.
+def constant_schedule(rate: float) -> Iterator[Arrival]:
+    n = 0
+    while True:
+        n += 1
+        yield n / rate, None
+
+# On/off modulated Poisson process: all the load arrives during the first on_fraction of every period,
+# at rate / on_fraction, so the average rate is still the given rate.
+def bursty_schedule(rate: float, period: float = 1.0, on_fraction: float = 0.2) -> Iterator[Arrival]:
+    burst_rate = rate / on_fraction
+    on_time = period * on_fraction
+    busy = 0.0  # time spent inside bursts so far
+    while True:
+        busy += -math.log(1.0 - random.random()) / burst_rate
+        bursts, within = divmod(busy, on_time)
+        yield bursts * period + within, None
+
+# Replays a trace recorded by LoadGenerator, one "offset<TAB>request" line per arrival, optionally sped up.
+def trace_schedule(path: str, speed: float = 1.0) -> Iterator[Arrival]:
+    with open(path) as f:
+        for line in f:
+            offset, _, request = line.rstrip('\n').partition('\t')
+            if offset:
+                yield float(offset) / speed, request or None
+
+# Average rate of a recorded trace, used as the target when replaying it: count - 1 intervals between the first
+# and the last arrival, so the result does not depend on when the trace starts.
+def trace_rate(path: str, speed: float = 1.0) -> float:
+    count, first, last = 0, 0.0, 0.0
+    for offset, _ in trace_schedule(path, speed):
+        if count == 0:
+            first = offset
+        count += 1
+        last = offset
+    return (count - 1) / (last - first) if last > first else 0.0
+
+
+def make_schedule(kind: str, rate: float, trace: Optional[str] = None, speed: float = 1.0,
+                  period: float = 1.0, on_fraction: float = 0.2) -> Iterator[Arrival]:
+    if trace:
+        return trace_schedule(trace, speed)
+    if kind == "constant":
+        return constant_schedule(rate)
+    if kind == "bursty":
+        return bursty_schedule(rate, period, on_fraction)
+    return poisson_schedule(rate)
+
+
+# Drives a schedule in a background thread and hands every batch of due arrivals to the sink as
+# (scheduled monotonic time, request) pairs. Optionally records the arrivals to a trace file.
+class LoadGenerator:
+    def __init__(self, schedule: Iterator[Arrival], sink: Callable[[List[Tuple[float, str]]], None],
+                 target_rate: float, duration: Optional[float] = None, record: Optional[str] = None):
+        self.schedule = schedule
+        self.sink = sink
+        self.target_rate = target_rate
+        self.duration = duration
+        self.record = record
+        self.sent = 0
+        self.max_lag = 0.0  # worst delay between the scheduled and the actual emission of an arrival
+        self.started: Optional[float] = None
+        self.stopped: Optional[float] = None
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+
+    def join(self, timeout: Optional[float] = None):
+        self.thread.join(timeout)
+
+    def _run(self):
+        trace = open(self.record, 'w') if self.record else None
+        self.started = time.monotonic()
+        try:
+            pending = next(self.schedule, None)
+            while pending is not None and not self.stop_event.is_set():
+                if self.duration is not None and pending[0] > self.duration:
+                    break
+                now = time.monotonic()
+                deadline = self.started + pending[0]
+                if deadline - now > SPIN:
+                    self.stop_event.wait(deadline - now - SPIN / 2)
+                    continue
+
+                batch = []
+                while pending is not None and self.started + pending[0] <= now:
+                    offset, request = pending
+                    batch.append((self.started + offset, request or random_request()))
+                    if trace is not None:
+                        trace.write(f"{offset:.6f}\t{batch[-1][1]}\n")
+                    pending = next(self.schedule, None)
+                    if self.duration is not None and pending is not None and pending[0] > self.duration:
+                        pending = None
+                if trace is not None:
+                    trace.flush()
+                if batch:
+                    self.max_lag = max(self.max_lag, now - batch[0][0])
+                    self.sent += len(batch)
+                    self.sink(batch)
+            if self.duration is not None:
+                # a schedule may end with a quiet stretch (e.g. between bursts), it still counts towards the rate
+                self.stop_event.wait(max(0.0, self.started + self.duration - time.monotonic()))
+        finally:
+            self.stopped = time.monotonic()
+            if trace is not None:
+                trace.close()
+
+    # Target and achieved rate of the run so far.
+    def report(self) -> dict:
+        if self.started is None:
+            return {"target_rate": self.target_rate, "achieved_rate": 0.0, "sent": 0}
+        elapsed = (self.stopped or time.monotonic()) - self.started
+        achieved = self.sent / elapsed if elapsed > 0 else 0.0
+        return {
+            "target_rate": round(self.target_rate, 2),
+            "achieved_rate": round(achieved, 2),
+            "sent": self.sent,
+            "elapsed": round(elapsed, 3),
+            "max_lag_ms": round(self.max_lag * 1000, 3),
+        }
+
+    def __str__(self) -> str:
+        return ' '.join(f"{key}={value}" for key, value in self.report().items())
+
+
+# Starts a load generator that feeds a peer's request queue.
+def generate_load(q: queue.Queue, schedule: Iterator[Arrival], target_rate: float, record: Optional[str] = None) -> LoadGenerator:
+    def sink(batch: List[Tuple[float, str]]):
+        for item in batch:
+            q.put(item)
+
+    generator = LoadGenerator(schedule, sink, target_rate, record=record)
+    generator.start()
+    return generator
+
+
+if __name__ == "__main__":
+    # Stand-alone run that discards the requests, to check how closely the generator follows a schedule.
+    parser = argparse.ArgumentParser(description="Open-loop load generator self-test.")
+    parser.add_argument("--rate", type=float, default=1000.0, help="requests per second")
+    parser.add_argument("--schedule", choices=["poisson", "constant", "bursty"], default="poisson")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds")
+    parser.add_argument("--trace", default=None, help="replay this trace instead of generating arrivals")
+    parser.add_argument("--speed", type=float, default=1.0, help="trace replay speed-up")
+    parser.add_argument("--record", default=None, help="record the arrivals to this trace file")
+    args = parser.parse_args()
+
+    target = trace_rate(args.trace, args.speed) if args.trace else args.rate
+    generator = LoadGenerator(make_schedule(args.schedule, args.rate, args.trace, args.speed),
+                              lambda batch: None, target, duration=args.duration, record=args.record)
+    generator.start()
+    generator.join()
+    print(generator)
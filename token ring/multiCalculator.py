@@ -1,12 +1,18 @@
 import socket
+import selectors
+import operator
 import threading
 import signal
-import sys
+import argparse
+from typing import List, Optional, Tuple
+import wire
+from cache import LRUCache
 
 PORT: int = 50000
-FORMAT: str = 'UTF-8'
+I64 = range(-2 ** 63, 2 ** 63)  # results travel as 64-bit integers, larger ones are answered as invalid
 
 shutdown_event = threading.Event()
+cache = LRUCache(65536)  # the whole add/sub/mul/div domain of 0..99 operands fits
 
 
 def signal_handler(sig, frame):
@@ -17,51 +23,126 @@ def signal_handler(sig, frame):
 signal.signal(signal.SIGINT, signal_handler)
 
 
+class Connection:
+    """Buffers of a single non-blocking client connection."""
+    def __init__(self, sock: socket.socket, addr: tuple):
+        self.sock = sock
+        self.addr = addr
+        self.inbuf = bytearray()
+        self.outbuf = bytearray()
+
+
 def server(ADDR: tuple):
-    """Starts the server and listens for incoming connections."""
+    """Starts the server and serves every connection from a single selector loop."""
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     server_socket.bind(ADDR)
     server_socket.listen()
+    server_socket.setblocking(False)
     print(f"Server running at {ADDR[0]}:{ADDR[1]}")
 
+    sel = selectors.DefaultSelector()
+    sel.register(server_socket, selectors.EVENT_READ, data=None)
     try:
         while not shutdown_event.is_set():
-            try:
-                server_socket.settimeout(1)  # Allows checking shutdown_event periodically
-                client, addr = server_socket.accept()
-                print(f"Connection from {addr}")
-                threading.Thread(target=handle_connection, args=(client,)).start()
-            except socket.timeout:
-                continue  # Check for shutdown_event after timeout
-            except Exception as e:
-                print(f"Error accepting connection: {e}")
+            for key, mask in sel.select(timeout=1):  # Allows checking shutdown_event periodically
+                if key.data is None:
+                    accept_connection(sel, server_socket)
+                else:
+                    service_connection(sel, key.data, mask)
     finally:
+        print(f"Cache: {cache}")
         print("Closing server socket...")
-        server_socket.close()
+        for key in list(sel.get_map().values()):
+            key.fileobj.close()
+        sel.close()
 
 
-def handle_connection(client: socket.socket):
-    """Handles communication with a single client."""
+def accept_connection(sel: selectors.BaseSelector, server_socket: socket.socket):
+    """Accepts a pending client and registers it with the selector."""
     try:
-        msg = client.recv(1024).decode(FORMAT)
-        print(f"Message received: {msg}")
+        client, addr = server_socket.accept()
+    except BlockingIOError:
+        return
+    except Exception as e:
+        print(f"Error accepting connection: {e}")
+        return
+    print(f"Connection from {addr}")
+    client.setblocking(False)
+    client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sel.register(client, selectors.EVENT_READ, data=Connection(client, addr))
 
-        # Parse the message
-        msg_parts = msg.split()
-        if len(msg_parts) != 3:
-            client.send("Invalid message format".encode(FORMAT))
-            return
 
-        op, x, y = msg_parts[0], int(msg_parts[1]), int(msg_parts[2])
-        result = calculator(op, x, y)
-        response = str(result)
+def close_connection(sel: selectors.BaseSelector, conn: Connection):
+    sel.unregister(conn.sock)
+    conn.sock.close()
 
-        client.send(response.encode(FORMAT))
+
+def service_connection(sel: selectors.BaseSelector, conn: Connection, mask: int):
+    """Reads every complete frame available on the connection and writes back the queued responses."""
+    try:
+        if mask & selectors.EVENT_READ:
+            data = conn.sock.recv(65536)
+            if not data:
+                close_connection(sel, conn)
+                return
+            conn.inbuf += data
+            if not handle_frames(conn):
+                print(f"Frame too large from {conn.addr}, closing connection")
+                close_connection(sel, conn)
+                return
+
+        if conn.outbuf:
+            sent = conn.sock.send(conn.outbuf)
+            del conn.outbuf[:sent]
+    except BlockingIOError:
+        pass
     except Exception as e:
         print(f"Error handling connection: {e}")
+        close_connection(sel, conn)
+        return
+
+    events = selectors.EVENT_READ | (selectors.EVENT_WRITE if conn.outbuf else 0)
+    sel.modify(conn.sock, events, data=conn)
+
+
+def handle_frames(conn: Connection) -> bool:
+    """Answers every complete frame in the input buffer, decoded in place, returns False on an oversized frame."""
+    view = memoryview(conn.inbuf)
+    offset = 0
+    try:
+        while len(view) - offset >= wire.HEADER.size:
+            (length,) = wire.HEADER.unpack_from(view, offset)
+            if length > wire.MAX_FRAME:
+                return False
+            end = offset + wire.HEADER.size + length
+            if len(view) < end:
+                break
+            with view[offset + wire.HEADER.size:end] as frame:
+                conn.outbuf += wire.frame(handle_request(frame))
+            offset = end
     finally:
-        client.close()
+        view.release()
+    del conn.inbuf[:offset]
+    return True
+
+
+def handle_request(data: memoryview):
+    """Answers a batch of requests with one result each, or a stats request with the result cache counters."""
+    msg = wire.decode(data)
+    if isinstance(msg, wire.CalcStats):
+        return wire.CalcStatsReply(str(cache))
+
+    results = calculate_batch(parse_requests(msg))
+    valid = [int(result is not None and result in I64) for result in results]
+    return wire.CalcReply(valid, [result if ok else 0 for result, ok in zip(results, valid)])
+
+
+def parse_requests(msg: wire.CalcRequest) -> List[Optional[Tuple[str, int, int]]]:
+    """Turns a request batch into (op, x, y) tuples, None for the malformed requests."""
+    names = [None] + wire.CALC_OPS
+    return [None if code == 0 else (names[code] if code < len(names) else '', x, y)
+            for code, x, y in zip(msg.ops, msg.xs, msg.ys)]
 
 
 def calculator(op: str, x: int, y: int) -> int:
@@ -78,12 +159,50 @@ def calculator(op: str, x: int, y: int) -> int:
         return 0  # Default return for unsupported operations
 
 
-if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python multiCalculator.py <SERVER_HOST>")
-        sys.exit(1)
+VECTOR_OPS = {
+    'add': operator.add,
+    'sub': operator.sub,
+    'mul': operator.mul,
+    'div': lambda x, y: x // y if y != 0 else 0,
+}
+
+
+def calculate_batch(requests: List[Optional[Tuple[str, int, int]]]) -> List[Optional[int]]:
+    """Evaluates a list of parsed requests, answering cached ones directly and applying each operation
+    to all of the remaining operands in one pass. Malformed requests get None."""
+    results = [None] * len(requests)
+    groups = {}
+    for i, request in enumerate(requests):
+        if request is None:
+            continue
+        cached = cache.get(request)
+        if cached is not None:
+            results[i] = cached
+        else:
+            groups.setdefault(request[0], []).append(i)
+
+    for op, indexes in groups.items():
+        xs = [requests[i][1] for i in indexes]
+        ys = [requests[i][2] for i in indexes]
+        if op in VECTOR_OPS:
+            values = map(VECTOR_OPS[op], xs, ys)
+        else:
+            values = map(calculator, [op] * len(xs), xs, ys)
+        for i, value in zip(indexes, values):
+            results[i] = value
+            cache.put(requests[i], value)
+    return results
 
-    SERVER = sys.argv[1]
-    ADDR = (SERVER, PORT)
-    print(f"Starting server @ host={SERVER}, port={PORT}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calculator server shared by the token ring peers.")
+    parser.add_argument("host", metavar="SERVER_HOST")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--cache-size", type=int, default=cache.maxsize, help="results kept in the LRU cache, 0 disables it")
+    args = parser.parse_args()
+
+    cache.maxsize = args.cache_size
+    SERVER = args.host
+    ADDR = (SERVER, args.port)
+    print(f"Starting server @ host={SERVER}, port={args.port}")
     server(ADDR)
@@ -3,29 +3,67 @@ import threading
 import logging
 import queue
 import signal
-import sys
-from typing import Tuple
+import argparse
+from typing import Dict, List, Optional, Set, Tuple
+from common import Metrics
+import wire
 from poissonEvents import generate_requests
+from loadgen import generate_load, make_schedule, trace_rate
+from channel import CalculatorChannel, RingLink
+from cache import LRUCache
+from scheduling import HoldPolicy, DrainPolicy, LatencyTracker, make_policy
+from recovery import TokenMonitor
+from topology import MAIN, RingConfig, load_topology, parse_address
 import time
-
-FORMAT = 'UTF-8'
     
-# Represents a peer in the network, storing its local address, the next peer's address, and the calculator server's address, queue and shutdown command.
+# One calculator shard guarded by its own token: the open connection to that calculator, the monitor that watches
+# the shard's token and the worker thread that serves the queue whenever the token arrives.
+class Shard:
+    def __init__(self, ring: "Ring", index: int, calculator_address: Tuple[str, int], peer_id: str):
+        self.ring = ring
+        self.index = index
+        self.calculator_address = calculator_address
+        self.calculator = CalculatorChannel(calculator_address)
+        self.monitor = TokenMonitor(peer_id, ring=ring.name, shard=index)
+        self.inbox = queue.Queue()  # token sequence numbers waiting to be served by the worker
+
+    def __str__(self) -> str:
+        return f"{self.ring.name}/{self.index}"
+
+# The ring this peer belongs to: its successor, the open link to it and the shards whose tokens circulate on it.
+class Ring:
+    def __init__(self, config: RingConfig, address: Tuple[str, int]):
+        self.name = config.name
+        self.members = config.members  # every peer in ring order, lets a dead successor be spliced out
+        self.next_address = config.successor(address)
+        self.link = RingLink(self.next_address)
+        self.dead: Set[Tuple[str, int]] = set()
+        self.splice_lock = threading.Lock()
+        # one token circulates per calculator shard, requests go to whichever shard's token arrives
+        self.shards = [Shard(self, i, calculator, f"{address[0]}:{address[1]}") for i, calculator in enumerate(config.calculators)]
+
+# Represents a peer in the network, storing its local address, the rings it belongs to, queue and shutdown command.
 class PeerNode:
-    def __init__(self, hostname: str, port:int , next_address: Tuple[str, int], host_calculator:str):
-        self.next_address = next_address
-        self.calculator_address = host_calculator, port
+    def __init__(self, hostname: str, port:int , rings: List[RingConfig], cache_size: int = 0, policy: HoldPolicy = DrainPolicy(),
+                 metrics: Optional[Metrics] = None):
         self.host = hostname
         self.port = port
+        self.rings: Dict[str, Ring] = {config.name: Ring(config, (hostname, port)) for config in rings if config.includes((hostname, port))}
+        self.shards = [shard for ring in self.rings.values() for shard in ring.shards]
+        # optional client-side cache, repeated requests are answered without contacting the calculator
+        self.cache: Optional[LRUCache] = LRUCache(cache_size) if cache_size > 0 else None
         self.server_socket =  socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.queue_ = queue.Queue()
+        self.queue_ = queue.Queue()  # (enqueue time, request) pairs
+        self.policy = policy
+        self.waits = LatencyTracker()  # time requests spend in the queue before a token visit serves them
+        self.metrics = metrics or Metrics()
         self.shutdown_event = threading.Event() 
 
 class Logs:
-    def __init__(self, hostname: str):
+    def __init__(self, hostname: str, port: int):
         self.logger = logging.getLogger("logfile")
         self.logger.setLevel(logging.INFO)
-        handler = logging.FileHandler(f"./{hostname}_peer.log", mode="a")
+        handler = logging.FileHandler(f"./{hostname}_{port}_peer.log", mode="a")
         formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
         handler.setFormatter(formatter)
         self.logger.addHandler(handler)
@@ -38,53 +76,189 @@ def signal_handler(sig, frame):
 
 signal.signal(signal.SIGINT, signal_handler)
 
-# Sends a shutdown command ("shut") to the next peer in the network and closes the local server's socket.
+# Sends a shutdown command (wire.RingShut) to the next peer of every ring and closes the local server's socket.
 def propagate_shutdown(peer: PeerNode):
     print("Propagating shutdown...")
-    try:
-        next_socket =  socket.socket(socket.AF_INET, socket.SOCK_STREAM) 
-        next_socket.connect(peer.next_address)
-        next_socket.send("shut".encode(FORMAT))
-        
-    except Exception as e:
-        print(f"Failed to send shutdown signal to {peer.next_address}: {e}")
+    for ring in peer.rings.values():
+        try:
+            ring.link.send(wire.RingShut(), max_attempts=1)
 
-    finally:
-        print('server is closed')
-        peer.server_socket.close()
+        except Exception as e:
+            print(f"Failed to send shutdown signal to {ring.next_address}: {e}")
+
+        finally:
+            ring.link.close()
+    print('server is closed')
+    peer.server_socket.close()
 
-# Processes items in the queue by sending them to a calculator server and print the received results.
-def process_queue(node: PeerNode, logger: Logs):
-    while not node.queue_.empty():
-        calculator_server=  socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+# Answers repeated requests from the local cache and sends the rest to the calculator server
+# over the peer's open connection as one batch, returning the results in order.
+def serve_items(node: PeerNode, shard: Shard, items: List[str]) -> List[str]:
+    results = [None] * len(items)
+    misses = []
+    for i, item in enumerate(items):
+        cached = node.cache.get(item) if node.cache is not None else None
+        if cached is None:
+            misses.append(i)
+        else:
+            results[i] = cached
+
+    replies = shard.calculator.batch([items[i] for i in misses])
+    for i, reply in zip(misses, replies):
+        results[i] = reply
+        if node.cache is not None:
+            node.cache.put(items[i], reply)
+    return results
+
+# Serves queued requests on a shard while the peer holds its token, within the quota and hold time of the peer's
+# hold policy, and records how long each request waited in the queue.
+def process_queue(node: PeerNode, shard: Shard, logger: Logs):
+    started = time.monotonic()
+    budget = node.policy.budget()
+    served = 0
+    while budget is None or served < budget:
+        limits = [n for n in (node.policy.chunk_size, None if budget is None else budget - served) if n is not None]
+        limit = min(limits) if limits else float('inf')
+        items = []
+        enqueued = []
+        while len(items) < limit:
+            try:
+                stamp, item = node.queue_.get_nowait()
+            except queue.Empty:
+                break
+            enqueued.append(stamp)
+            items.append(item)
+        if not items:
+            break
+
+        now = time.monotonic()
+        waits = [now - stamp for stamp in enqueued]
+        node.waits.add(waits)
+        node.metrics.emit("wait", values=[round(wait, 6) for wait in waits])
         try:
-            calculator_server.connect(node.calculator_address)
-            item = node.queue_.get()
-            calculator_server.send(item.encode(FORMAT))
-            result = calculator_server.recv(1024).decode(FORMAT)
-            print(result)
+            results = serve_items(node, shard, items)
         except Exception as e:
-            logger.error(f"Error connecting to calculator: {e}")
+            logger.error(f"Error connecting to calculator {shard.calculator_address}: {e}")
             propagate_shutdown(node)
             return
+
+        for result in results:
+            print(result)
+        served += len(items)
+        if node.policy.expired(started):
+            break
+
+    if served:
+        held = time.monotonic() - started
+        logger.info(f"Visit shard {shard}: served={served} left={node.queue_.qsize()} held={held * 1000:.1f}ms wait {node.waits}")
+        if node.cache is not None:
+            logger.info(f"Cache: {node.cache}")
     
-# Forwards a received message to the next peer in the network.
-def forward_message(next_address: Tuple[str, int], msg: str, logger: logging.Logger, max_attempts = 3):
-    attempts = 0
+# Forwards a message to the next peer of a ring over the open ring link.
+# If the successor cannot be reached it is spliced out of the ring and the message goes to the peer after it.
+def forward_message(node: PeerNode, ring: Ring, msg: tuple, logger: logging.Logger) -> bool:
     while True:
         try:
-            next_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM) 
-            next_socket.connect(next_address)
-            next_socket.send(msg.encode(FORMAT))
-            logger.info(f"Message forwarded to {next_address}: {msg}")
-            break
+            ring.link.send(msg)
+            logger.info(f"Message forwarded to {ring.next_address}: {msg}")
+            return True
         except Exception as e:
-            attempts+=1
-            print(f"Attempts {attempts} failed for {next_address}: {e}, trying again in 3 seconds ...")
-            time.sleep(3)
-            if attempts > max_attempts:
-                propagate_shutdown(peer_node)
+            failed = ring.link.address
+            logger.error(f"Failed to forward message to {failed}: {e}")
+            if not splice_successor(node, ring, failed, logger):
+                propagate_shutdown(node)
+                return False
+
+# Replaces a dead successor with the next live peer of the ring, returns False if there is none left.
+# Several shard workers may fail on the same successor at once, only the first one splices it out.
+def splice_successor(node: PeerNode, ring: Ring, failed: Tuple[str, int], logger: logging.Logger) -> bool:
+    with ring.splice_lock:
+        if ring.next_address != failed:
+            return True
+        if failed not in ring.members:
+            return False
+        ring.dead.add(failed)
+        start = ring.members.index(failed)
+        for i in range(1, len(ring.members)):
+            candidate = ring.members[(start + i) % len(ring.members)]
+            if candidate == (node.host, node.port):
                 break
+            if candidate not in ring.dead:
+                logger.warning(f"Splicing {failed} out of ring {ring.name}, new successor is {candidate}")
+                ring.next_address = candidate
+                ring.link.retarget(candidate)
+                return True
+        return False
+
+# Serves the queue while holding a shard's token, then passes it on. Tokens older than the newest one seen are dropped.
+def handle_token(node: PeerNode, shard: Shard, seq: int, logger: logging.Logger):
+    if not shard.monitor.token_received(seq):
+        logger.warning(f"Dropping stale token {seq} of shard {shard}, newest is {shard.monitor.seq}")
+        return
+    if shard.monitor.last_rotation is not None:
+        node.metrics.emit("rotation", ring=shard.ring.name, shard=shard.index, seconds=shard.monitor.last_rotation)
+    try:
+        process_queue(node, shard, logger)
+    finally:
+        shard.monitor.token_forwarded()
+    forward_message(node, shard.ring, wire.RingToken(shard.ring.name, shard.index, seq), logger)
+
+# Handles a wire.RingElect message; the winner of the election mints the shard's next token.
+def handle_election(node: PeerNode, shard: Shard, candidate: str, seq: int, logger: logging.Logger):
+    action, value = shard.monitor.on_election(candidate, seq)
+    if action == "forward":
+        forward_message(node, shard.ring, value, logger)
+    elif action == "won":
+        logger.warning(f"Won the election, regenerating token {value} of shard {shard}")
+        shard.inbox.put(value)
+
+# Runs one worker per shard so the tokens of different shards are served concurrently.
+def start_shard_workers(node: PeerNode, logger: logging.Logger):
+    def work_loop(shard: Shard):
+        while not node.shutdown_event.is_set():
+            try:
+                seq = shard.inbox.get(timeout=1)
+            except queue.Empty:
+                continue
+            try:
+                handle_token(node, shard, seq, logger)
+            except Exception as e:
+                logger.error(f"Error handling token of shard {shard}: {e}")
+
+    for shard in node.shards:
+        threading.Thread(target=work_loop, args=(shard,), daemon=True).start()
+
+# Starts an election for every shard whose token has not been seen for a few rotation times.
+def watch_token(node: PeerNode, logger: logging.Logger):
+    def watch_loop():
+        while not node.shutdown_event.is_set():
+            time.sleep(min([0.5] + [shard.monitor.timeout() / 4 for shard in node.shards]))
+            for shard in node.shards:
+                msg = shard.monitor.start_election()
+                if msg is not None:
+                    logger.warning(f"Token of shard {shard} lost (timeout {shard.monitor.timeout():.2f}s), starting election")
+                    forward_message(node, shard.ring, msg, logger)
+
+    threading.Thread(target=watch_loop, daemon=True).start()
+
+# Periodically logs the target and achieved rate of the load generator.
+def report_load(node: PeerNode, generator, logger: logging.Logger, every: float = 10.0):
+    def report_loop():
+        while not node.shutdown_event.wait(every):
+            logger.info(f"Load: {generator}")
+
+    threading.Thread(target=report_loop, daemon=True).start()
+
+# Logs the result cache counters of every calculator this peer used, once the peer stopped.
+def report_calculators(node: PeerNode, logger: logging.Logger):
+    for shard in node.shards:
+        try:
+            stats = shard.calculator.stats()
+        except OSError as e:
+            logger.warning(f"No cache counters from calculator {shard.calculator_address}: {e}")
+            continue
+        logger.info(f"Calculator {shard.calculator_address} cache: {stats}")
+        node.metrics.emit("calculator_cache", shard=str(shard), stats=stats)
 
 # Starts the server socket to listen for peer connections and manages connections in separate threads.
 def server_run(logger: logging.Logger, peer_node: PeerNode):
@@ -93,29 +267,39 @@ def server_run(logger: logging.Logger, peer_node: PeerNode):
     server.bind((peer_node.host, peer_node.port))
     server.listen()
     logger.info(f"Server running at {peer_node.host}:{peer_node.port}")
+    server.settimeout(1)  # Allows checking shutdown_event periodically
     while not peer_node.shutdown_event.is_set():
         try:
             client_socket, addr = server.accept()
-            threading.Thread(target=handle_connection, args=(client_socket, addr, logger, peer_node)).start()
+            threading.Thread(target=handle_connection, args=(client_socket, addr, logger, peer_node), daemon=True).start()
+        except socket.timeout:
+            continue
         except Exception as e:
             logger.error(f"Error accepting connection: {e}")    
 
-# Handles an incoming connection:
-    # - Processes the client's message.
-    # - Propagates shutdown if the message is "shut".
-    # - Processes the message queue and forwards messages to the next peer.
+# Handles an incoming ring link from the predecessor, one framed message at a time until it closes:
+    # - Propagates shutdown if the message is a RingShut.
+    # - Takes part in the election of a new token if the message is a RingElect.
+    # - Hands a RingToken to the worker of its shard, which processes the queue and forwards the token to the next peer.
 def handle_connection(client: socket.socket, client_address: Tuple[str, int], logger: logging.Logger, peer_node: PeerNode):
     try:
-        msg = client.recv(1024).decode(FORMAT)
-        logger.info(f"Received message from {client_address}: {msg}")
-
-        if msg == "shut":
-            peer_node.shutdown_event.set()
-            propagate_shutdown(peer_node)
-            return
+        client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        reader = wire.FrameReader(client, 4096)
+        while not peer_node.shutdown_event.is_set():
+            msg = reader.read()
+            if msg is None:
+                break
+            logger.info(f"Received message from {client_address}: {msg}")
 
-        process_queue(peer_node, logger)
-        forward_message(peer_node.next_address, msg, logger)
+            if isinstance(msg, wire.RingShut):
+                peer_node.shutdown_event.set()
+                propagate_shutdown(peer_node)
+                return
+            elif isinstance(msg, wire.RingElect):
+                shard = peer_node.rings[msg.ring].shards[msg.shard]
+                handle_election(peer_node, shard, msg.candidate, msg.seq, logger)
+            elif isinstance(msg, wire.RingToken):
+                peer_node.rings[msg.ring].shards[msg.shard].inbox.put(msg.seq)
 
     except Exception as e:
         logger.error(f"Error handling connection: {e}")
@@ -125,21 +309,54 @@ def handle_connection(client: socket.socket, client_address: Tuple[str, int], lo
 
 
 if __name__ == "__main__":
-    if len(sys.argv) != 4:
-        print("Usage: python peer.py <hostname> <next_peer_host> <calculator_host>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Token ring peer.")
+    parser.add_argument("hostname")
+    parser.add_argument("next_peer_host", nargs="?", help="host[:port], not needed with --topology")
+    parser.add_argument("calculator_host", nargs="?", help="comma separated calculator hosts, one token circulates per calculator")
+    parser.add_argument("--port", type=int, default=50000, help="port of this peer, also the default port of the other hosts")
+    parser.add_argument("--cache-size", type=int, default=0, help="calculator results cached locally, 0 disables the cache")
+    parser.add_argument("--max-items", type=int, default=None, help="requests served per token visit (default: drain the queue)")
+    parser.add_argument("--max-hold", type=float, default=None, help="seconds the token may be held per visit")
+    parser.add_argument("--weight", type=float, default=1.0, help="scales this peer's quota and hold time relative to the others")
+    parser.add_argument("--ring", default="", help="comma separated hosts of the whole ring in order, enables splicing out dead peers")
+    parser.add_argument("--topology", default=None, help="JSON file partitioning the peers into rings (see topology.py)")
+    parser.add_argument("--rate", type=float, default=None, help="requests per second from the open-loop load generator (default: 4 per minute)")
+    parser.add_argument("--schedule", choices=["poisson", "constant", "bursty"], default="poisson", help="arrival process of the load generator")
+    parser.add_argument("--trace", default=None, help="replay the arrivals of a recorded trace file")
+    parser.add_argument("--speed", type=float, default=1.0, help="trace replay speed-up")
+    parser.add_argument("--record-trace", default=None, help="record the generated arrivals to this trace file")
+    parser.add_argument("--metrics", default=None, help="append benchmark events to this JSON lines file")
+    args = parser.parse_args()
 
-    hostname = sys.argv[1]
-    port = 50000
-    next_peer_host = sys.argv[2]
-    next_address_ = (next_peer_host, port)
+    hostname = args.hostname
+    port = args.port
 
-    calculator_host = sys.argv[3]
+    if args.topology:
+        rings = load_topology(args.topology, port)
+    elif args.next_peer_host and args.calculator_host:
+        next_address_ = parse_address(args.next_peer_host, port)
+        calculators = [parse_address(host, port) for host in args.calculator_host.split(',')]
+        members = [parse_address(host, port) for host in args.ring.split(',') if host]
+        rings = [RingConfig(MAIN, members, calculators, next_address= next_address_)]
+    else:
+        parser.error("either next_peer_host and calculator_host or --topology are required")
 
-    log = Logs(hostname)
-    peer_node = PeerNode(hostname= hostname, port= port, next_address= next_address_, host_calculator= calculator_host)
+    log = Logs(hostname, port)
+    peer_node = PeerNode(hostname= hostname, port= port, rings= rings, cache_size= args.cache_size,
+                         policy= make_policy(args.max_items, args.max_hold, args.weight), metrics= Metrics(args.metrics))
+    if not peer_node.rings:
+        parser.error(f"{hostname}:{port} is not a member of any ring of the topology")
 
-    print(f"Server starting at {hostname}:{port}")
-    # generate and put in a queue following a poisson distribution.
-    generate_requests(4, peer_node.queue_)
+    print(f"Server starting at {hostname}:{port} in rings {', '.join(peer_node.rings)}")
+    if args.rate or args.trace:
+        target = trace_rate(args.trace, args.speed) if args.trace else args.rate
+        schedule = make_schedule(args.schedule, args.rate, args.trace, args.speed)
+        generator = generate_load(peer_node.queue_, schedule, target, record= args.record_trace)
+        report_load(peer_node, generator, log.logger)
+    else:
+        # generate and put in a queue following a poisson distribution.
+        generate_requests(4, peer_node.queue_)
+    start_shard_workers(peer_node, log.logger)
+    watch_token(peer_node, log.logger)
     server_run(log.logger, peer_node)
+    report_calculators(peer_node, log.logger)
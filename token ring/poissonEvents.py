@@ -28,6 +28,6 @@ def generate_requests(lmbda, queue: queue.Queue):
 
             request = f"{operation} {arguments['number1']} {arguments['number2']}"
 
-            queue.put(request)  
+            queue.put((time.monotonic(), request))  # enqueue time is used to track queue-wait latency
 
     threading.Thread(target=request_loop, daemon=True).start()
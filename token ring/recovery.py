@@ -0,0 +1,103 @@
+import threading
+import time
+from typing import Optional, Tuple
+import wire
+from topology import MAIN
+
+ELECTION_RETRY = 5  # timeouts after which an election of this peer that never came back is started again
+
+# Watches the token from one peer's point of view to detect its loss.
+# Tokens carry a sequence number that only grows when a new token is minted, so a token older than the
+# newest one seen is stale and dropped. The timeout follows the measured rotation time of the ring.
+# A peer runs one election at a time and the winner records the token it mints before sending it, so an older
+# election message that still comes back is dropped and exactly one new token is minted.
+class TokenMonitor:
+    def __init__(self, peer_id: str, ring: str = MAIN, shard: int = 0, min_timeout: float = 2.0, factor: float = 4.0, alpha: float = 0.2):
+        self.peer_id = peer_id
+        self.ring = ring
+        self.shard = shard  # index of the calculator shard whose token is watched
+        self.min_timeout = min_timeout
+        self.factor = factor
+        self.alpha = alpha
+        self.seq = -1  # newest token sequence number seen
+        self.last_seen: Optional[float] = None
+        self.last_received: Optional[float] = None
+        self.rotation: Optional[float] = None  # moving average of the time between two visits of the token
+        self.last_rotation: Optional[float] = None  # most recent rotation time sample
+        self.holding = False
+        self.participant = False  # taking part in a running election
+        self.election_started: Optional[float] = None
+        self.lock = threading.Lock()
+
+    def timeout(self) -> float:
+        if self.rotation is None:
+            return self.min_timeout
+        return max(self.min_timeout, self.factor * self.rotation)
+
+    # Called when a token arrives, returns False if it is stale and must be dropped.
+    def token_received(self, seq: int) -> bool:
+        with self.lock:
+            if seq < self.seq or (seq == self.seq and self.holding):
+                return False  # stale, or a second token with the number of the one held here
+            now = time.monotonic()
+            self.last_rotation = None
+            if seq == self.seq and self.last_received is not None:
+                sample = now - self.last_received
+                self.rotation = sample if self.rotation is None else (1 - self.alpha) * self.rotation + self.alpha * sample
+                self.last_rotation = sample
+            self.seq = seq
+            self.last_seen = now
+            self.last_received = now
+            self.holding = True
+            self.participant = False
+            self.election_started = None
+            return True
+
+    def token_forwarded(self):
+        with self.lock:
+            self.holding = False
+            self.last_seen = time.monotonic()
+
+    # Returns the election message to send when this peer should start (or restart) an election, None otherwise:
+    # the token was lost once it has not been seen for longer than the timeout. Peers that never saw a token (the
+    # ring was not started yet) never suspect a loss.
+    def start_election(self) -> Optional[wire.RingElect]:
+        with self.lock:
+            if self.holding or self.last_seen is None:
+                return None
+            now = time.monotonic()
+            if now - self.last_seen <= self.timeout():
+                return None
+            if self.participant and now - self.election_started <= ELECTION_RETRY * self.timeout():
+                return None  # an election is still going round
+            self.participant = True
+            self.election_started = now
+            return wire.RingElect(self.ring, self.shard, self.peer_id, self.seq)
+
+    # Chang-Roberts step for an incoming RingElect(ring, shard, candidate, seq) message.
+    # Returns ("forward", message), ("won", new_seq) or ("drop", None).
+    def on_election(self, candidate: str, seq: int) -> Tuple[str, object]:
+        with self.lock:
+            if candidate == self.peer_id and seq < self.seq:
+                return "drop", None  # an election of this peer that was already won
+            seq = max(seq, self.seq)
+            now = time.monotonic()
+            # the token is still alive here, the election was started by mistake
+            if self.holding or (self.last_seen is not None and now - self.last_seen <= self.timeout()):
+                return "drop", None
+            if candidate == self.peer_id:
+                self.participant = False
+                self.election_started = None
+                self.seq = seq + 1
+                self.last_seen = now
+                self.last_received = None  # the next visit starts the rotation samples of the new token
+                return "won", seq + 1
+            if candidate > self.peer_id:
+                self.participant = True
+                self.election_started = self.election_started or now
+                return "forward", wire.RingElect(self.ring, self.shard, candidate, seq)
+            if self.participant:
+                return "drop", None
+            self.participant = True
+            self.election_started = now
+            return "forward", wire.RingElect(self.ring, self.shard, self.peer_id, seq)
@@ -0,0 +1,107 @@
+import threading
+import time
+from collections import deque
+from typing import List, Optional
+
+# Decides how much of its queue a peer may serve while it holds the token.
+# Policies are chosen at startup with make_policy; subclasses only override budget and expired.
+class HoldPolicy:
+    chunk_size: Optional[int] = None  # items sent to the calculator between two checks of the hold time
+
+    # Maximum number of items to serve in this visit, None means no limit.
+    def budget(self) -> Optional[int]:
+        return None
+
+    # True when the peer has held the token for too long and must forward it.
+    def expired(self, started: float) -> bool:
+        return False
+
+    def __str__(self) -> str:
+        return type(self).__name__
+
+
+# Drains the whole queue before forwarding the token (the original behaviour).
+class DrainPolicy(HoldPolicy):
+    pass
+
+
+# Serves at most max_items * weight items per visit.
+class MaxItemsPolicy(HoldPolicy):
+    def __init__(self, max_items: int, weight: float = 1.0):
+        self.max_items = max_items
+        self.weight = weight
+
+    def budget(self) -> Optional[int]:
+        return max(1, int(self.max_items * self.weight))
+
+    def __str__(self) -> str:
+        return f"max_items={self.max_items} weight={self.weight}"
+
+
+# Forwards the token once it has been held for max_hold * weight seconds.
+class MaxHoldTimePolicy(HoldPolicy):
+    chunk_size = 256
+
+    def __init__(self, max_hold: float, weight: float = 1.0):
+        self.max_hold = max_hold
+        self.weight = weight
+
+    def expired(self, started: float) -> bool:
+        return time.monotonic() - started >= self.max_hold * self.weight
+
+    def __str__(self) -> str:
+        return f"max_hold={self.max_hold}s weight={self.weight}"
+
+
+# Applies both an item quota and a hold-time limit, whichever is reached first.
+class CombinedPolicy(HoldPolicy):
+    chunk_size = 256
+
+    def __init__(self, max_items: int, max_hold: float, weight: float = 1.0):
+        self.items = MaxItemsPolicy(max_items, weight)
+        self.time = MaxHoldTimePolicy(max_hold, weight)
+
+    def budget(self) -> Optional[int]:
+        return self.items.budget()
+
+    def expired(self, started: float) -> bool:
+        return self.time.expired(started)
+
+    def __str__(self) -> str:
+        return f"{self.items} max_hold={self.time.max_hold}s"
+
+
+def make_policy(max_items: Optional[int] = None, max_hold: Optional[float] = None, weight: float = 1.0) -> HoldPolicy:
+    if max_items and max_hold:
+        return CombinedPolicy(max_items, max_hold, weight)
+    if max_items:
+        return MaxItemsPolicy(max_items, weight)
+    if max_hold:
+        return MaxHoldTimePolicy(max_hold, weight)
+    return DrainPolicy()
+
+
+# Keeps the most recent queue-wait samples of a peer and reports their percentiles.
+class LatencyTracker:
+    def __init__(self, window: int = 10000):
+        self.samples: deque = deque(maxlen=window)
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def add(self, latencies: List[float]):
+        with self.lock:
+            self.samples.extend(latencies)
+            self.count += len(latencies)
+
+    def percentiles(self, points=(50, 95, 99)) -> dict:
+        with self.lock:
+            ordered = sorted(self.samples)
+        if not ordered:
+            return {}
+        result = {f"p{p}": ordered[min(len(ordered) - 1, len(ordered) * p // 100)] for p in points}
+        result["max"] = ordered[-1]
+        return result
+
+    def __str__(self) -> str:
+        values = ' '.join(f"{key}={value * 1000:.1f}ms" for key, value in self.percentiles().items())
+        return f"count={self.count} {values}".strip()
@@ -0,0 +1,64 @@
+import json
+from typing import Dict, List, Optional, Tuple
+
+MAIN = "main"  # name of the single ring when no topology file is given
+
+'''
+Topology file: the peers are partitioned into rings, so a token only visits the peers of its own ring. Every
+ring has its own calculators and one token per calculator, and every peer belongs to exactly one ring. The rings
+are independent of each other: nothing is relayed between them, and mutual exclusion holds per calculator only.
+Hosts may carry a port ("host:port"), otherwise the default port is used.
+
+{
+    "rings": {
+        "east": {"members": ["m1", "m2", "m3"], "calculators": ["c1"]},
+        "west": {"members": ["m4", "m5", "m6"], "calculators": ["c2", "c3"]}
+    }
+}
+'''
+
+# Parses "host" or "host:port" into an address tuple.
+def parse_address(text: str, default_port: int) -> Tuple[str, int]:
+    host, _, port = text.strip().partition(':')
+    return host, int(port) if port else default_port
+
+# Describes one ring: its members in ring order and the calculators whose tokens circulate on it.
+class RingConfig:
+    def __init__(self, name: str, members: List[Tuple[str, int]], calculators: List[Tuple[str, int]],
+                 next_address: Optional[Tuple[str, int]] = None):
+        self.name = name
+        self.members = members
+        self.calculators = calculators
+        self.next_address = next_address  # explicit successor, used when the members are not known
+
+    def successor(self, address: Tuple[str, int]) -> Tuple[str, int]:
+        if self.next_address is not None:
+            return self.next_address
+        i = self.members.index(address)
+        return self.members[(i + 1) % len(self.members)]
+
+    def includes(self, address: Tuple[str, int]) -> bool:
+        return self.next_address is not None or address in self.members
+
+
+def _ring_config(name: str, spec: Dict, default_port: int) -> RingConfig:
+    members = [parse_address(host, default_port) for host in spec["members"]]
+    calculators = [parse_address(host, default_port) for host in spec["calculators"]]
+    if len(members) < 1 or len(set(members)) != len(members):
+        raise ValueError(f"ring {name} needs distinct members")
+    if not calculators:
+        raise ValueError(f"ring {name} needs at least one calculator")
+    return RingConfig(name, members, calculators)
+
+# Loads a topology file and checks that the rings do not share peers.
+def load_topology(path: str, default_port: int) -> List[RingConfig]:
+    with open(path) as f:
+        spec = json.load(f)
+
+    rings = [_ring_config(name, ring, default_port) for name, ring in spec["rings"].items()]
+    if not rings:
+        raise ValueError("the topology needs at least one ring")
+    members = [member for ring in rings for member in ring.members]
+    if len(members) != len(set(members)):
+        raise ValueError("a peer can only belong to one ring")
+    return rings
@@ -0,0 +1,677 @@
+import socket
+import struct
+from collections import namedtuple
+from operator import itemgetter
+from typing import List, Optional, Tuple
+
+'''
+Compact binary wire format shared by the token ring, gossip (p2p) and totally ordered multicast (TOM) peers.
+
+On a stream every message is a frame: a 4-byte length (network order) followed by the message. A UDP datagram
+carries one message without the length. A message starts with its fixed part, packed with a single struct: a
+1-byte type code, then in declaration order the value of every number field, the count of every list or map, the
+length of every bytes field and a flag for every optional string that is None. The binary data of the variable
+fields follows, then the text: all strings of the message, UTF-8 and separated by NUL, so no string may contain NUL
+(encode() refuses them and decode() checks the number of strings). The field kinds are
+    str          a string in the text ('str?' may also be None)
+    ['str']      a list of strings, its items in the text (in the binary data if the message has no plain string)
+    bytes        the raw bytes, decoded as a memoryview into the received buffer (no copy)
+    [kind]       a list in columns, e.g. ['u64'] or [('str', 'u64')] for a list of pairs
+    {key: value} the keys column and the values column, decoded as a dict
+A column of numbers is packed and unpacked with one struct call, a column of strings is one NUL-separated UTF-8
+string preceded by its 4-byte size, a column of lists is a column of lengths and the flattened values, and a
+column of tuples is one column per tuple element. A map of 1000 peers thus decodes with two calls instead of
+thousands of objects' worth of unpickling, and nothing on the network is executed on load as with pickle.
+
+Message types are namedtuples created with message(), which also builds the encoder, the framer and the decoder
+of the type from the table of its fields: closures over the precompiled structs of its fixed part and the codecs
+of its columns, nothing compiled from source. An ack is one struct call and one string, in about the time pickle
+takes for the same tuple (python3 benchmark.py wire compares them). Every type has a code that is unique across
+the protocols so a receiver can always tell what it got, and anything unexpected (an unknown code, a count that
+does not match, bytes left over) fails to decode instead of being misread.
+'''
+
+HEADER = struct.Struct('!I')  # length prefix of every frame on a stream
+COUNT = struct.Struct('!I')
+MAX_FRAME = 64 * 1024 * 1024  # larger frames are treated as a corrupt stream
+MAX_COLUMN_STRUCTS = 256  # precompiled structs kept per kind of number column, by count
+SCALARS = {'u8': 'B', 'u16': 'H', 'u32': 'I', 'u64': 'Q', 'i32': 'i', 'i64': 'q', 'f64': 'd'}
+
+
+
+def _unknown(buffer):
+    raise ValueError(f"unknown message type {buffer[0]}")
+
+
+DECODERS = [_unknown] * 256  # by message code
+
+
+# Encoder and decoder of a column of values of one kind: encode(values) returns the encoded column,
+# decode(buffer, offset, count) returns the count values and the offset past them.
+def _column_codec(kind):
+    if isinstance(kind, str) and kind in SCALARS:
+        code = SCALARS[kind]
+        size = struct.calcsize(code)
+        structs = {}  # the struct of a column of each count seen, up to MAX_COLUMN_STRUCTS of them
+
+        def column(count):
+            layout = structs.get(count)
+            if layout is None:
+                layout = struct.Struct(f'!{count}{code}')
+                if len(structs) < MAX_COLUMN_STRUCTS:
+                    structs[count] = layout
+            return layout
+
+        def encode(values):
+            return (structs.get(len(values)) or column(len(values))).pack(*values)
+
+        def decode(buffer, offset, count):
+            return list((structs.get(count) or column(count)).unpack_from(buffer, offset)), offset + count * size
+    elif kind == 'str':
+        def encode(values):
+            text = '\0'.join(values)
+            if text.count('\0') != max(0, len(values) - 1):
+                raise ValueError("strings in a list or map may not contain NUL")
+            data = text.encode()
+            return COUNT.pack(len(data)) + data
+
+        def decode(buffer, offset, count):
+            (size,) = COUNT.unpack_from(buffer, offset)
+            offset += COUNT.size
+            if not count:
+                if size:
+                    raise ValueError("data in an empty string column")
+                return [], offset
+            values = buffer[offset:offset + size].tobytes().decode().split('\0')
+            if len(values) != count:
+                raise ValueError(f"{len(values)} strings where {count} were expected")
+            return values, offset + size
+    elif isinstance(kind, list):
+        encode_lengths, decode_lengths = _column_codec('u32')
+        encode_items, decode_items = _column_codec(kind[0])
+
+        def encode(values):
+            return encode_lengths([len(value) for value in values]) + \
+                encode_items([item for value in values for item in value])
+
+        def decode(buffer, offset, count):
+            lengths, offset = decode_lengths(buffer, offset, count)
+            items, offset = decode_items(buffer, offset, sum(lengths))
+            values, start = [], 0
+            for length in lengths:
+                values.append(items[start:start + length])
+                start += length
+            return values, offset
+    elif isinstance(kind, tuple):
+        encoders, decoders = zip(*(_column_codec(element) for element in kind))
+        empty = [()] * len(kind)
+
+        def encode(values):
+            return b''.join([encode_element(column) for encode_element, column
+                             in zip(encoders, zip(*values) if values else empty)])
+
+        def decode(buffer, offset, count):
+            columns = []
+            for decode_element in decoders:
+                column, offset = decode_element(buffer, offset, count)
+                columns.append(column)
+            return list(zip(*columns)), offset
+    else:
+        raise TypeError(f"unsupported column kind {kind!r}")
+    return encode, decode
+
+
+# The fields of a message sent in its text part: the strings, and the lists of strings when there is at least one
+# string (otherwise an empty text could not tell an empty list from a list of one empty string).
+def _text_fields(kinds: list) -> List[int]:
+    if not any(kind in ('str', 'str?') for kind in kinds):
+        return []
+    return [i for i, kind in enumerate(kinds) if kind in ('str', 'str?', ['str'])]
+
+
+VALUE, LENGTH, NBYTES, IS_NONE = range(4)  # how a slot of the fixed part is taken from its field
+
+
+# Layout of a field in the fixed part of a message, and how its slot there is taken from the field (None when
+# it has no slot).
+def _fixed(kind) -> Tuple[str, Optional[int]]:
+    if isinstance(kind, str) and kind in SCALARS:
+        return SCALARS[kind], VALUE
+    if kind == 'str':
+        return '', None  # only in the text
+    if kind == 'str?':
+        return '?', IS_NONE  # whether it is None
+    if kind == 'bytes':
+        return 'I', NBYTES  # length in bytes
+    if isinstance(kind, (list, dict)):
+        return 'I', LENGTH
+    raise TypeError(f"unsupported field kind {kind!r}")
+
+
+# Encoder and decoder of a field in the binary data. encode(value) returns the encoded data, decode(buffer,
+# offset, count) the value and the offset past it, count being the field's slot in the fixed part.
+def _binary_codec(kind):
+    if kind == 'bytes':
+        def decode(buffer, offset, size):
+            return buffer[offset:offset + size], offset + size
+        return bytes, decode
+    if isinstance(kind, dict):
+        ((key_kind, value_kind),) = kind.items()
+        encode_keys, decode_keys = _column_codec(key_kind)
+        encode_values, decode_values = _column_codec(value_kind)
+
+        def encode(value):
+            return encode_keys(list(value)) + encode_values(list(value.values()))
+
+        def decode(buffer, offset, count):
+            keys, offset = decode_keys(buffer, offset, count)
+            values, offset = decode_values(buffer, offset, count)
+            return dict(zip(keys, values)), offset
+        return encode, decode
+    return _column_codec(kind[0])
+
+
+# Encoder and decoder of the text part of a message with several strings or lists of strings. encode(msg)
+# returns the encoded text, decode(text, fixed) the tuple of the values of the text fields in field order, given
+# the decoded text and the unpacked fixed part (for the counts of the lists and the None flags).
+def _text_codec(kinds: list, slot_of: dict):
+    fields = _text_fields(kinds)
+    lists = [i for i in fields if kinds[i] == ['str']]
+    strings = [i for i in fields if kinds[i] != ['str']]
+    # the strings follow the items of a single list, so the list is what remains of the split text once the
+    # strings are taken from its end; several lists are sent in field order with the strings
+    order = lists + strings if len(lists) == 1 else fields
+    counts = [slot_of[i] if i in lists else None for i in order]
+    optional = [(position, slot_of[i]) for position, i in enumerate(order) if kinds[i] == 'str?']
+    to_fields = _items([order.index(i) for i in fields])
+
+    def encode(msg):
+        pieces = []
+        for i, count in zip(order, counts):
+            if count is None:
+                pieces.append(msg[i] or '')
+            else:
+                pieces += msg[i]
+        text = '\0'.join(pieces)
+        if text.count('\0') != len(pieces) - 1:
+            raise ValueError("strings may not contain NUL")
+        return text.encode()
+
+    def decode(text, fixed):
+        parts = text.split('\0')
+        expected = len(strings) + sum(fixed[slot_of[i]] for i in lists)
+        if len(parts) != expected:
+            raise ValueError(f"{len(parts)} strings where {expected} were expected")
+        values, start = [], 0
+        for count in counts:
+            if count is None:
+                values.append(parts[start])
+                start += 1
+            else:
+                values.append(parts[start:start + fixed[count]])
+                start += fixed[count]
+        for position, slot in optional:
+            if fixed[slot]:
+                values[position] = None
+        return tuple(to_fields(values))
+    return encode, decode
+
+
+# A function returning the items at the given indices of a sequence, with a single slice when they are
+# consecutive.
+def _items(indices: List[int]):
+    start = indices[0] if indices else 0
+    if indices == list(range(start, start + len(indices))):
+        return itemgetter(slice(start, start + len(indices)))
+    if len(indices) == 1:
+        (index,) = indices
+        return lambda values: (values[index],)
+    return itemgetter(*indices)
+
+
+# Puts together the encoder, the framer (the message with its length prefix) and the decoder of a message type
+# from the table of its fields: the layout of the fixed part, the codecs of the binary fields and of the text.
+# The decoder unpacks the fixed part, appends the binary and text values and picks the fields from that row with
+# one itemgetter. The common shapes, numbers only, numbers and one string (acks, tokens), numbers, strings and
+# one list of strings (TOM data) and numbers, one string and one column (orders, gossip, SWIM), get their own
+# shorter functions.
+def _message_codec(cls, code: int, kinds: list):
+    text_fields = _text_fields(kinds)
+    slots, layout, slot_of = [], '', {}  # (field, how its slot is filled), in the order of the fixed part
+    for i, kind in enumerate(kinds):
+        code_char, how = _fixed(kind)
+        if how is not None:
+            slot_of[i] = len(slots) + 1  # the type code comes first
+            slots.append((i, how))
+            layout += code_char
+    fixed_struct, framed_struct = struct.Struct('!B' + layout), struct.Struct('!IB' + layout)
+    pack, pack_framed, unpack, size = fixed_struct.pack, framed_struct.pack, fixed_struct.unpack_from, fixed_struct.size
+    # (field, slot, encode, decode) of the fields in the binary data
+    binary = [(i, slot_of[i]) + _binary_codec(kinds[i])
+              for i, how in slots if how in (LENGTH, NBYTES) and i not in text_fields]
+    numbers = [i for i, how in slots if how == VALUE]
+    get_numbers = _items(numbers)
+    new = tuple.__new__
+
+    def too_long(buffer, end):
+        return ValueError(f"{len(buffer) - end} bytes past the end of a {cls.__name__}")
+
+    if not binary and not text_fields:
+        pick = _items([slot_of[i] for i in range(len(kinds))])
+
+        def encode(msg):
+            return pack(code, *get_numbers(msg))
+
+        def frame(msg):
+            return pack_framed(size, code, *get_numbers(msg))
+
+        def decode(buffer):
+            if len(buffer) != size:
+                raise too_long(buffer, size)
+            return new(cls, pick(unpack(buffer)))
+        return encode, frame, decode
+
+    # the numbers after the type code, for messages whose fields are a string followed by numbers
+    unpack_numbers = struct.Struct('!x' + layout).unpack_from
+    string_first = numbers == list(range(1, len(kinds)))
+
+    if not binary and len(text_fields) == 1 and kinds[text_fields[0]] == 'str':
+        (field,) = text_fields
+        pick = _items([slot_of.get(i, len(slots) + 1) for i in range(len(kinds))])
+
+        def encode(msg):
+            text = msg[field]
+            if '\0' in text:
+                raise ValueError("strings may not contain NUL")
+            return pack(code, *get_numbers(msg)) + text.encode()
+
+        # one or two numbers are passed to pack directly, which is faster than unpacking them from a tuple
+        if len(numbers) == 1:
+            (number,) = numbers
+
+            def frame(msg):
+                text = msg[field]
+                if '\0' in text:
+                    raise ValueError("strings may not contain NUL")
+                data = text.encode()
+                return pack_framed(size + len(data), code, msg[number]) + data
+        elif len(numbers) == 2:
+            first, second = numbers
+
+            def frame(msg):
+                text = msg[field]
+                if '\0' in text:
+                    raise ValueError("strings may not contain NUL")
+                data = text.encode()
+                return pack_framed(size + len(data), code, msg[first], msg[second]) + data
+        else:
+            def frame(msg):
+                text = msg[field]
+                if '\0' in text:
+                    raise ValueError("strings may not contain NUL")
+                data = text.encode()
+                return pack_framed(size + len(data), code, *get_numbers(msg)) + data
+
+        if string_first:
+            def decode(buffer):
+                text = buffer[size:].tobytes().decode()
+                if '\0' in text:
+                    raise ValueError("NUL in a string")
+                return new(cls, (text,) + unpack_numbers(buffer))
+        else:
+            def decode(buffer):
+                text = buffer[size:].tobytes().decode()
+                if '\0' in text:
+                    raise ValueError("NUL in a string")
+                return new(cls, pick(unpack(buffer) + (text,)))
+        return encode, frame, decode
+
+    lists = [i for i in text_fields if kinds[i] == ['str']]
+    strings = [i for i in text_fields if kinds[i] == 'str']
+    if not binary and len(lists) == 1 and len(strings) == len(text_fields) - 1 and slots[-1][0] == lists[0]:
+        # the items of the list, then the strings; the count of the list is the last slot
+        (field,) = lists
+        extra = len(strings)
+        get_strings = _items(strings)
+        row = {i: slot_of[i] for i in numbers}
+        row[field] = len(slots) + 1
+        row.update({i: len(slots) + 2 + n for n, i in enumerate(strings)})
+        pick = _items([row[i] for i in range(len(kinds))])
+
+        def encode(msg):
+            items = msg[field]
+            text = '\0'.join([*items, *get_strings(msg)])
+            if text.count('\0') != len(items) + extra - 1:
+                raise ValueError("strings may not contain NUL")
+            return pack(code, *get_numbers(msg), len(items)) + text.encode()
+
+        if [*strings, *numbers, field] == [0, 1, 2]:
+            # string, number, list (TomData): the message unpacks into its fields in one step
+            def frame(msg):
+                string, number, items = msg
+                text = '\0'.join([*items, string])
+                if text.count('\0') != len(items):
+                    raise ValueError("strings may not contain NUL")
+                text = text.encode()
+                return pack_framed(size + len(text), code, number, len(items)) + text
+
+            def decode(buffer):
+                _, number, count = unpack(buffer)
+                parts = buffer[size:].tobytes().decode().split('\0')
+                if len(parts) != count + 1:
+                    raise ValueError(f"{len(parts)} strings where {count + 1} were expected")
+                return new(cls, (parts.pop(), number, parts))
+        else:
+            def frame(msg):
+                items = msg[field]
+                text = '\0'.join([*items, *get_strings(msg)])
+                if text.count('\0') != len(items) + extra - 1:
+                    raise ValueError("strings may not contain NUL")
+                text = text.encode()
+                return pack_framed(size + len(text), code, *get_numbers(msg), len(items)) + text
+
+            def decode(buffer):
+                fixed = unpack(buffer)
+                parts = buffer[size:].tobytes().decode().split('\0')
+                count = fixed[-1]
+                if len(parts) != count + extra:
+                    raise ValueError(f"{len(parts)} strings where {count + extra} were expected")
+                strings_ = parts[count:]
+                del parts[count:]
+                return new(cls, pick((*fixed, parts, *strings_)))
+        return encode, frame, decode
+
+    if (len(binary) == 1 and len(text_fields) == 1 and kinds[text_fields[0]] == 'str'
+            and slots[-1][0] == binary[0][0] and len(numbers) == len(slots) - 1):
+        # one string, numbers and one column of numbers or tuples (orders, gossip maps), counted by the last slot
+        ((field, _, encode_field, decode_field),), (string,) = binary, text_fields
+        row = {i: slot_of[i] for i in numbers}
+        row[field], row[string] = len(slots) + 1, len(slots) + 2
+        pick = _items([row[i] for i in range(len(kinds))])
+
+        def data(msg):
+            text = msg[string]
+            if '\0' in text:
+                raise ValueError("strings may not contain NUL")
+            return text.encode()
+
+        def encode(msg):
+            value = msg[field]
+            return pack(code, *get_numbers(msg), len(value)) + encode_field(value) + data(msg)
+
+        if [string, *numbers, field] == [0, 1, 2]:
+            # string, number, column (TomOrder): the message unpacks into its fields in one step
+            def frame(msg):
+                text, number, value = msg
+                if '\0' in text:
+                    raise ValueError("strings may not contain NUL")
+                column, text = encode_field(value), text.encode()
+                return pack_framed(size + len(column) + len(text), code, number, len(value)) + column + text
+        else:
+            def frame(msg):
+                value, text = msg[field], msg[string]
+                if '\0' in text:
+                    raise ValueError("strings may not contain NUL")
+                column, text = encode_field(value), text.encode()
+                return pack_framed(size + len(column) + len(text), code, *get_numbers(msg), len(value)) + column + text
+
+        def decode(buffer):
+            fixed = unpack(buffer)
+            value, offset = decode_field(buffer, size, fixed[-1])
+            text = buffer[offset:].tobytes().decode()
+            if '\0' in text:
+                raise ValueError("NUL in a string")
+            return new(cls, pick(fixed + (value, text)))
+        return encode, frame, decode
+
+    if not text_fields and not numbers and len(binary) == len(kinds):
+        # columns only (calculator requests and replies): the fixed part is the count of every column
+        columns = [(encode_field, decode_field) for _, _, encode_field, decode_field in binary]
+
+        def data(msg):
+            tail = b''
+            for (encode_field, _), value in zip(columns, msg):
+                tail += encode_field(value)
+            return tail
+
+        def encode(msg):
+            return pack(code, *map(len, msg)) + data(msg)
+
+        def frame(msg):
+            tail = b''
+            for (encode_field, _), value in zip(columns, msg):
+                tail += encode_field(value)
+            return pack_framed(size + len(tail), code, *map(len, msg)) + tail
+
+        def decode(buffer):
+            fields, offset = [], size
+            for (_, decode_field), count in zip(columns, unpack(buffer)[1:]):
+                value, offset = decode_field(buffer, offset, count)
+                fields.append(value)
+            if offset != len(buffer):
+                raise too_long(buffer, offset)
+            return new(cls, fields)
+        return encode, frame, decode
+
+    # anything else: the values of the fixed part are the fields in slot order with the lengths and None
+    # flags put in, then come the binary fields in field order and the text
+    text_field = text_fields[0] if len(text_fields) == 1 and kinds[text_fields[0]] == 'str' else None
+    encode_text, decode_text = _text_codec(kinds, slot_of) if text_fields and text_field is None else (None, None)
+    row = dict(slot_of)
+    row.update({i: 1 + len(slots) + n for n, (i, *_) in enumerate(binary)})
+    row.update({i: 1 + len(slots) + len(binary) + n for n, i in enumerate(text_fields)})
+    pick = _items([row[i] for i in range(len(kinds))])
+
+    hows = [how for _, how in slots]
+    if set(hows) <= {VALUE, LENGTH} and hows == sorted(hows):
+        # the numbers come first and then the counts, as in most messages
+        get_lengths = _items([i for i, how in slots if how == LENGTH])
+
+        def values(msg):
+            return (*get_numbers(msg), *map(len, get_lengths(msg)))
+    else:
+        get_slots = _items([i for i, _ in slots])
+        fixes = [(position, how) for position, how in enumerate(hows) if how != VALUE]
+
+        def values(msg):
+            args = list(get_slots(msg))
+            for position, how in fixes:
+                value = args[position]
+                if how == LENGTH:
+                    args[position] = len(value)
+                else:
+                    args[position] = value is None if how == IS_NONE else memoryview(value).nbytes
+            return args
+
+    def data(msg):
+        blobs = [encode_field(msg[i]) for i, _, encode_field, _ in binary]
+        if text_field is not None:
+            text = msg[text_field]
+            if '\0' in text:
+                raise ValueError("strings may not contain NUL")
+            blobs.append(text.encode())
+        elif encode_text is not None:
+            blobs.append(encode_text(msg))
+        return b''.join(blobs)
+
+    def encode(msg):
+        return pack(code, *values(msg)) + data(msg)
+
+    def frame(msg):
+        tail = data(msg)
+        return pack_framed(size + len(tail), code, *values(msg)) + tail
+
+    def decode(buffer):
+        fields = unpack(buffer)
+        offset = size
+        for _, slot, _, decode_field in binary:
+            value, offset = decode_field(buffer, offset, fields[slot])
+            fields += (value,)
+        if text_field is not None:
+            text = buffer[offset:].tobytes().decode()
+            if '\0' in text:
+                raise ValueError("NUL in a string")
+            fields += (text,)
+        elif decode_text is not None:
+            fields += decode_text(buffer[offset:].tobytes().decode(), fields)
+        elif offset != len(buffer):
+            raise too_long(buffer, offset)
+        return new(cls, pick(fields))
+    return encode, frame, decode
+
+
+# Defines a message type: message(1, 'Token', ring='str', shard='u16', seq='u64') is a namedtuple with those
+# fields that encode() and decode() know by its code.
+def message(code: int, name: str, **fields) -> type:
+    if not 0 < code < 256 or DECODERS[code] is not _unknown:
+        raise ValueError(f"message code {code} of {name} is taken or out of range")
+    cls = namedtuple(name, fields)
+    cls.CODE = code
+    cls._encode, cls._frame, DECODERS[code] = _message_codec(cls, code, list(fields.values()))
+    return cls
+
+
+def encode(msg) -> bytes:
+    return msg._encode()
+
+
+# Decodes one message from a buffer (bytes, bytearray or memoryview). Fields of kind bytes are views into the
+# buffer and only valid as long as it is.
+def decode(buffer):
+    if type(buffer) is not memoryview:
+        buffer = memoryview(buffer)
+    return DECODERS[buffer[0]](buffer)
+
+
+# The message as a length-prefixed frame.
+def frame(msg) -> bytes:
+    return msg._frame()
+
+
+def send(sock: socket.socket, msg):
+    sock.sendall(frame(msg))
+
+
+# Sends several messages with a single system call.
+def send_all(sock: socket.socket, msgs: List):
+    sock.sendall(b''.join(frame(msg) for msg in msgs))
+
+
+# Reads the frames of one stream into a reusable buffer with recv_into. A frame is returned as a memoryview
+# into the buffer, valid until the next read; several frames that arrived together are returned one after the
+# other without further system calls. A timeout leaves the reader intact, the read can simply be retried.
+class FrameReader:
+    def __init__(self, sock: socket.socket, size: int = 65536):
+        self.sock = sock
+        self.buffer = bytearray(size)
+        self.start = 0  # first byte not returned yet
+        self.end = 0  # end of the received bytes
+
+    # The next frame, None when the other side closed the connection between frames.
+    def read_frame(self) -> Optional[memoryview]:
+        while True:
+            available = self.end - self.start
+            if available >= HEADER.size:
+                (length,) = HEADER.unpack_from(self.buffer, self.start)
+                if length > MAX_FRAME:
+                    raise ValueError(f"frame of {length} bytes")
+                if available >= HEADER.size + length:
+                    first = self.start + HEADER.size
+                    self.start = first + length
+                    return memoryview(self.buffer)[first:first + length]
+                needed = HEADER.size + length
+            else:
+                needed = HEADER.size
+            if needed > len(self.buffer) - self.start:
+                self._make_room(needed)
+            with memoryview(self.buffer) as view:
+                received = self.sock.recv_into(view[self.end:])
+            if received == 0:
+                if self.end > self.start:
+                    raise ConnectionError("connection closed in the middle of a frame")
+                return None
+            self.end += received
+
+    # Moves the unread bytes to the front of the buffer, or to a larger buffer when the frame does not fit.
+    # Frames returned earlier may still be referenced, so the buffer is replaced rather than resized.
+    def _make_room(self, needed: int):
+        pending = self.buffer[self.start:self.end]
+        if needed > len(self.buffer):
+            self.buffer = bytearray(max(needed, 2 * len(self.buffer)))
+        self.buffer[:len(pending)] = pending
+        self.start, self.end = 0, len(pending)
+
+    # The next message, None when the connection was closed.
+    def read(self):
+        data = self.read_frame()
+        return None if data is None else decode(data)
+
+
+def recv_exact(sock: socket.socket, size: int) -> bytearray:
+    data = bytearray(size)
+    with memoryview(data) as view:
+        received = 0
+        while received < size:
+            n = sock.recv_into(view[received:])
+            if n == 0:
+                raise ConnectionError("connection closed")
+            received += n
+    return data
+
+
+# Reads one message from a socket and nothing past it, for request/response exchanges on short-lived
+# connections (a reply may be followed by raw data, as in the TOM catch-up).
+def recv(sock: socket.socket):
+    (length,) = HEADER.unpack(recv_exact(sock, HEADER.size))
+    if length > MAX_FRAME:
+        raise ValueError(f"frame of {length} bytes")
+    return decode(recv_exact(sock, length))
+
+
+# Token ring (token ring/peer_token.py, recovery.py, inject.py).
+RingToken = message(1, 'RingToken', ring='str', shard='u16', seq='u64')
+RingElect = message(2, 'RingElect', ring='str', shard='u16', candidate='str', seq='u64')
+RingShut = message(3, 'RingShut')
+
+# Calculator (token ring/channel.py, multiCalculator.py). Operations are codes into CALC_OPS; 0 is a malformed
+# request and CALC_UNSUPPORTED an operation the calculator does not know.
+CALC_OPS = ['add', 'sub', 'mul', 'div']
+CALC_UNSUPPORTED = 255
+CalcRequest = message(4, 'CalcRequest', ops=['u8'], xs=['i32'], ys=['i32'])
+CalcReply = message(5, 'CalcReply', valid=['u8'], values=['i64'])
+CalcStats = message(6, 'CalcStats')
+CalcStatsReply = message(7, 'CalcStatsReply', text='str')
+
+# Anti-entropy gossip (p2p/peer.py). Maps are {peer: timestamp}; an epoch of 0 means not known yet.
+GossipPull = message(20, 'GossipPull', sender='str', round='u32', part='u16', parts='u16', since='u64',
+                     known_epoch='f64', entries={'str': 'f64'})
+GossipPush = message(21, 'GossipPush', sender='str', round='u32', part='u16', parts='u16', epoch='f64',
+                     version='u64', entries={'str': 'f64'})
+GossipBulk = message(22, 'GossipBulk', sender='str', round='u32')
+DigestRoot = message(23, 'DigestRoot', sender='str', root='bytes')
+DigestSame = message(24, 'DigestSame')
+DigestBuckets = message(25, 'DigestBuckets', sender='str', offset='u16', span='u16', buckets=['u16'], hashes=['u64'])
+DigestSync = message(26, 'DigestSync', sender='str', buckets=['u16'], entries={'str': 'f64'})
+DigestEntries = message(27, 'DigestEntries', sender='str', entries={'str': 'f64'})
+
+# SWIM failure detector (p2p/swim.py), updates are (member, status, incarnation).
+SwimPing = message(30, 'SwimPing', sender='str', updates=[('str', 'str', 'u64')])
+SwimPingReq = message(31, 'SwimPingReq', sender='str', target='str', updates=[('str', 'str', 'u64')])
+SwimAck = message(32, 'SwimAck', sender='str', updates=[('str', 'str', 'u64')])
+SwimNack = message(33, 'SwimNack', sender='str', updates=[('str', 'str', 'u64')])
+
+# Totally ordered multicast (TOM/peer.py). Every message carries the id of the peer that sent it.
+TomData = message(40, 'TomData', sender='str', clock='u64', words=['str'])
+TomAck = message(41, 'TomAck', sender='str', clock='u64')
+TomReady = message(42, 'TomReady', sender='str', clock='u64')  # clock: first clock of a rejoining peer, else 0
+TomShutdown = message(43, 'TomShutdown', sender='str', clock='u64')
+TomOrder = message(44, 'TomOrder', sender='str', first='u64', keys=[('str', 'u64')])
+TomToken = message(45, 'TomToken', sender='str', holder='str', next_seq='u64')
+TomNack = message(46, 'TomNack', sender='str', first='u64', sync='u8')
+TomRepair = message(47, 'TomRepair', sender='str', next_seq='u64', sync='u8', entries=[('u64', 'str', 'u64', ['str'])])
+TomCredit = message(48, 'TomCredit', sender='str', delivered='u64')
+TomCatchup = message(49, 'TomCatchup', sender='str', start='u64', until='u64')
+TomCatchupReply = message(50, 'TomCatchupReply', end='u64', holder='str?', token_seq='u64', next_seq='u64', size='u64')
+TomRecord = message(51, 'TomRecord', clock='u64', sender='str', words=['str'])  # a delivery log record
+TomHello = message(52, 'TomHello', sender='str', link='u64', first='u64')  # opens every connection of a link
+TomWelcome = message(53, 'TomWelcome', sender='str', clock='u64')  # a peer took a rejoining one back at clock